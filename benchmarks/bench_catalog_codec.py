@@ -0,0 +1,80 @@
+"""Compares the dataclasses_json/marshmallow path with the precompiled catalog codec.
+
+Usage: python benchmarks/bench_catalog_codec.py [--recordings 100] [--attachments 10] [--repeat 20]
+"""
+import argparse
+import pathlib
+import timeit
+import uuid
+
+from tapearchive.models.catalog import AttachmentType, AudioAttachment, CatalogEntry, ChannelMode, RecordingEntry
+from tapearchive.models.codec import get_codec
+
+
+def create_catalog_entry(recording_count: int, attachment_count: int) -> CatalogEntry:
+    def attachments():
+        return [
+            AudioAttachment(
+                id=uuid.uuid4(),
+                name=f"{uuid.uuid4()}.wav",
+                type=AttachmentType.AUDIO_FILE,
+                path=pathlib.Path("A1") / f"{uuid.uuid4()}.wav",
+                meta={"source_file": "/staging/file.wav"},
+                format="wav",
+            )
+            for _ in range(attachment_count)
+        ]
+
+    return CatalogEntry(
+        id=uuid.uuid4(),
+        name="A1",
+        recordings=[
+            RecordingEntry(
+                id=uuid.uuid4(),
+                name=f"A1_side_{i}_channel_stereo",
+                source_channel_mode=ChannelMode.STEREO,
+                description=f"Tape A1 side {i}",
+                audio_files=attachments(),
+                audio_sources=attachments(),
+                meta={"comment": "", "side": str(i)},
+            )
+            for i in range(recording_count)
+        ],
+        groups=[],
+        attachments=[],
+        description="Tape A1",
+        meta={},
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Catalog serialization benchmark")
+    parser.add_argument("--recordings", type=int, default=100)
+    parser.add_argument("--attachments", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    entry = create_catalog_entry(args.recordings, args.attachments)
+    codec = get_codec(CatalogEntry)
+
+    encoded = codec.encode(entry)
+    dumped = CatalogEntry.schema().dump(entry)
+    as_dict = entry.to_dict()
+
+    cases = {
+        "schema().dump": lambda: CatalogEntry.schema().dump(entry),
+        "to_dict": lambda: entry.to_dict(),
+        "codec.encode": lambda: codec.encode(entry),
+        "schema().load": lambda: CatalogEntry.schema().load(dumped),
+        "from_dict": lambda: CatalogEntry.from_dict(as_dict),
+        "codec.decode": lambda: codec.decode(encoded),
+    }
+
+    print(f"Catalog with {args.recordings} recordings x {args.attachments} attachments (x2 lists), best of {args.repeat}")
+    for name, case in cases.items():
+        best = min(timeit.repeat(case, number=1, repeat=args.repeat))
+        print(f"  {name:<16} {best * 1000:8.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+"""Cost of a duplicates query on an archive sized landmark index.
+
+The archive is synthetic: `--sides` tape sides of `--minutes` with `--landmarks-per-minute`, hashes drawn from a Zipf
+like distribution over the 23 bit hash space (`--skew`), as landmarks of music are far from uniform. The query is the
+first `--query-seconds` of a side which has a copy in the archive.
+
+Without `--mongo-url` the posting documents a query reads are built in memory and the in-process work is timed:
+decoding them and voting. Reading the documents from Mongo comes on top. With `--mongo-url` the index is written into
+the given database (dropped first) and the whole lookup through FingerprintDao is timed.
+
+Usage: python benchmarks/bench_fingerprint_index.py [--sides 300] [--query-seconds 30] [--mongo-url mongodb://...]
+"""
+import argparse
+import time
+from uuid import UUID, uuid4
+
+import numpy as np
+
+from tapearchive.analysis.fingerprint import vote
+from tapearchive.models.fingerprint import MAX_HASH_POSTINGS, decode_postings
+
+HASH_COUNT = 1 << 23
+FRAMES_PER_MINUTE = 60 * 22050 / 512
+
+
+def hash_distribution(skew: float, rng: np.random.Generator) -> np.ndarray:
+    weights = 1.0 / np.arange(1, HASH_COUNT + 1) ** skew
+    return rng.permutation(weights / weights.sum())
+
+
+class SyntheticArchive:
+    def __init__(self, sides: int, minutes: float, landmarks_per_minute: int, skew: float, seed: int = 0):
+        self.rng = np.random.default_rng(seed)
+        self.sides = [uuid4() for _ in range(sides)]
+        self.side_frames = int(minutes * FRAMES_PER_MINUTE)
+        self.landmarks_per_minute = landmarks_per_minute
+        self.landmarks_per_side = int(minutes * landmarks_per_minute)
+        self.probabilities = hash_distribution(skew, self.rng)
+        # Landmarks per hash in the whole archive
+        self.counts = self.rng.multinomial(sides * self.landmarks_per_side, self.probabilities)
+
+    def query(self, seconds: float):
+        """Landmarks of the start of a side, and the posting documents of its hashes. The side and a copy of it at an
+        offset of 1000 frames are in the archive.
+        """
+        count = int(self.landmarks_per_minute * seconds / 60)
+        hashes = self.rng.choice(HASH_COUNT, count, p=self.probabilities)
+        frames = np.sort(self.rng.integers(0, int(seconds * FRAMES_PER_MINUTE / 60), count))
+        original, copy = self.sides[0], self.sides[1]
+
+        documents = {}
+        for h in np.unique(hashes):
+            total = int(self.counts[h])
+            if total > MAX_HASH_POSTINGS:
+                continue  # stopped
+            own_frames = frames[hashes == h]
+            others = self.rng.integers(2, len(self.sides), max(0, total - 2 * len(own_frames)))
+            postings = [
+                {"r": original.bytes, "t": own_frames.astype("<u4").tobytes()},
+                {"r": copy.bytes, "t": (own_frames + 1000).astype("<u4").tobytes()},
+            ]
+            for side in np.unique(others):
+                side_frames = self.rng.integers(0, self.side_frames, np.count_nonzero(others == side))
+                postings.append({"r": self.sides[side].bytes, "t": np.sort(side_frames).astype("<u4").tobytes()})
+            documents[int(h)] = {"_id": int(h), "n": total, "p": postings}
+        return hashes, frames, documents
+
+    def unindexed_landmarks(self, hashes: np.ndarray) -> int:
+        """Landmarks a query of `hashes` reads from an index of a document per landmark"""
+        return int(self.counts[np.unique(hashes)].sum())
+
+
+def time_in_process(archive: SyntheticArchive, seconds: float, repeat: int):
+    hashes, frames, documents = archive.query(seconds)
+    postings = sum(len(document["p"]) for document in documents.values())
+    payload = sum(len(posting["t"]) + 16 for document in documents.values() for posting in document["p"])
+
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        found_hashes, found_frames, candidates, recordings = decode_postings(documents.values(), exclude=archive.sides[0])
+        votes = vote(hashes, frames, found_hashes, found_frames, candidates, limit=10)
+        best = min(best, time.perf_counter() - start)
+
+    assert votes and recordings[votes[0].candidate] == archive.sides[1] and votes[0].offset_frames == 1000
+    print(
+        f"  {seconds:6.0f} s query: {len(hashes)} landmarks, {len(np.unique(hashes))} hashes, "
+        f"{len(documents)} documents, {postings} postings, {len(found_hashes)} landmarks found, "
+        f"{payload / 2 ** 20:.1f} MiB; decode and vote {best * 1000:.1f} ms"
+    )
+    print(f"  {'':15}a document per landmark would read {archive.unindexed_landmarks(hashes)} documents")
+
+
+def time_mongo(archive: SyntheticArchive, seconds: float, repeat: int, mongo_url: str):
+    import bson
+    import pymongo
+
+    from tapearchive.models.fingerprint import FingerprintDao
+
+    client = pymongo.MongoClient(mongo_url)
+    dao = FingerprintDao(client)
+    postings = client.get_default_database()["fingerprint_postings"]
+    postings.drop()
+
+    hashes, frames, documents = archive.query(seconds)
+    start = time.perf_counter()
+    batch = []
+    for h in np.flatnonzero(archive.counts):
+        document = documents.get(int(h))
+        if document is None:
+            total = int(archive.counts[h])
+            if total > MAX_HASH_POSTINGS:
+                document = {"_id": int(h), "n": total, "s": True, "p": []}
+            else:
+                side = archive.sides[archive.rng.integers(2, len(archive.sides))]
+                side_frames = np.sort(archive.rng.integers(0, archive.side_frames, total)).astype("<u4")
+                document = {"_id": int(h), "n": total, "p": [{"r": side.bytes, "t": side_frames.tobytes()}]}
+        batch.append(
+            dict(document, p=[{"r": bson.Binary.from_uuid(UUID(bytes=bytes(p["r"]))), "t": p["t"]} for p in document["p"]])
+        )
+        if len(batch) == 10000:
+            postings.insert_many(batch, ordered=False)
+            batch = []
+    if batch:
+        postings.insert_many(batch, ordered=False)
+    print(f"  index of {postings.estimated_document_count()} hashes written in {time.perf_counter() - start:.0f} s")
+
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        found_hashes, found_frames, candidates, recordings = dao.find_landmarks(hashes, exclude_id=archive.sides[0])
+        vote(hashes, frames, found_hashes, found_frames, candidates, limit=10)
+        best = min(best, time.perf_counter() - start)
+    print(f"  {seconds:6.0f} s query through Mongo: {len(found_hashes)} landmarks found, {best * 1000:.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fingerprint index benchmark")
+    parser.add_argument("--sides", type=int, default=300)
+    parser.add_argument("--minutes", type=float, default=45)
+    parser.add_argument("--landmarks-per-minute", type=int, default=17500)
+    parser.add_argument("--skew", type=float, default=0.8)
+    parser.add_argument("--query-seconds", type=float, nargs="+", default=[30, 300, 2700])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--mongo-url", help="Database to write the index into, it is dropped first")
+    args = parser.parse_args()
+
+    archive = SyntheticArchive(args.sides, args.minutes, args.landmarks_per_minute, args.skew)
+    stopped = archive.counts > MAX_HASH_POSTINGS
+    print(
+        f"{args.sides} sides of {args.minutes:.0f} min, {archive.counts.sum()} landmarks, "
+        f"{np.count_nonzero(archive.counts)} hashes, {np.count_nonzero(stopped)} stopped holding "
+        f"{archive.counts[stopped].sum() / archive.counts.sum():.1%} of the landmarks"
+    )
+    for seconds in args.query_seconds:
+        if args.mongo_url:
+            time_mongo(archive, seconds, args.repeat, args.mongo_url)
+        else:
+            time_in_process(archive, seconds, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
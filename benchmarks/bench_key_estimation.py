@@ -0,0 +1,52 @@
+"""Compares the former per-fragment Krumhansl-Schmuckler loop with the batched key estimation.
+
+Usage: python benchmarks/bench_key_estimation.py [--fragments 5000] [--repeat 5]
+"""
+import argparse
+import timeit
+
+import numpy as np
+
+from tapearchive.analysis.key_estimation import KEYS, MAJOR_PROFILE, MINOR_PROFILE, PITCHES, estimate_keys, rank_keys
+
+
+def legacy_key(chroma_vals) -> str:
+    """The loop of the former TonalFragment.calculate(), without the chroma computation"""
+    keyfreqs = {PITCHES[i]: chroma_vals[i] for i in range(12)}
+    maj_key_corrs = []
+    min_key_corrs = []
+    for i in range(12):
+        key_test = [keyfreqs.get(PITCHES[(i + m) % 12]) for m in range(12)]
+        maj_key_corrs.append(round(np.corrcoef(MAJOR_PROFILE, key_test)[1, 0], 3))
+        min_key_corrs.append(round(np.corrcoef(MINOR_PROFILE, key_test)[1, 0], 3))
+    key_dict = {**{KEYS[i]: maj_key_corrs[i] for i in range(12)}, **{KEYS[i + 12]: min_key_corrs[i] for i in range(12)}}
+    return max(key_dict, key=key_dict.get)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Key estimation benchmark")
+    parser.add_argument("--fragments", type=int, default=5000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    chroma = np.random.default_rng(0).uniform(0, 100, (args.fragments, 12))
+
+    legacy_keys = [legacy_key(vector) for vector in chroma]
+    batch_keys = [KEYS[index] for index in rank_keys(chroma)[0][:, 0]]
+    # Legacy correlations are rounded to 3 digits, near ties may be broken differently
+    agreement = np.mean([a == b for a, b in zip(legacy_keys, batch_keys)])
+
+    cases = {
+        "legacy loop": lambda: [legacy_key(vector) for vector in chroma],
+        "rank_keys": lambda: rank_keys(chroma),
+        "estimate_keys": lambda: estimate_keys(chroma),
+    }
+
+    print(f"{args.fragments} fragments, best of {args.repeat}, keys agree on {agreement:.2%}")
+    for name, case in cases.items():
+        best = min(timeit.repeat(case, number=1, repeat=args.repeat))
+        print(f"  {name:<16} {best * 1000:10.2f} ms {best * 1e6 / args.fragments:8.2f} us/fragment")
+
+
+if __name__ == "__main__":
+    main()
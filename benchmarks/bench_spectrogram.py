@@ -0,0 +1,78 @@
+"""Compares the former audiogram path (librosa STFT per block, dB against the block maximum, and a matplotlib render
+when matplotlib is installed) with the quantized log-frequency tiles of the spectrogram engine.
+
+Usage: python benchmarks/bench_spectrogram.py [--minutes 2] [--repeat 3]
+"""
+import argparse
+import io
+import timeit
+
+import librosa
+import numpy as np
+import soundfile
+
+from tapearchive.analysis.spectrogram import SpectrogramBuilder, SpectrogramGeometry
+
+SAMPLE_RATE = 44100
+
+try:
+    import matplotlib
+
+    matplotlib.use("Agg")
+    import librosa.display
+    import matplotlib.pyplot as plt
+except ImportError:
+    plt = None
+
+
+def make_audio(minutes: float) -> bytes:
+    rng = np.random.default_rng(0)
+    samples = rng.uniform(-0.3, 0.3, (int(SAMPLE_RATE * 60 * minutes), 2)).astype(np.float32)
+    data = io.BytesIO()
+    soundfile.write(data, samples, SAMPLE_RATE, format="WAV")
+    return data.getvalue()
+
+
+def legacy_audiogram(data: bytes, render: bool):
+    """The blocks of the former CreateSpectorgram handler, with its default settings"""
+    with soundfile.SoundFile(io.BytesIO(data)) as sound_file:
+        for block in librosa.stream(sound_file, block_length=128, frame_length=4096, hop_length=4096):
+            spectrum = librosa.amplitude_to_db(np.abs(librosa.stft(block, n_fft=512, hop_length=4096)), ref=np.max)
+            if render:
+                fig, ax = plt.subplots(figsize=(6.4, 6.4), dpi=100)
+                librosa.display.specshow(spectrum, sr=SAMPLE_RATE / 8, ax=ax, y_axis="log", x_axis="time")
+                ax.set_axis_off()
+                fig.savefig(io.BytesIO(), bbox_inches="tight", pad_inches=0, dpi=10, format="png")
+                plt.close(fig)
+
+
+def tiled_audiogram(data: bytes):
+    with soundfile.SoundFile(io.BytesIO(data)) as sound_file:
+        builder = SpectrogramBuilder(SpectrogramGeometry(sound_file.samplerate))
+        tiles = []
+        for block in sound_file.blocks(blocksize=65536, dtype="float32", always_2d=True):
+            tiles.extend(builder.push(block))
+        tiles.extend(builder.finish())
+    return tiles
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Audiogram benchmark")
+    parser.add_argument("--minutes", type=float, default=2)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    data = make_audio(args.minutes)
+    cases = {"legacy stft": lambda: legacy_audiogram(data, render=False)}
+    if plt is not None:
+        cases["legacy + png"] = lambda: legacy_audiogram(data, render=True)
+    cases["tiles"] = lambda: tiled_audiogram(data)
+
+    print(f"{args.minutes} minutes of stereo audio at {SAMPLE_RATE} Hz, best of {args.repeat}")
+    for name, case in cases.items():
+        best = min(timeit.repeat(case, number=1, repeat=args.repeat))
+        print(f"  {name:<16} {best * 1000:10.2f} ms {best * 1000 / args.minutes:8.2f} ms/minute")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""Process pool for the CPU bound analyses.
+
+Task handlers run on the threads of the job manager, where NumPy and librosa heavy work partly serializes on the GIL
+and slows down the I/O bound handlers of the same worker. Analyses are submitted to a pool of processes instead, the
+handler thread waits for the result without holding the GIL.
+
+Inputs are meant to be small, large audio is passed as the path of a PCM cache file which the processes map on their
+own. Large arrays of the results are handed back through shared memory instead of being pickled.
+"""
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass
+import logging
+import multiprocessing
+from multiprocessing import shared_memory
+import os
+import threading
+from typing import Any, Callable, List, Optional, Tuple
+
+import numpy as np
+
+LOGGER = logging.getLogger(__name__)
+
+SHARED_MEMORY_THRESHOLD = 64 * 1024  # bytes, smaller arrays are pickled
+
+
+@dataclass
+class SharedArray:
+    """Stands for an array of a result while it is in shared memory"""
+
+    name: str
+    shape: Tuple[int, ...]
+    dtype: str
+
+
+def _share(value: Any, blocks: List[shared_memory.SharedMemory]) -> Any:
+    if isinstance(value, np.ndarray) and value.nbytes >= SHARED_MEMORY_THRESHOLD:
+        block = shared_memory.SharedMemory(create=True, size=value.nbytes)
+        blocks.append(block)
+        np.ndarray(value.shape, dtype=value.dtype, buffer=block.buf)[...] = value
+        return SharedArray(block.name, value.shape, value.dtype.str)
+    if isinstance(value, (tuple, list)):
+        return type(value)(_share(item, blocks) for item in value)
+    if isinstance(value, dict):
+        return {key: _share(item, blocks) for key, item in value.items()}
+    return value
+
+
+def _receive(value: Any) -> Any:
+    if isinstance(value, SharedArray):
+        block = shared_memory.SharedMemory(name=value.name)
+        try:
+            return np.ndarray(value.shape, dtype=np.dtype(value.dtype), buffer=block.buf).copy()
+        finally:
+            block.close()
+            block.unlink()
+    if isinstance(value, (tuple, list)):
+        return type(value)(_receive(item) for item in value)
+    if isinstance(value, dict):
+        return {key: _receive(item) for key, item in value.items()}
+    return value
+
+
+def _run_in_worker(fn: Callable, args: tuple, kwargs: dict) -> Any:
+    blocks = []
+    try:
+        result = _share(fn(*args, **kwargs), blocks)
+    except BaseException:
+        for block in blocks:
+            block.close()
+            block.unlink()
+        raise
+    # The receiving process unlinks the blocks
+    for block in blocks:
+        block.close()
+    return result
+
+
+class AnalysisPoolError(Exception):
+    """A process of the pool died while running an analysis, eg. killed for running out of memory"""
+
+
+class AnalysisExecutor:
+    """Runs analyses in `processes` processes, one per CPU core if not set. The pool is started on first use."""
+
+    def __init__(self, processes: int = 0):
+        self.processes = processes or os.cpu_count() or 1
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def __enter__(self) -> "AnalysisExecutor":
+        return self
+
+    def __exit__(self, *args):
+        self.shutdown()
+
+    def run(self, fn: Callable, *args, **kwargs) -> Any:
+        """Calls `fn` in a process of the pool and waits for its result. `fn` and its arguments have to be picklable.
+        Raises AnalysisPoolError if a process of the pool died meanwhile, the pool is started again for the next run.
+        """
+        pool = self._get_pool()
+        try:
+            return _receive(pool.submit(_run_in_worker, fn, args, kwargs).result())
+        except BrokenProcessPool as e:
+            self._drop_pool(pool)
+            raise AnalysisPoolError(f"Analysis process died running {getattr(fn, '__name__', fn)}") from e
+
+    def shutdown(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=True)
+                self._pool = None
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                LOGGER.info(f"Starting {self.processes} analysis processes")
+                # Forking a process with running threads and open Mongo connections is not safe
+                self._pool = ProcessPoolExecutor(self.processes, mp_context=multiprocessing.get_context("spawn"))
+            return self._pool
+
+    def _drop_pool(self, pool: ProcessPoolExecutor):
+        with self._lock:
+            # Other runs which failed on the same pool may have replaced it already
+            if self._pool is pool:
+                LOGGER.error("An analysis process died, restarting the pool")
+                self._pool = None
+        pool.shutdown(wait=False)
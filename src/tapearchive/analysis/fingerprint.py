@@ -0,0 +1,185 @@
+"""Landmark fingerprints of recordings, to find the same music on different tapes.
+
+Peaks of the magnitude spectrogram, local maxima over a neighbourhood of frequency bins and frames, survive noise,
+equalization and lossy coding. Each peak is paired with a few peaks following it, a pair is hashed from the frequency
+of the first peak, the frequency difference and the time difference into a landmark. The landmark is kept with the
+frame of its first peak.
+
+Two recordings of the same music share many landmarks, and the frames of the shared landmarks differ by the same
+offset: candidates are voted for by (recording, offset) of the matching landmarks, no pair of recordings is compared.
+"""
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+import numpy as np
+from scipy import ndimage
+
+from tapearchive.analysis.pcm_cache import iterate_blocks, to_mono
+
+FRAME_LENGTH = 2048
+HOP_LENGTH = 512
+BIN_COUNT = 512  # up to about 5.5 kHz at 22050 Hz, there is not much above on tape
+PEAK_BINS = 31  # neighbourhood of a peak, frequency bins
+PEAK_FRAMES = 11  # neighbourhood of a peak, frames
+MIN_PEAK_DB = -60.0  # relative to a full scale sine
+FAN_OUT = 5  # pairs per peak
+MAX_PAIR_FRAMES = 63
+MAX_PAIR_BINS = 127
+_PAIR_CANDIDATES = 32  # following peaks considered for the pairs of a peak
+
+# Landmark bits: first frequency | frequency difference | time difference
+_DT_BITS = 6
+_DF_BITS = 8
+
+
+class PeakFinder:
+    """Spectral peaks of a stream pushed block by block. Blocks can be of any length.
+
+    Peaks near the end of a block are picked when the frames after them are known, only a neighbourhood worth of
+    frames is kept between the blocks.
+    """
+
+    def __init__(self):
+        self._window = np.hanning(FRAME_LENGTH).astype(np.float32) / (np.hanning(FRAME_LENGTH).sum() / 2)
+        self._remainder = np.zeros(0, dtype=np.float32)  # samples of the next frame
+        self._frames = np.zeros((0, BIN_COUNT), dtype=np.float32)  # frames waiting for the frames after them
+        self._first_frame = 0  # index of _frames[0] in the stream
+        self._picked_frames = 0  # frames whose peaks are found already
+        self._peaks: List[np.ndarray] = []
+
+    def push(self, block: np.ndarray):
+        """`block` is (frames, channels) or mono samples"""
+        samples = np.concatenate((self._remainder, to_mono(block)))
+        frame_count = (len(samples) - FRAME_LENGTH) // HOP_LENGTH + 1 if len(samples) >= FRAME_LENGTH else 0
+        self._remainder = samples[frame_count * HOP_LENGTH :]
+        if frame_count == 0:
+            return
+
+        frames = np.lib.stride_tricks.sliding_window_view(samples, FRAME_LENGTH)[::HOP_LENGTH][:frame_count]
+        magnitude = np.abs(np.fft.rfft(frames * self._window, axis=1)[:, :BIN_COUNT])
+        decibels = (20 * np.log10(np.maximum(magnitude, 1e-10))).astype(np.float32)
+        self._frames = np.concatenate((self._frames, decibels))
+        self._pick(len(self._frames) - PEAK_FRAMES // 2)
+
+    def finish(self) -> np.ndarray:
+        """(frame, bin) of every peak in time order"""
+        self._pick(len(self._frames))
+        return np.concatenate(self._peaks) if self._peaks else np.zeros((0, 2), dtype=np.int64)
+
+    def _pick(self, end: int):
+        """Picks peaks of the buffered frames up to `end`, keeps the frames needed around the rest"""
+        start = self._picked_frames - self._first_frame
+        if end <= start:
+            return
+        maxima = ndimage.maximum_filter(self._frames, size=(PEAK_FRAMES, PEAK_BINS), mode="constant", cval=-np.inf)
+        is_peak = (self._frames == maxima) & (self._frames > MIN_PEAK_DB)
+        frames, bins = np.nonzero(is_peak[start:end])
+        self._peaks.append(np.column_stack((frames + self._picked_frames, bins)))
+
+        self._picked_frames = self._first_frame + end
+        keep_from = max(0, end - PEAK_FRAMES // 2)
+        self._frames = self._frames[keep_from:]
+        self._first_frame += keep_from
+
+
+def landmarks(peaks: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Hashes and frames of the landmarks of peaks in time order. Every peak is paired with the first FAN_OUT
+    peaks after it which are close enough in time and frequency.
+    """
+    peak_count = len(peaks)
+    if peak_count == 0:
+        return np.zeros(0, dtype=np.uint32), np.zeros(0, dtype=np.uint32)
+    frames, bins = peaks[:, 0], peaks[:, 1]
+    anchors = np.arange(peak_count)[:, np.newaxis]
+    targets = anchors + np.arange(1, _PAIR_CANDIDATES + 1)
+    is_inside = targets < peak_count
+    targets = np.minimum(targets, peak_count - 1)
+
+    dt = frames[targets] - frames[anchors]
+    df = bins[targets] - bins[anchors]
+    is_pair = is_inside & (dt > 0) & (dt <= MAX_PAIR_FRAMES) & (np.abs(df) <= MAX_PAIR_BINS)
+    is_pair &= np.cumsum(is_pair, axis=1) <= FAN_OUT
+
+    anchor_index, target_index = np.nonzero(is_pair)
+    dt, df = dt[anchor_index, target_index], df[anchor_index, target_index]
+    hashes = (
+        (bins[anchor_index] << (_DF_BITS + _DT_BITS)) | ((df + MAX_PAIR_BINS + 1) << _DT_BITS) | dt
+    ).astype(np.uint32)
+    return hashes, frames[anchor_index].astype(np.uint32)
+
+
+def fingerprint(pcm_path: str, sample_rate: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Landmark hashes and frames of a PCM cache file, runs in the analysis processes"""
+    peak_finder = PeakFinder()
+    for block in iterate_blocks(np.load(pcm_path, mmap_mode="r")):
+        peak_finder.push(block)
+    return landmarks(peak_finder.finish())
+
+
+@dataclass
+class OffsetVote:
+    """Landmarks of a query matching a candidate recording at the same offset"""
+
+    candidate: int
+    matches: int
+    offset_frames: int  # frame in the candidate minus frame in the query
+    query_start_frame: int
+    query_end_frame: int
+
+
+def vote(
+    query_hashes: np.ndarray,
+    query_frames: np.ndarray,
+    hashes: np.ndarray,
+    frames: np.ndarray,
+    candidates: np.ndarray,
+    min_matches: int = 10,
+    limit: Optional[int] = None,
+) -> List[OffsetVote]:
+    """Best offset of each candidate whose landmarks (`hashes`, `frames`, `candidates`: index of the candidate
+    recording) match at least `min_matches` landmarks of the query at the same offset, best candidates first.
+    Offsets one frame apart are counted together, peaks move by a frame when the two recordings are not aligned to
+    the hop.
+    """
+    # Every stored landmark is joined with the landmarks of the query of the same hash
+    order = np.argsort(query_hashes, kind="stable")
+    sorted_hashes = query_hashes[order]
+    first = np.searchsorted(sorted_hashes, hashes, side="left")
+    counts = np.searchsorted(sorted_hashes, hashes, side="right") - first
+    stored = np.repeat(np.arange(len(hashes)), counts)
+    query = order[np.repeat(first, counts) + np.arange(len(stored)) - np.repeat(np.cumsum(counts) - counts, counts)]
+    if len(stored) == 0:
+        return []
+
+    offsets = frames[stored].astype(np.int64) - query_frames[query].astype(np.int64)
+    # (candidate, offset) pairs as single keys, ordered by candidate then offset
+    span = int(offsets.max() - offsets.min()) + 3
+    keys = candidates[stored].astype(np.int64) * span + (offsets - offsets.min() + 1)
+    unique_keys, key_counts = np.unique(keys, return_counts=True)
+
+    votes = key_counts.copy()
+    for delta in (-1, 1):
+        neighbour = np.minimum(np.searchsorted(unique_keys, unique_keys + delta), len(unique_keys) - 1)
+        votes += np.where(unique_keys[neighbour] == unique_keys + delta, key_counts[neighbour], 0)
+
+    # Best offset of every candidate
+    key_candidates = unique_keys // span
+    best = np.lexsort((-votes, key_candidates))
+    best = best[np.concatenate(([True], np.diff(key_candidates[best]) != 0))]
+    best = best[votes[best] >= min_matches]
+    best = best[np.argsort(-votes[best], kind="stable")][:limit]
+
+    results = []
+    for index in best:
+        is_match = np.abs(keys - unique_keys[index]) <= 1
+        matched_frames = query_frames[query[is_match]]
+        results.append(
+            OffsetVote(
+                candidate=int(key_candidates[index]),
+                matches=int(votes[index]),
+                offset_frames=int(unique_keys[index] % span + offsets.min() - 1),
+                query_start_frame=int(matched_frames.min()),
+                query_end_frame=int(matched_frames.max()),
+            )
+        )
+    return results
@@ -0,0 +1,83 @@
+"""Krumhansl-Schmuckler key estimation for batches of chroma vectors.
+
+Every (rotated) major and minor key profile is normalized once, so the Pearson correlation of a normalized chroma vector
+with all 24 keys is a single row of a matrix product, and a batch of fragments is one (n, 12) x (12, 24) product.
+"""
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+PITCHES = ("C", "C#", "D", "D#", "E", "F", "F#", "G", "G#", "A", "A#", "B")
+KEYS = tuple(f"{pitch} major" for pitch in PITCHES) + tuple(f"{pitch} minor" for pitch in PITCHES)
+
+MAJOR_PROFILE = (6.35, 2.23, 3.48, 2.33, 4.38, 4.09, 2.52, 5.19, 2.39, 3.66, 2.29, 2.88)
+MINOR_PROFILE = (6.33, 2.68, 3.52, 5.38, 2.60, 3.53, 2.54, 4.75, 3.98, 2.69, 3.34, 3.17)
+
+# The second most likely key is reported only if its correlation is this close to the best one
+SECOND_KEY_RATIO = 0.9
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    """Centers rows and scales them to unit length, flat rows (eg. silence) become zero"""
+    centered = vectors - vectors.mean(axis=-1, keepdims=True)
+    norms = np.linalg.norm(centered, axis=-1, keepdims=True)
+    return np.divide(centered, norms, out=np.zeros_like(centered), where=norms > 0)
+
+
+def _key_profiles() -> np.ndarray:
+    profiles = [np.roll(MAJOR_PROFILE, tonic) for tonic in range(12)]
+    profiles += [np.roll(MINOR_PROFILE, tonic) for tonic in range(12)]
+    return _normalize(np.array(profiles, dtype=np.float64))
+
+
+# (24, 12), row k is the profile of KEYS[k] indexed by pitch class
+KEY_PROFILES = _key_profiles()
+
+
+@dataclass
+class KeyEstimate:
+    key: str
+    confidence: float
+    second_key: Optional[str] = None
+    second_confidence: Optional[float] = None
+
+
+def correlate_keys(chroma: np.ndarray) -> np.ndarray:
+    """Correlations of chroma vectors (n, 12) with the 24 keys, (n, 24)"""
+    return _normalize(np.atleast_2d(np.asarray(chroma, dtype=np.float64))) @ KEY_PROFILES.T
+
+
+def rank_keys(chroma: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Indices into KEYS and correlations of the two most likely keys per chroma vector, both (n, 2)"""
+    correlations = correlate_keys(chroma)
+    top_two = np.argpartition(-correlations, 1, axis=1)[:, :2]
+    top_correlations = np.take_along_axis(correlations, top_two, axis=1)
+
+    order = np.argsort(-top_correlations, axis=1)
+    return np.take_along_axis(top_two, order, axis=1), np.take_along_axis(top_correlations, order, axis=1)
+
+
+def estimate_keys(chroma: np.ndarray, second_key_ratio: float = SECOND_KEY_RATIO) -> List[KeyEstimate]:
+    indices, correlations = rank_keys(chroma)
+    has_second = correlations[:, 1] > correlations[:, 0] * second_key_ratio
+
+    estimates = []
+    for (best, second), (best_correlation, second_correlation), is_close in zip(
+        indices.tolist(), correlations.tolist(), has_second.tolist()
+    ):
+        estimates.append(
+            KeyEstimate(
+                key=KEYS[best],
+                confidence=best_correlation,
+                second_key=KEYS[second] if is_close else None,
+                second_confidence=second_correlation if is_close else None,
+            )
+        )
+    return estimates
+
+
+def chroma_map(chroma: np.ndarray) -> Dict[str, float]:
+    """Intensity of each pitch class relative to the strongest one"""
+    peak = float(np.max(chroma))
+    return {pitch: float(value) / peak if peak > 0 else 0.0 for pitch, value in zip(PITCHES, chroma)}
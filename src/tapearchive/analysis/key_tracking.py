@@ -0,0 +1,131 @@
+"""Key of an audio stream over sliding windows, with bounded memory.
+
+The audio is read block by block, each block is turned into harmonic chroma frames (HPSS on the magnitude
+spectrogram, no resynthesis) and the frames are summed over the windows. Only the frames of the current window are
+kept, so a tape side of any length needs the memory of one block.
+"""
+from dataclasses import dataclass
+from typing import Iterator, List, Optional, Tuple
+
+import librosa
+import numpy as np
+
+from tapearchive.analysis.key_estimation import KeyEstimate, estimate_keys
+from tapearchive.analysis.pcm_cache import to_mono
+
+# The STFT is shared with the onset detection of the rhythm analysis, which needs the short hop
+FRAME_LENGTH = 2048
+HOP_LENGTH = 512
+BLOCK_LENGTH = 1024  # frames per block
+
+# Stored with the results of the key analysis, bump it when the results change so they are computed again
+KEY_ALGORITHM_VERSION = 1
+
+
+@dataclass
+class KeyTrackWindow:
+    start_seconds: float
+    end_seconds: float
+    estimate: KeyEstimate
+
+
+def stream_hpss(
+    pcm: np.ndarray,
+    frame_length: int = FRAME_LENGTH,
+    hop_length: int = HOP_LENGTH,
+    block_length: int = BLOCK_LENGTH,
+) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+    """Yields (harmonic, percussive) power spectrograms per block of `block_length` frames, frames are `hop_length`
+    samples apart. `pcm` is mono or (samples, channels), blocks are mixed down as they are read.
+    """
+    block_step = block_length * hop_length
+    for start in range(0, len(pcm) - frame_length + 1, block_step):
+        y = to_mono(np.asarray(pcm[start : start + block_step - hop_length + frame_length], dtype=np.float32))
+        power = np.abs(librosa.stft(y, n_fft=frame_length, hop_length=hop_length, center=False)) ** 2
+        yield librosa.decompose.hpss(power)
+
+
+def harmonic_chroma(harmonic: np.ndarray, sample_rate: int) -> np.ndarray:
+    """(12, frames) chroma of a harmonic power spectrogram of stream_hpss()"""
+    return librosa.feature.chroma_stft(S=harmonic, sr=sample_rate, n_fft=FRAME_LENGTH, hop_length=HOP_LENGTH)
+
+
+def stream_harmonic_chroma(pcm: np.ndarray, sample_rate: int, block_length: int = BLOCK_LENGTH) -> Iterator[np.ndarray]:
+    """Yields (12, frames) chroma of the harmonic component per block"""
+    for harmonic, _ in stream_hpss(pcm, block_length=block_length):
+        yield harmonic_chroma(harmonic, sample_rate)
+
+
+class KeyTracker:
+    """Sums chroma frames over windows of `window_seconds`, starting every `hop_seconds`.
+    Keys of the windows completed by a push are estimated in one batch. Without a window only the total chroma of the
+    stream is summed up.
+    """
+
+    def __init__(self, frames_per_second: float, window_seconds: Optional[float] = 10.0, hop_seconds: float = 5.0):
+        if window_seconds is not None and (window_seconds <= 0 or hop_seconds <= 0):
+            raise ValueError("Window and hop have to be positive")
+        self._frames_per_second = frames_per_second
+        self._window = max(1, round(window_seconds * frames_per_second)) if window_seconds is not None else None
+        self._hop = max(1, round(hop_seconds * frames_per_second)) if window_seconds is not None else None
+
+        self._frames = np.zeros((0, 12))
+        self._offset = 0  # frame index of self._frames[0]
+        self._next_start = 0
+        self.total_chroma = np.zeros(12)
+
+    def push(self, chroma: np.ndarray) -> List[KeyTrackWindow]:
+        """`chroma` is (12, frames), as computed by librosa"""
+        frames = np.asarray(chroma, dtype=np.float64).T
+        self.total_chroma += frames.sum(axis=0)
+        if self._window is None:
+            return []
+        self._frames = np.concatenate((self._frames, frames))
+        return self._emit(is_final=False)
+
+    def finish(self) -> List[KeyTrackWindow]:
+        """Emits the last, shorter window if the end of the stream is not covered yet"""
+        if self._window is None:
+            return []
+        return self._emit(is_final=True)
+
+    def _emit(self, is_final: bool) -> List[KeyTrackWindow]:
+        frame_count = self._offset + len(self._frames)
+
+        starts = []
+        start = self._next_start
+        while start + self._window <= frame_count:
+            starts.append(start)
+            start += self._hop
+        if is_final and start < frame_count and (start == 0 or start - self._hop + self._window < frame_count):
+            starts.append(start)
+            start += self._hop
+        self._next_start = start
+
+        windows = []
+        if starts:
+            starts = np.array(starts)
+            ends = np.minimum(starts + self._window, frame_count)
+            cumulative = np.concatenate((np.zeros((1, 12)), np.cumsum(self._frames, axis=0)))
+            sums = cumulative[ends - self._offset] - cumulative[starts - self._offset]
+
+            for start, end, estimate in zip(starts.tolist(), ends.tolist(), estimate_keys(sums)):
+                windows.append(KeyTrackWindow(start / self._frames_per_second, end / self._frames_per_second, estimate))
+
+        # Frames before the next window are not needed anymore
+        drop = min(max(self._next_start - self._offset, 0), len(self._frames))
+        self._frames = self._frames[drop:]
+        self._offset += drop
+        return windows
+
+
+def track_keys(
+    pcm_path: str, sample_rate: int, window_seconds: Optional[float], hop_seconds: float
+) -> Tuple[np.ndarray, List[KeyTrackWindow]]:
+    """Total chroma and key windows of a PCM cache file, runs in the analysis processes"""
+    tracker = KeyTracker(sample_rate / HOP_LENGTH, window_seconds, hop_seconds)
+    windows = []
+    for chroma in stream_harmonic_chroma(np.load(pcm_path, mmap_mode="r"), sample_rate):
+        windows.extend(tracker.push(chroma))
+    windows.extend(tracker.finish())
+    return tracker.total_chroma, windows
@@ -0,0 +1,174 @@
+"""Node-local cache of decoded audio, shared by the analysis tasks.
+
+Sources are decoded once, resampled to the analysis sample rate and stored as float32 `.npy` files of
+(frames, channels), which the analyses map into memory read only instead of downloading and decoding the source again.
+Files are written next to their final name and moved in place when complete, so readers never see a partial file.
+The least recently used files are evicted when the cache grows over its size, except the files pinned by analyses
+which are yet to open them in another process.
+"""
+import contextlib
+import logging
+import os
+import pathlib
+from typing import BinaryIO, Iterator, Optional, Set
+import uuid
+
+import numpy as np
+import soundfile
+import soxr
+
+from tapearchive.config import AnalysisConfig
+
+LOGGER = logging.getLogger(__name__)
+
+SAMPLE_RATE = 22050
+BLOCK_SIZE = 65536  # frames decoded at once
+
+# Room for any shape, the header is written before the number of frames is known
+_HEADER_SIZE = 128
+_MAGIC = b"\x93NUMPY\x01\x00"
+
+
+def _npy_header(frames: int, channels: int) -> bytes:
+    header = repr({"descr": "<f4", "fortran_order": False, "shape": (frames, channels)}).encode("latin1")
+    padding = _HEADER_SIZE - len(_MAGIC) - 2 - len(header) - 1
+    return _MAGIC + (_HEADER_SIZE - len(_MAGIC) - 2).to_bytes(2, "little") + header + b" " * padding + b"\n"
+
+
+def decode_blocks(source: BinaryIO, sample_rate: int, block_size: int = BLOCK_SIZE) -> Iterator[np.ndarray]:
+    """(frames, channels) float32 blocks of an audio stream, resampled to `sample_rate` without seams between blocks"""
+    with soundfile.SoundFile(source) as sound_file:
+        resampler = None
+        if sound_file.samplerate != sample_rate:
+            resampler = soxr.ResampleStream(sound_file.samplerate, sample_rate, sound_file.channels, dtype="float32")
+        for block in sound_file.blocks(blocksize=block_size, dtype="float32", always_2d=True):
+            yield resampler.resample_chunk(block) if resampler is not None else block
+        if resampler is not None:
+            yield resampler.resample_chunk(np.zeros((0, sound_file.channels), dtype=np.float32), last=True)
+
+
+def iterate_blocks(pcm: np.ndarray, block_size: int = BLOCK_SIZE) -> Iterator[np.ndarray]:
+    """Views of consecutive blocks, nothing is copied from the mapping"""
+    for start in range(0, len(pcm), block_size):
+        yield pcm[start : start + block_size]
+
+
+def to_mono(block: np.ndarray) -> np.ndarray:
+    """Mean of the channels of a (frames, channels) block"""
+    if block.ndim == 1:
+        return block
+    # Much faster than mean(axis=1) on the interleaved channels
+    return block @ np.full(block.shape[1], 1 / block.shape[1], dtype=np.float32)
+
+
+class PcmCache:
+    def __init__(self, directory: pathlib.Path, max_bytes: int, sample_rate: int = SAMPLE_RATE):
+        self.directory = pathlib.Path(directory)
+        self.max_bytes = max_bytes
+        self.sample_rate = sample_rate
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def path(self, file_id: str) -> pathlib.Path:
+        return self.directory / f"{file_id}-{self.sample_rate}.npy"
+
+    @contextlib.contextmanager
+    def pinned(self, file_id: str) -> Iterator[pathlib.Path]:
+        """Keeps the file of `file_id` from being evicted while the block runs, eg. until an analysis process which
+        got only the path has mapped it. Pins are files next to the cache file, so they hold for the other processes
+        sharing the cache directory as well.
+        """
+        path = self.path(file_id)
+        pin = path.with_name(f"{path.name}.{os.getpid()}.{uuid.uuid4().hex}.pin")
+        pin.touch()
+        try:
+            yield path
+        finally:
+            pin.unlink(missing_ok=True)
+
+    def get(self, file_id: str) -> Optional[np.ndarray]:
+        """(frames, channels) float32, mapped read only, or None if the file is not cached"""
+        path = self.path(file_id)
+        try:
+            pcm = np.load(path, mmap_mode="r")
+        except FileNotFoundError:
+            return None
+        # Marks the file as recently used, access times are not reliable on noatime mounts
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass  # evicted meanwhile, the mapping stays valid
+        return pcm
+
+    def put(self, file_id: str, source: BinaryIO) -> np.ndarray:
+        """Decodes `source` block by block into the cache, returns it mapped the same way as get()"""
+        path = self.path(file_id)
+        partial = path.with_name(f"{path.name}.{uuid.uuid4().hex}.part")
+        try:
+            with open(partial, "wb") as f:
+                f.write(_npy_header(0, 0))
+                frames, channels = 0, 0
+                for block in decode_blocks(source, self.sample_rate):
+                    f.write(np.ascontiguousarray(block, dtype="<f4").tobytes())
+                    frames, channels = frames + len(block), block.shape[1]
+                if frames == 0:
+                    raise RuntimeError(f"No audio in {file_id}")
+                f.seek(0)
+                f.write(_npy_header(frames, channels))
+            os.replace(partial, path)
+            pcm = np.load(path, mmap_mode="r")
+        except BaseException:
+            partial.unlink(missing_ok=True)
+            raise
+        LOGGER.debug(f"Cached {frames} frames of {file_id} at {self.sample_rate} Hz")
+        self.evict(keep=path)
+        return pcm
+
+    def evict(self, keep: Optional[pathlib.Path] = None):
+        """Removes the least recently used files until the cache fits into its size, pinned files are kept.
+        Analyses still reading an evicted file keep their mapping, the data is freed when they are done.
+        """
+        pinned = self._pinned_names()
+        entries = []
+        for path in self.directory.glob("*.npy"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries, key=lambda entry: entry[0]):
+            if total <= self.max_bytes:
+                break
+            if path == keep or path.name in pinned:
+                continue
+            path.unlink(missing_ok=True)
+            total -= size
+            LOGGER.debug(f"Evicted {path.name} from the PCM cache")
+        if total > self.max_bytes:
+            LOGGER.warning(f"PCM cache holds {total} bytes over its size of {self.max_bytes}, the files are in use")
+
+    def _pinned_names(self) -> Set[str]:
+        """Names of the pinned cache files, pins left behind by processes which are gone are removed"""
+        names = set()
+        for pin in self.directory.glob("*.npy.*.pin"):
+            name, pid, _, _ = pin.name.rsplit(".", 3)
+            if not _is_running(int(pid)):
+                pin.unlink(missing_ok=True)
+                continue
+            names.add(name)
+        return names
+
+
+def _is_running(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass  # exists, owned by another user
+    return True
+
+
+def create_pcm_cache(config: AnalysisConfig) -> PcmCache:
+    return PcmCache(config.pcm_cache_directory, config.pcm_cache_max_bytes, sample_rate=config.sample_rate)
@@ -0,0 +1,73 @@
+"""Tempo, beats and onset strength from the percussive component of the HPSS which also feeds the key analysis.
+
+One pass over the decoded audio separates each block into harmonic and percussive power spectrograms: chroma of the
+harmonic part goes to the key tracker, the percussive part gives the onset strength envelope. Tempo and beats are
+tracked on the envelope of the whole stream, which is small.
+"""
+from typing import List, Optional, Tuple
+
+import librosa
+import numpy as np
+
+from tapearchive.analysis.key_tracking import (
+    FRAME_LENGTH,
+    HOP_LENGTH,
+    KeyTracker,
+    KeyTrackWindow,
+    harmonic_chroma,
+    stream_hpss,
+)
+
+MEL_BANDS = 128
+
+
+class OnsetTracker:
+    """Spectral flux of the log mel spectrogram, as librosa.onset.onset_strength() computes it, continued across
+    blocks. Decibels are relative to a fixed reference, so every block is on the same scale.
+    """
+
+    def __init__(self, sample_rate: int):
+        self._mel_filters = librosa.filters.mel(sr=sample_rate, n_fft=FRAME_LENGTH, n_mels=MEL_BANDS)
+        self._last_frame: Optional[np.ndarray] = None
+        self._envelopes: List[np.ndarray] = []
+
+    def push(self, percussive: np.ndarray):
+        """`percussive` is a (bins, frames) power spectrogram"""
+        mel_db = librosa.power_to_db(self._mel_filters @ percussive, ref=1.0, top_db=None)
+        previous = self._last_frame if self._last_frame is not None else mel_db[:, :1]
+        flux = np.diff(np.concatenate((previous, mel_db), axis=1), axis=1)
+        self._envelopes.append(np.maximum(flux, 0).mean(axis=0).astype(np.float32))
+        self._last_frame = mel_db[:, -1:]
+
+    @property
+    def envelope(self) -> np.ndarray:
+        """Onset strength per frame"""
+        return np.concatenate(self._envelopes) if self._envelopes else np.zeros(0, dtype=np.float32)
+
+
+def track_beats(envelope: np.ndarray, sample_rate: int) -> Tuple[float, np.ndarray]:
+    """Tempo in beats per minute and beat times in seconds, 0 and no beats if there is no rhythm to follow"""
+    if not np.any(envelope):
+        return 0.0, np.zeros(0)
+    tempo, beats = librosa.beat.beat_track(onset_envelope=envelope, sr=sample_rate, hop_length=HOP_LENGTH, units="time")
+    # Frames are not centered, an onset is closer to the middle of its frame than to its start
+    return float(np.atleast_1d(tempo)[0]), beats + FRAME_LENGTH / 2 / sample_rate
+
+
+def analyze_key_and_rhythm(
+    pcm_path: str, sample_rate: int, window_seconds: Optional[float], hop_seconds: float
+) -> Tuple[np.ndarray, List[KeyTrackWindow], float, np.ndarray, np.ndarray]:
+    """Total chroma, key windows, tempo, beat times and onset envelope of a PCM cache file with one HPSS pass,
+    runs in the analysis processes
+    """
+    key_tracker = KeyTracker(sample_rate / HOP_LENGTH, window_seconds, hop_seconds)
+    onset_tracker = OnsetTracker(sample_rate)
+    windows = []
+    for harmonic, percussive in stream_hpss(np.load(pcm_path, mmap_mode="r")):
+        windows.extend(key_tracker.push(harmonic_chroma(harmonic, sample_rate)))
+        onset_tracker.push(percussive)
+    windows.extend(key_tracker.finish())
+
+    envelope = onset_tracker.envelope
+    bpm, beat_times = track_beats(envelope, sample_rate)
+    return key_tracker.total_chroma, windows, bpm, beat_times, envelope
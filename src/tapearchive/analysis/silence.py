@@ -0,0 +1,121 @@
+"""Track boundaries of a tape side from the gaps of silence between the tracks.
+
+The level of the audio is the RMS of short frames, computed block by block, so memory does not grow with the length
+of the recording. A frame turns silent below `silence_db` and stays silent until the level rises over `sound_db`, the
+hysteresis keeps tape hiss and fade outs from flickering between the two. Only silences of at least `min_gap_seconds`
+separate tracks, shorter ones are pauses within a track. Silence before the first and after the last track is trimmed.
+"""
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from tapearchive.analysis.pcm_cache import iterate_blocks, to_mono
+
+FRAME_LENGTH = 2048  # samples per level measurement, about 93 ms at 22050 Hz
+SILENCE_DB = -48.0  # dBFS
+SOUND_DB = -42.0  # dBFS
+MIN_GAP_SECONDS = 1.5
+
+Segment = Tuple[float, float]  # start and end in seconds
+
+
+class SilenceDetector:
+    """Sections of sound of a stream pushed block by block. Blocks can be of any length."""
+
+    def __init__(
+        self,
+        sample_rate: int,
+        silence_db: float = SILENCE_DB,
+        sound_db: float = SOUND_DB,
+        min_gap_seconds: float = MIN_GAP_SECONDS,
+        frame_length: int = FRAME_LENGTH,
+    ):
+        if sound_db < silence_db:
+            raise ValueError(f"Sound level {sound_db} dB is below the silence level {silence_db} dB")
+        self.sample_rate = sample_rate
+        self.frame_length = frame_length
+        # Compared to the mean square of the frames, there is no need to take roots and logarithms
+        self._silence_power = 10 ** (silence_db / 10)
+        self._sound_power = 10 ** (sound_db / 10)
+        self._min_gap_frames = int(np.ceil(min_gap_seconds * sample_rate / frame_length))
+
+        self._remainder = np.zeros(0, dtype=np.float32)  # samples of the incomplete frame
+        self._frame_count = 0
+        self._is_silent = True  # the stream starts in silence, leading silence is trimmed
+        self._silent_since: Optional[int] = 0
+        self._track_start: Optional[int] = None
+
+    def push(self, block: np.ndarray) -> List[Segment]:
+        """Tracks which ended within `block`, a (frames, channels) or mono block of samples"""
+        samples = np.concatenate((self._remainder, to_mono(block)))
+        frame_count = len(samples) // self.frame_length
+        self._remainder = samples[frame_count * self.frame_length :]
+        if frame_count == 0:
+            return []
+
+        frames = samples[: frame_count * self.frame_length].reshape(frame_count, self.frame_length)
+        power = np.einsum("ij,ij->i", frames, frames) / self.frame_length
+        is_silent = self._hysteresis(power)
+
+        tracks = []
+        previous = np.concatenate(([self._is_silent], is_silent[:-1]))
+        for index in np.flatnonzero(is_silent != previous):
+            track = self._change_state(self._frame_count + int(index), bool(is_silent[index]))
+            if track is not None:
+                tracks.append(track)
+
+        self._is_silent = bool(is_silent[-1])
+        self._frame_count += frame_count
+        return tracks
+
+    def finish(self) -> List[Segment]:
+        """The last track, if the stream did not end in silence before it. Samples of an incomplete frame are dropped."""
+        if self._track_start is None:
+            return []
+        end = self._silent_since if self._is_silent else self._frame_count
+        return [self._segment(self._track_start, end)]
+
+    def _hysteresis(self, power: np.ndarray) -> np.ndarray:
+        # 1: turns silent, 0: turns sound, -1: keeps the state of the frame before
+        decision = np.where(power < self._silence_power, 1, np.where(power > self._sound_power, 0, -1))
+        last_decided = np.maximum.accumulate(np.where(decision >= 0, np.arange(len(power)), -1))
+        return np.where(last_decided >= 0, decision[last_decided] == 1, self._is_silent)
+
+    def _change_state(self, frame: int, is_silent: bool) -> Optional[Segment]:
+        if is_silent:
+            self._silent_since = frame
+            return None
+
+        track = None
+        if self._track_start is None:
+            self._track_start = frame
+        elif frame - self._silent_since >= self._min_gap_frames:
+            track = self._segment(self._track_start, self._silent_since)
+            self._track_start = frame
+        self._silent_since = None
+        return track
+
+    def _segment(self, start_frame: int, end_frame: int) -> Segment:
+        seconds_per_frame = self.frame_length / self.sample_rate
+        return start_frame * seconds_per_frame, end_frame * seconds_per_frame
+
+
+def cut_points(tracks: List[Segment]) -> List[float]:
+    """Times to cut the recording at, in the middle of the gaps between the tracks"""
+    return [(end + start) / 2 for (_, end), (start, _) in zip(tracks, tracks[1:])]
+
+
+def find_tracks(
+    pcm_path: str,
+    sample_rate: int,
+    silence_db: float = SILENCE_DB,
+    sound_db: float = SOUND_DB,
+    min_gap_seconds: float = MIN_GAP_SECONDS,
+) -> List[Segment]:
+    """Tracks of a PCM cache file, runs in the analysis processes"""
+    detector = SilenceDetector(sample_rate, silence_db, sound_db, min_gap_seconds)
+    tracks = []
+    for block in iterate_blocks(np.load(pcm_path, mmap_mode="r")):
+        tracks.extend(detector.push(block))
+    tracks.extend(detector.finish())
+    return tracks
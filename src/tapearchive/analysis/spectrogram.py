@@ -0,0 +1,195 @@
+"""Log-frequency spectrogram of an audio stream, quantized to bytes and cut into fixed-size tiles.
+
+A tile holds `tile_width` frames of `bin_count` bytes each, frame major, so the tiles of a stream concatenated give a
+(frames, bins) uint8 array, and tile `x` starts at byte `x * tile_size`. Bytes map linearly to decibels between
+`min_db` (0) and full scale (255).
+
+Tiles form a pyramid for zooming: level 0 is a single tile of the whole stream, level `L` has `2 ** L` tiles, each
+level doubling the time resolution of the previous one. The deepest level holds the tiles as computed, the frames of
+upper levels are averages of consecutive frames.
+"""
+from dataclasses import dataclass, fields
+import math
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from tapearchive.analysis.pcm_cache import iterate_blocks, to_mono
+
+FFT_LENGTH = 2048
+HOP_LENGTH = 2048  # no overlap, ~21 frames per second at 44.1 kHz
+BIN_COUNT = 256
+TILE_WIDTH = 256  # frames per tile
+MIN_DB = -90.0
+MIN_FREQUENCY = 32.70  # C1
+
+_AMPLITUDE_MIN = 1e-10
+_INT_FIELDS = ("sample_rate", "fft_length", "hop_length", "bin_count", "tile_width", "frame_count")
+
+
+@dataclass
+class SpectrogramGeometry:
+    sample_rate: int
+    fft_length: int = FFT_LENGTH
+    hop_length: int = HOP_LENGTH
+    bin_count: int = BIN_COUNT
+    tile_width: int = TILE_WIDTH
+    min_db: float = MIN_DB
+    min_frequency: float = MIN_FREQUENCY
+    max_frequency: Optional[float] = None  # Nyquist frequency if not set
+    frame_count: int = 0
+
+    @property
+    def tile_size(self) -> int:
+        return self.tile_width * self.bin_count
+
+    @property
+    def tile_count(self) -> int:
+        return math.ceil(self.frame_count / self.tile_width)
+
+    @property
+    def frames_per_second(self) -> float:
+        return self.sample_rate / self.hop_length
+
+    @property
+    def deepest_level(self) -> int:
+        return max(self.tile_count - 1, 0).bit_length()
+
+    def frames_per_tile(self, level: int) -> int:
+        """Frames of the deepest level pooled into the tiles of `level`"""
+        return self.tile_width << (self.deepest_level - level)
+
+    def has_tile(self, level: int, x: int) -> bool:
+        """Tiles past the end of the stream are not stored nor served"""
+        if not 0 <= level <= self.deepest_level or not 0 <= x < 2**level:
+            return False
+        return x == 0 or x * self.frames_per_tile(level) < self.frame_count
+
+    def bin_frequencies(self) -> np.ndarray:
+        """Center frequencies of the rows, geometrically spaced"""
+        max_frequency = self.max_frequency or self.sample_rate / 2
+        return np.geomspace(self.min_frequency, max_frequency, self.bin_count)
+
+    def to_meta(self) -> Dict[str, str]:
+        """Attachment meta holds strings only"""
+        return {f.name: str(getattr(self, f.name)) for f in fields(self) if getattr(self, f.name) is not None}
+
+    @classmethod
+    def from_meta(cls, meta: Dict[str, str]) -> "SpectrogramGeometry":
+        values = {f.name: meta[f.name] for f in fields(cls) if f.name in meta}
+        return cls(**{name: (int if name in _INT_FIELDS else float)(value) for name, value in values.items()})
+
+
+def log_frequency_matrix(geometry: SpectrogramGeometry) -> np.ndarray:
+    """(bins, fft_length // 2 + 1) weights, summing the power of the FFT bins under triangles peaking at the centers
+    of the log-frequency rows, so a sine keeps about its level. Rows narrower than the FFT resolution are interpolated
+    from the two closest FFT bins.
+    """
+    fft_frequencies = np.fft.rfftfreq(geometry.fft_length, 1 / geometry.sample_rate)
+    centers = geometry.bin_frequencies()
+    ratio = centers[1] / centers[0] if len(centers) > 1 else 2.0
+    lower = centers / ratio
+    upper = centers * ratio
+
+    # Triangles from the previous center to the next one, peaking at the center
+    f = fft_frequencies[np.newaxis, :]
+    rising = (f - lower[:, np.newaxis]) / (centers - lower)[:, np.newaxis]
+    falling = (upper[:, np.newaxis] - f) / (upper - centers)[:, np.newaxis]
+    weights = np.maximum(0, np.minimum(rising, falling))
+
+    resolution = fft_frequencies[1]
+    position = np.clip(centers / resolution, 0, len(fft_frequencies) - 1)
+    left = np.floor(position).astype(int)
+    right = np.minimum(left + 1, len(fft_frequencies) - 1)
+    interpolated = np.zeros_like(weights)
+    rows = np.arange(len(centers))
+    np.add.at(interpolated, (rows, left), 1 - (position - left))
+    np.add.at(interpolated, (rows, right), position - left)
+
+    narrow = weights.sum(axis=1) < 1
+    weights[narrow] = interpolated[narrow]
+    return weights
+
+
+def pool_frames(frames: bytes, geometry: SpectrogramGeometry, level: int) -> bytes:
+    """Tile of `level` from the frames of the deepest level it covers, silence past the end of the stream"""
+    factor = geometry.frames_per_tile(level) // geometry.tile_width
+    rows = np.zeros((geometry.frames_per_tile(level), geometry.bin_count), dtype=np.uint8)
+    data = np.frombuffer(frames, dtype=np.uint8)[: rows.size]
+    rows.reshape(-1)[: len(data)] = data
+    if factor == 1:
+        return rows.tobytes()
+    pooled = rows.reshape(geometry.tile_width, factor, geometry.bin_count).mean(axis=1, dtype=np.float32)
+    return np.round(pooled).astype(np.uint8).tobytes()
+
+
+def quantize_db(db: np.ndarray, min_db: float) -> np.ndarray:
+    return np.round((np.clip(db, min_db, 0) - min_db) * (255 / -min_db)).astype(np.uint8)
+
+
+def dequantize_db(data: np.ndarray, min_db: float) -> np.ndarray:
+    return data.astype(np.float32) * (-min_db / 255) + min_db
+
+
+class SpectrogramBuilder:
+    """Quantized log-frequency spectrogram of an audio stream, in tiles.
+
+    Blocks of any length are cut into frames as they arrive, the samples of the unfinished frames are carried over to
+    the next block. Frames are not centered, frame `i` starts at sample `i * hop_length`. Channels are mixed down to
+    mono. 0 dB is a full scale sine.
+    """
+
+    def __init__(self, geometry: SpectrogramGeometry):
+        if geometry.fft_length < geometry.hop_length:
+            raise ValueError("Hop has to be shorter than the FFT")
+        self.geometry = geometry
+        self.geometry.frame_count = 0  # counts the frames pushed so far
+
+        self._window = np.hanning(geometry.fft_length + 1)[:-1].astype(np.float32)
+        self._mapping = log_frequency_matrix(geometry).T.astype(np.float32)
+        self._reference = (self._window.sum() / 2) ** 2
+        self._remainder = np.empty(0, dtype=np.float32)
+        self._tile = np.empty((0, geometry.bin_count), dtype=np.uint8)
+
+    def push(self, block: np.ndarray) -> List[bytes]:
+        """`block` is either mono or (frames, channels), as read by soundfile. Returns the tiles completed by it."""
+        samples = np.concatenate((self._remainder, to_mono(np.asarray(block, dtype=np.float32))))
+
+        fft_length, hop_length = self.geometry.fft_length, self.geometry.hop_length
+        frame_count = (len(samples) - fft_length) // hop_length + 1 if len(samples) >= fft_length else 0
+        self._remainder = samples[frame_count * hop_length :].copy()
+        if frame_count == 0:
+            return []
+
+        frames = np.lib.stride_tricks.sliding_window_view(samples, fft_length)[::hop_length][:frame_count]
+        spectrum = np.fft.rfft(frames * self._window, axis=1)
+        power = (spectrum.real**2 + spectrum.imag**2).astype(np.float32) @ self._mapping
+        db = 10 * np.log10(np.maximum(power / self._reference, _AMPLITUDE_MIN))
+        self.geometry.frame_count += frame_count
+        return self._cut_tiles(quantize_db(db, self.geometry.min_db))
+
+    def finish(self) -> List[bytes]:
+        """The last tile, padded with silence"""
+        if len(self._tile) == 0:
+            return []
+        padding = np.zeros((self.geometry.tile_width - len(self._tile), self.geometry.bin_count), dtype=np.uint8)
+        tile = np.concatenate((self._tile, padding))
+        self._tile = self._tile[:0]
+        return [tile.tobytes()]
+
+    def _cut_tiles(self, rows: np.ndarray) -> List[bytes]:
+        rows = np.concatenate((self._tile, rows))
+        tile_width = self.geometry.tile_width
+        complete = len(rows) // tile_width * tile_width
+        self._tile = rows[complete:]
+        return [rows[start : start + tile_width].tobytes() for start in range(0, complete, tile_width)]
+
+
+def compute_spectrogram(pcm_path: str, geometry: SpectrogramGeometry) -> Tuple[SpectrogramGeometry, np.ndarray]:
+    """Tiles of a PCM cache file as one (tiles * tile_width, bins) array, runs in the analysis processes"""
+    builder = SpectrogramBuilder(geometry)
+    tiles = []
+    for block in iterate_blocks(np.load(pcm_path, mmap_mode="r")):
+        tiles.extend(builder.push(block))
+    tiles.extend(builder.finish())
+    return builder.geometry, np.frombuffer(b"".join(tiles), dtype=np.uint8).reshape(-1, geometry.bin_count)
@@ -0,0 +1,114 @@
+from dataclasses import dataclass
+import math
+from typing import List, Sequence, Tuple
+
+import numpy as np
+
+from tapearchive.analysis.pcm_cache import to_mono
+
+DEFAULT_LEVELS = (256, 2048, 16384)
+PEAK_VALUES = 3  # min, max, rms per pixel
+
+_QUANTIZED_TYPES = {
+    8: np.dtype("i1"),
+    16: np.dtype("<i2"),
+}
+
+
+@dataclass
+class PeakLevel:
+    samples_per_pixel: int
+    peaks: np.ndarray  # (pixels, 3) of min, max, rms in [-1, 1]
+
+    @property
+    def pixel_count(self) -> int:
+        return len(self.peaks)
+
+    def to_bytes(self, bits: int) -> bytes:
+        return quantize(self.peaks, bits).tobytes()
+
+
+def quantize(peaks: np.ndarray, bits: int) -> np.ndarray:
+    dtype = _QUANTIZED_TYPES[bits]
+    scale = np.iinfo(dtype).max
+    return np.round(np.clip(peaks, -1.0, 1.0) * scale).astype(dtype)
+
+
+def dequantize(data: bytes, bits: int) -> np.ndarray:
+    dtype = _QUANTIZED_TYPES[bits]
+    return np.frombuffer(data, dtype=dtype).reshape(-1, PEAK_VALUES).astype(np.float32) / np.iinfo(dtype).max
+
+
+def peak_byte_range(first_pixel: int, last_pixel: int, bits: int) -> Tuple[int, int]:
+    """Byte range [start, stop) of the pixels [first_pixel, last_pixel) in a quantized blob"""
+    pixel_size = PEAK_VALUES * bits // 8
+    return first_pixel * pixel_size, last_pixel * pixel_size
+
+
+def pixel_range(start_seconds: float, end_seconds: float, sample_rate: int, samples_per_pixel: int, pixel_count: int) -> Tuple[int, int]:
+    """Pixels covering the time range, clipped to the level"""
+    first_pixel = int(start_seconds * sample_rate) // samples_per_pixel
+    last_pixel = math.ceil(end_seconds * sample_rate / samples_per_pixel)
+    first_pixel = min(max(first_pixel, 0), pixel_count)
+    return first_pixel, min(max(last_pixel, first_pixel), pixel_count)
+
+
+class PeakBuilder:
+    """Min/max/RMS peaks of an audio stream at several zoom levels.
+
+    Blocks of any length are reduced to pixels of the finest level as they arrive, only the incomplete last pixel is
+    carried over to the next block. Coarser levels are reduced from the finest one, so the samples are visited once.
+    Channels are mixed down to mono.
+    """
+
+    def __init__(self, levels: Sequence[int] = DEFAULT_LEVELS):
+        levels = sorted(set(levels))
+        if not levels or levels[0] <= 0 or any(level % levels[0] for level in levels):
+            raise ValueError(f"Levels have to be multiples of the finest level: {levels}")
+
+        self._levels = levels
+        self._base = levels[0]
+        self._remainder = np.empty(0, dtype=np.float32)
+        self._mins: List[np.ndarray] = []
+        self._maxs: List[np.ndarray] = []
+        self._squares: List[np.ndarray] = []
+        self.sample_count = 0
+
+    def push(self, block: np.ndarray):
+        """`block` is either mono or (frames, channels), as read by soundfile"""
+        samples = to_mono(np.asarray(block, dtype=np.float32))
+        self.sample_count += len(samples)
+
+        if self._remainder.size:
+            samples = np.concatenate((self._remainder, samples))
+        full_length = len(samples) // self._base * self._base
+        if full_length:
+            self._reduce(samples[:full_length].reshape(-1, self._base))
+        self._remainder = samples[full_length:].copy()
+
+    def _reduce(self, frames: np.ndarray):
+        self._mins.append(frames.min(axis=1))
+        self._maxs.append(frames.max(axis=1))
+        self._squares.append(np.square(frames, dtype=np.float64).sum(axis=1))
+
+    def finish(self) -> List[PeakLevel]:
+        if self._remainder.size:
+            self._reduce(self._remainder.reshape(1, -1))
+            self._remainder = np.empty(0, dtype=np.float32)
+
+        if not self._mins:
+            return [PeakLevel(level, np.empty((0, PEAK_VALUES), dtype=np.float32)) for level in self._levels]
+
+        mins = np.concatenate(self._mins)
+        maxs = np.concatenate(self._maxs)
+        squares = np.concatenate(self._squares)
+        counts = np.full(len(mins), self._base, dtype=np.float64)
+        counts[-1] = self.sample_count - (len(mins) - 1) * self._base
+
+        levels = []
+        for level in self._levels:
+            starts = np.arange(0, len(mins), level // self._base)
+            rms = np.sqrt(np.add.reduceat(squares, starts) / np.add.reduceat(counts, starts))
+            peaks = np.stack((np.minimum.reduceat(mins, starts), np.maximum.reduceat(maxs, starts), rms), axis=1)
+            levels.append(PeakLevel(level, peaks.astype(np.float32)))
+        return levels
@@ -0,0 +1,78 @@
+from uuid import UUID
+
+from flask import Response, request
+from flask_restful import Resource
+import gridfs.errors
+from pymongo import MongoClient
+
+from tapearchive.api import http_cache
+from tapearchive.api.catalog import CatalogController
+from tapearchive.models.audiogram import AudiogramTileDao, audiogram_geometry, find_audiogram
+from tapearchive.models.cache import LRUCache
+from tapearchive.models.catalog import Attachment
+
+# The url stays the same when the audiogram is regenerated, clients revalidate with the ETag of the audiogram file
+AUDIOGRAM_CACHE_CONTROL = "public, no-cache"
+
+
+class AudiogramController:
+    def __init__(self, mongo_client: MongoClient, cache_size: int = 256):
+        self._tile_dao = AudiogramTileDao(mongo_client)
+        # (audiogram file id, level, x) -> tile
+        self._tiles: LRUCache[bytes] = LRUCache(cache_size)
+
+    def get_tile(self, audiogram: Attachment, level: int, x: int) -> bytes:
+        """Upper levels are pooled on the first request, nobody precomputes the whole pyramid"""
+        key = (audiogram.file_id, level, x)
+        data = self._tiles.get(key)
+        if data is None:
+            data = self._tile_dao.get_tile(audiogram, level, x)
+            self._tiles.put(key, data)
+        return data
+
+
+class AudiogramTileView(Resource):
+    """Tile `x` of zoom level `level` of the audiogram of an audio attachment.
+
+    The body is the raw tile: `X-Audiogram-Tile-Width` frames of `X-Audiogram-Bin-Count` bytes, frame major. Bytes map
+    linearly to decibels from `X-Audiogram-Min-Db` (0) to full scale (255), rows are geometrically spaced between
+    `X-Audiogram-Min-Frequency` and `X-Audiogram-Max-Frequency`.
+    """
+
+    def __init__(self, catalog_controller: CatalogController, audiogram_controller: AudiogramController):
+        self.catalog_controller = catalog_controller
+        self.controller = audiogram_controller
+
+    def get(self, catalog_id: str, attachment_id: str, level: int, x: int) -> Response:
+        entry = self.catalog_controller.get_catalog_entry(UUID(catalog_id))
+        audiogram = find_audiogram(entry, UUID(attachment_id)) if entry is not None else None
+        if audiogram is None or audiogram.file_id is None:
+            return {"message": f"No audiogram of attachment {attachment_id} in catalog {catalog_id}"}, 404
+
+        geometry = audiogram_geometry(audiogram)
+        if not geometry.has_tile(level, x):
+            return {"message": f"No tile {x} on level {level}, levels are 0 to {geometry.deepest_level}"}, 404
+
+        etag = http_cache.make_etag(audiogram.file_id, level, x)
+        if http_cache.is_not_modified(request.if_none_match, etag):
+            return http_cache.not_modified_response(etag, None, cache_control=AUDIOGRAM_CACHE_CONTROL)
+
+        try:
+            data = self.controller.get_tile(audiogram, level, x)
+        except gridfs.errors.NoFile:
+            return {"message": f"No audiogram of attachment {attachment_id} in catalog {catalog_id}"}, 404
+
+        frames_per_tile = geometry.frames_per_tile(level)
+        seconds_per_frame = frames_per_tile / geometry.tile_width / geometry.frames_per_second
+        response = Response(data, mimetype="application/octet-stream")
+        response.headers["X-Audiogram-Levels"] = str(geometry.deepest_level + 1)
+        response.headers["X-Audiogram-Tile-Width"] = str(geometry.tile_width)
+        response.headers["X-Audiogram-Bin-Count"] = str(geometry.bin_count)
+        response.headers["X-Audiogram-Start-Seconds"] = str(x * frames_per_tile / geometry.frames_per_second)
+        response.headers["X-Audiogram-Seconds-Per-Frame"] = str(seconds_per_frame)
+        response.headers["X-Audiogram-Min-Db"] = str(geometry.min_db)
+        response.headers["X-Audiogram-Min-Frequency"] = str(geometry.min_frequency)
+        response.headers["X-Audiogram-Max-Frequency"] = str(geometry.bin_frequencies()[-1])
+        response.set_etag(etag)
+        response.headers["Cache-Control"] = AUDIOGRAM_CACHE_CONTROL
+        return response
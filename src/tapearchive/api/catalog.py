@@ -1,33 +1,248 @@
-from typing import List, Tuple
+import base64
+import json
+from typing import Any, Dict, Iterator, List, Optional, Tuple
 from uuid import UUID
-from flask_restful import Resource
-import redis
+from flask import Response, request, stream_with_context
+from flask_restful import Resource, reqparse
+from pymongo import MongoClient
 
-from tapearchive.models.catalog import CatalogDao, CatalogEntry
+from tq.database import CustomJSONEncoder
+
+from tapearchive.api import http_cache
+from tapearchive.models.cache import LRUCache
+from tapearchive.models.catalog import (
+    SEARCH_FACETS,
+    SUMMARY_FIELDS,
+    Attachment,
+    CatalogDao,
+    CatalogEntry,
+    CatalogSearchResult,
+    find_attachment,
+)
+
+MAX_PAGE_SIZE = 1000
+DEFAULT_PAGE_SIZE = 100
+MAX_SEARCH_PAGE_SIZE = 100
+DEFAULT_SEARCH_PAGE_SIZE = 20
+MAX_BATCH_SIZE = 500
 
 
 class CatalogController:
-    def __init__(self, connection_pool: redis.ConnectionPool):
-        self._catalog_dao = CatalogDao(connection_pool)
+    def __init__(self, mongo_client: MongoClient, cache_size: int = 1024):
+        self._catalog_dao = CatalogDao(mongo_client, cache_size=cache_size)
+        # (id, version, content encoding) -> response body
+        self._encoded_entries: LRUCache[bytes] = LRUCache(cache_size)
+        self._catalog_dao.ensure_indexes()
+        # Keeps cached entries hot without a version lookup per request, where the Mongo deployment allows
+        self._catalog_dao.start_change_stream()
 
     def get_catalog_entry(self, id: UUID) -> CatalogEntry:
         return self._catalog_dao.get_entity(id)
 
+    def get_attachment(self, id: UUID, attachment_id: UUID) -> Optional[Attachment]:
+        entry = self._catalog_dao.get_entity(id)
+        return find_attachment(entry, attachment_id) if entry is not None else None
+
+    def get_catalog_version(self, id: UUID) -> int:
+        return self._catalog_dao.get_current_version(id)
+
+    def get_encoded_catalog_entry(self, id: UUID, version: int, encoding: Optional[str]) -> Optional[bytes]:
+        """JSON body of a catalog entry, encoded once per version and content encoding"""
+        body = self._encoded_entries.get((id, version, encoding))
+        if body is not None:
+            return body
+
+        if encoding is None:
+            entry = self._catalog_dao.get_entity(id)
+            if entry is None:
+                return None
+            body = json.dumps(entry, cls=CustomJSONEncoder).encode("UTF-8")
+        else:
+            body = self.get_encoded_catalog_entry(id, version, None)
+            if body is None:
+                return None
+            body = http_cache.compress(body, encoding)
+
+        self._encoded_entries.put((id, version, encoding), body)
+        return body
+
+    def get_catalog_entries(self, ids: List[UUID], names: List[str], fields: Optional[List[str]] = None) -> List[Any]:
+        """Entries in the order they were requested, first by ids then by names. Missing entries are left out."""
+        if fields:
+            items = self._catalog_dao.get_entity_summaries(fields, ids=ids, names=names)
+            by_id = dict((item["id"], item) for item in items)
+            by_name = dict((item["name"], item) for item in items)
+        else:
+            items = self._catalog_dao.get_entities(ids=ids, names=names)
+            by_id = dict((item.id, item) for item in items)
+            by_name = dict((item.name, item) for item in items)
+
+        result = [by_id[id] for id in ids if id in by_id]
+        result.extend(by_name[name] for name in names if name in by_name)
+        return result
+
     def get_all_catalog_names(self) -> List[list]:
-        return self._catalog_dao.get_all_cat_names()
+        return list(self._catalog_dao.get_all_catalog_names())
+
+    def get_catalog_names_page(
+        self,
+        limit: int,
+        cursor: Optional[str] = None,
+        prefix: Optional[str] = None,
+        sort_by: str = "name",
+        descending: bool = False,
+    ) -> Iterator[Tuple[UUID, str]]:
+        after_name, after_id = decode_cursor(cursor) if cursor else (None, None)
+        return self._catalog_dao.get_catalog_names_page(
+            limit,
+            after_name=after_name,
+            after_id=after_id,
+            prefix=prefix,
+            sort_by=sort_by,
+            descending=descending,
+        )
+
+    def search(self, text: Optional[str], filters: Dict[str, str], page: int, page_size: int) -> CatalogSearchResult:
+        return self._catalog_dao.search(text, filters=filters, page=page, page_size=page_size)
+
+
+def encode_cursor(name: str, id: UUID) -> str:
+    return base64.urlsafe_b64encode(json.dumps([name, str(id)]).encode("UTF-8")).decode("ascii")
+
+
+def decode_cursor(cursor: str) -> Tuple[str, UUID]:
+    try:
+        name, id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        return name, UUID(id)
+    except (ValueError, TypeError) as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+
+def stream_catalog_names_page(items: Iterator[Tuple[UUID, str]], limit: int) -> Iterator[str]:
+    """Writes the page as JSON while the Mongo cursor is being read. One extra item is expected from `items` to tell
+    whether a next page exists.
+    """
+    yield '{"items": ['
+    last_item = None
+    has_more = False
+    for index, (id, name) in enumerate(items):
+        if index == limit:
+            has_more = True
+            break
+        if last_item is not None:
+            yield ", "
+        yield json.dumps({"id": str(id), "name": name})
+        last_item = id, name
+
+    next_cursor = encode_cursor(last_item[1], last_item[0]) if has_more else None
+    yield f'], "next_cursor": {json.dumps(next_cursor)}}}'
 
 
 class CatalogEntryView(Resource):
     def __init__(self, catalog_controller: CatalogController):
         self.controller = catalog_controller
 
-    def get(self, catalog_name: str) -> CatalogEntry:
-        return self.controller.get_catalog_entry(UUID(catalog_name))
+    def get(self, catalog_name: str) -> Response:
+        id = UUID(catalog_name)
+        version = self.controller.get_catalog_version(id)
+        etag = http_cache.make_etag(id, version)
+
+        # Also tells whether the entry exists, missing ids have version 0 and must not be answered with a 304
+        body = self.controller.get_encoded_catalog_entry(id, version, None)
+        if body is None:
+            return {"message": f"Catalog entry {id} not found"}, 404
+
+        # Decided the same way for the 304, so it carries the ETag of the representation the client holds
+        encoding = http_cache.choose_encoding(request)
+        if len(body) < http_cache.MIN_COMPRESS_SIZE:
+            encoding = None
+
+        if http_cache.is_not_modified(request.if_none_match, etag):
+            return http_cache.not_modified_response(etag, encoding)
+
+        if encoding is not None:
+            body = self.controller.get_encoded_catalog_entry(id, version, encoding)
+        return http_cache.encoded_response(body, etag, encoding)
 
 
 class CatalogListView(Resource):
     def __init__(self, catalog_controller: CatalogController):
         self.controller = catalog_controller
 
+        self._parser = reqparse.RequestParser()
+        self._parser.add_argument("limit", type=int, default=DEFAULT_PAGE_SIZE, location="args")
+        self._parser.add_argument("cursor", type=str, default=None, location="args")
+        self._parser.add_argument("prefix", type=str, default=None, location="args")
+        self._parser.add_argument("sort", type=str, choices=("name", "id"), default="name", location="args")
+        self._parser.add_argument("order", type=str, choices=("asc", "desc"), default="asc", location="args")
+
     def get(self):
-        return self.controller.get_all_catalog_names()
+        args = self._parser.parse_args()
+        limit = max(1, min(args.limit, MAX_PAGE_SIZE))
+
+        try:
+            items = self.controller.get_catalog_names_page(
+                limit + 1,
+                cursor=args.cursor,
+                prefix=args.prefix,
+                sort_by=args.sort,
+                descending=args.order == "desc",
+            )
+        except ValueError as e:
+            return {"message": str(e)}, 400
+
+        return Response(stream_with_context(stream_catalog_names_page(items, limit)), mimetype="application/json")
+
+
+class CatalogSearchView(Resource):
+    def __init__(self, catalog_controller: CatalogController):
+        self.controller = catalog_controller
+
+        self._parser = reqparse.RequestParser()
+        self._parser.add_argument("q", type=str, default=None, location="args")
+        self._parser.add_argument("page", type=int, default=0, location="args")
+        self._parser.add_argument("page_size", type=int, default=DEFAULT_SEARCH_PAGE_SIZE, location="args")
+        for facet_name in SEARCH_FACETS:
+            self._parser.add_argument(facet_name, type=str, default=None, location="args")
+
+    def get(self) -> CatalogSearchResult:
+        args = self._parser.parse_args()
+        filters = dict((facet_name, args[facet_name]) for facet_name in SEARCH_FACETS if args[facet_name])
+
+        return self.controller.search(
+            args.q,
+            filters,
+            page=max(0, args.page),
+            page_size=max(1, min(args.page_size, MAX_SEARCH_PAGE_SIZE)),
+        )
+
+
+class CatalogBatchView(Resource):
+    """Fetches multiple catalog entries in one request.
+    Body: `{"ids": [...], "names": [...], "fields": [...]}`, `fields` is optional and selects a summary projection.
+    """
+
+    def __init__(self, catalog_controller: CatalogController):
+        self.controller = catalog_controller
+
+        self._parser = reqparse.RequestParser()
+        self._parser.add_argument("ids", type=str, action="append", default=[], location="json")
+        self._parser.add_argument("names", type=str, action="append", default=[], location="json")
+        self._parser.add_argument("fields", type=str, action="append", default=[], location="json")
+
+    def post(self):
+        args = self._parser.parse_args()
+
+        if len(args.ids) + len(args.names) > MAX_BATCH_SIZE:
+            return {"message": f"At most {MAX_BATCH_SIZE} entries can be fetched at once"}, 400
+
+        unknown_fields = set(args.fields) - set(SUMMARY_FIELDS)
+        if unknown_fields:
+            return {"message": f"Unknown fields: {', '.join(sorted(unknown_fields))}"}, 400
+
+        try:
+            ids = [UUID(id) for id in args.ids]
+        except ValueError as e:
+            return {"message": f"Invalid id: {e}"}, 400
+
+        return {"items": self.controller.get_catalog_entries(ids, args.names, fields=args.fields)}
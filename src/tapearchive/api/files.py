@@ -0,0 +1,96 @@
+import mimetypes
+from typing import Iterator
+
+from flask import Response, request
+from flask_restful import Resource
+import gridfs
+import gridfs.errors
+from pymongo import MongoClient
+
+from tapearchive.api import http_cache
+from tapearchive.metrics import GRIDFS_BYTES
+from tapearchive.models.raw_data import FileDao
+
+# Stored files never change, a new version is always a new file
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
+class FileController:
+    def __init__(self, mongo_client: MongoClient):
+        self._file_dao = FileDao(mongo_client)
+
+    def open_file(self, file_id: str) -> gridfs.GridOut:
+        return self._file_dao.open_download_stream(file_id)
+
+
+def stream_file_range(grid_out: gridfs.GridOut, start: int, stop: int) -> Iterator[bytes]:
+    """Yields bytes [start, stop) one GridFS chunk at a time, seeking only touches the chunk containing `start`"""
+    try:
+        grid_out.seek(start)
+        remaining = stop - start
+        while remaining > 0:
+            data = grid_out.read(min(grid_out.chunk_size, remaining))
+            if not data:
+                break
+            remaining -= len(data)
+            GRIDFS_BYTES.labels("read").inc(len(data))
+            yield data
+    finally:
+        grid_out.close()
+
+
+def is_range_fresh(grid_out: gridfs.GridOut, etag: str) -> bool:
+    """Evaluates If-Range, a stale validator means the whole file has to be sent"""
+    if_range = request.if_range
+    if if_range.etag is not None:
+        return if_range.etag == etag
+    if if_range.date is not None:
+        return grid_out.upload_date is not None and grid_out.upload_date.replace(microsecond=0) <= if_range.date.replace(tzinfo=None)
+    return True
+
+
+class FileStreamView(Resource):
+    def __init__(self, file_controller: FileController):
+        self.controller = file_controller
+
+    def get(self, file_id: str) -> Response:
+        try:
+            grid_out = self.controller.open_file(file_id)
+        except gridfs.errors.NoFile:
+            return {"message": f"File {file_id} not found"}, 404
+
+        length = grid_out.length
+        etag = http_cache.make_etag(file_id, length)
+
+        if http_cache.is_not_modified(request.if_none_match, etag):
+            grid_out.close()
+            return http_cache.not_modified_response(etag, None, cache_control=IMMUTABLE_CACHE_CONTROL)
+
+        start, stop, status = 0, length, 200
+        # Multipart byteranges are not supported, those requests get the whole file
+        if request.range is not None and len(request.range.ranges) == 1 and is_range_fresh(grid_out, etag):
+            byte_range = request.range.range_for_length(length)
+            if byte_range is None:
+                grid_out.close()
+                response = Response(status=416)
+                response.headers["Content-Range"] = f"bytes */{length}"
+                return response
+            start, stop = byte_range
+            status = 206
+
+        mimetype = mimetypes.guess_type(grid_out.filename or "")[0] or "application/octet-stream"
+        response = Response(
+            stream_file_range(grid_out, start, stop),
+            status=status,
+            mimetype=mimetype,
+            direct_passthrough=True,
+        )
+        response.content_length = stop - start
+        if status == 206:
+            response.headers["Content-Range"] = f"bytes {start}-{stop - 1}/{length}"
+        response.headers["Accept-Ranges"] = "bytes"
+        response.set_etag(etag)
+        if grid_out.upload_date is not None:
+            response.last_modified = grid_out.upload_date
+        response.headers["Cache-Control"] = IMMUTABLE_CACHE_CONTROL
+        return response
@@ -0,0 +1,101 @@
+import math
+from typing import List, Optional
+from uuid import UUID
+
+from flask_restful import Resource, reqparse
+from pymongo import MongoClient
+
+from tapearchive.analysis.fingerprint import vote
+from tapearchive.models.fingerprint import DuplicateCandidate, FingerprintDao
+
+DEFAULT_MIN_MATCHES = 10
+MAX_CANDIDATES = 100
+DEFAULT_QUERY_SECONDS = 30.0  # a few seconds of music are enough to find it, every second costs lookups
+MAX_QUERY_SECONDS = 300.0
+
+
+class FingerprintController:
+    def __init__(self, mongo_client: MongoClient):
+        self._fingerprint_dao = FingerprintDao(mongo_client)
+        self._fingerprint_dao.ensure_indexes()
+
+    def find_duplicates(
+        self,
+        catalog_id: UUID,
+        recording_id: UUID,
+        start_seconds: float = 0.0,
+        end_seconds: Optional[float] = None,
+        min_matches: int = DEFAULT_MIN_MATCHES,
+        limit: int = MAX_CANDIDATES,
+    ) -> Optional[List[DuplicateCandidate]]:
+        """Other recordings sharing music with a time range of a recording, most matching first.
+        The range is DEFAULT_QUERY_SECONDS long unless `end_seconds` is given, and at most MAX_QUERY_SECONDS.
+        None if the recording has no fingerprint.
+        """
+        fingerprint = self._fingerprint_dao.get_fingerprint(recording_id)
+        if fingerprint is None or fingerprint.catalog_id != catalog_id:
+            return None
+
+        if end_seconds is None:
+            end_seconds = start_seconds + DEFAULT_QUERY_SECONDS
+        end_seconds = min(end_seconds, start_seconds + MAX_QUERY_SECONDS)
+        hashes, frames = self._fingerprint_dao.get_landmarks(
+            recording_id,
+            start_frame=int(start_seconds * fingerprint.frames_per_second),
+            end_frame=math.ceil(end_seconds * fingerprint.frames_per_second),
+        )
+
+        found_hashes, found_frames, candidates, recording_ids = self._fingerprint_dao.find_landmarks(
+            hashes, exclude_id=recording_id
+        )
+        votes = vote(hashes, frames, found_hashes, found_frames, candidates, min_matches=min_matches, limit=limit)
+
+        fingerprints = self._fingerprint_dao.get_fingerprints([recording_ids[v.candidate] for v in votes])
+        result = []
+        for offset_vote in votes:
+            candidate = fingerprints.get(recording_ids[offset_vote.candidate])
+            if candidate is None:
+                continue  # deleted meanwhile
+            seconds_per_frame = 1 / fingerprint.frames_per_second
+            result.append(
+                DuplicateCandidate(
+                    catalog_id=candidate.catalog_id,
+                    recording_id=candidate.id,
+                    matches=offset_vote.matches,
+                    offset_seconds=offset_vote.offset_frames * seconds_per_frame,
+                    start_seconds=offset_vote.query_start_frame * seconds_per_frame,
+                    end_seconds=offset_vote.query_end_frame * seconds_per_frame,
+                )
+            )
+        return result
+
+
+class DuplicatesView(Resource):
+    """Recordings in the archive which contain music of a recording, with the time offset of the match.
+    `start` and `end` select the range of the recording to look for in seconds, eg. a single track of a tape side. It
+    is DEFAULT_QUERY_SECONDS from `start` by default, and at most MAX_QUERY_SECONDS long.
+    """
+
+    def __init__(self, fingerprint_controller: FingerprintController):
+        self.controller = fingerprint_controller
+
+        self._parser = reqparse.RequestParser()
+        self._parser.add_argument("start", type=float, default=0.0, location="args")
+        self._parser.add_argument("end", type=float, location="args")
+        self._parser.add_argument("min_matches", type=int, default=DEFAULT_MIN_MATCHES, location="args")
+        self._parser.add_argument("limit", type=int, default=MAX_CANDIDATES, location="args")
+
+    def get(self, catalog_id: str, recording_id: str):
+        args = self._parser.parse_args()
+
+        candidates = self.controller.find_duplicates(
+            UUID(catalog_id),
+            UUID(recording_id),
+            start_seconds=args.start,
+            end_seconds=args.end,
+            min_matches=max(1, args.min_matches),
+            limit=max(1, min(args.limit, MAX_CANDIDATES)),
+        )
+        if candidates is None:
+            return {"message": f"No fingerprint of recording {recording_id} in catalog {catalog_id}"}, 404
+        return {"candidates": candidates}
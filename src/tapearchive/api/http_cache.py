@@ -0,0 +1,97 @@
+import gzip
+from typing import Iterable, Optional
+
+from flask import Request, Response
+from werkzeug.datastructures import ETags
+
+try:
+    import brotli
+except ImportError:  # Optional, gzip is always available
+    brotli = None
+
+MIN_COMPRESS_SIZE = 1024
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+COMPRESSIBLE_MIMETYPES = ("application/json", "text/plain", "text/html", "text/css", "application/javascript")
+
+
+def supported_encodings() -> Iterable[str]:
+    return ("br", "gzip") if brotli is not None else ("gzip",)
+
+
+def choose_encoding(request: Request) -> Optional[str]:
+    for encoding in supported_encodings():
+        if request.accept_encodings[encoding]:
+            return encoding
+    return None
+
+
+def compress(data: bytes, encoding: Optional[str]) -> bytes:
+    if encoding == "br":
+        return brotli.compress(data, quality=BROTLI_QUALITY)
+    if encoding == "gzip":
+        return gzip.compress(data, compresslevel=GZIP_LEVEL)
+    return data
+
+
+def make_etag(*parts) -> str:
+    return "-".join(str(part) for part in parts)
+
+
+def representation_etag(etag: str, encoding: Optional[str]) -> str:
+    """Strong ETags have to differ between content codings of the same entity"""
+    return f"{etag}-{encoding}" if encoding else etag
+
+
+def is_not_modified(if_none_match: ETags, etag: str) -> bool:
+    return any(if_none_match.contains(representation_etag(etag, encoding)) for encoding in (None, *supported_encodings()))
+
+
+def not_modified_response(etag: str, encoding: Optional[str], cache_control: str = "no-cache") -> Response:
+    response = Response(status=304)
+    response.set_etag(representation_etag(etag, encoding))
+    response.headers["Cache-Control"] = cache_control
+    response.vary.add("Accept-Encoding")
+    return response
+
+
+def encoded_response(
+    body: bytes,
+    etag: str,
+    encoding: Optional[str],
+    mimetype: str = "application/json",
+    cache_control: str = "no-cache",
+) -> Response:
+    response = Response(body, mimetype=mimetype)
+    if encoding:
+        response.headers["Content-Encoding"] = encoding
+    response.set_etag(representation_etag(etag, encoding))
+    response.headers["Cache-Control"] = cache_control
+    response.vary.add("Accept-Encoding")
+    return response
+
+
+def compress_response(request: Request, response: Response, min_size: int = MIN_COMPRESS_SIZE) -> Response:
+    """after_request hook, compresses buffered responses which were not encoded by their view"""
+    if (
+        response.status_code != 200
+        or response.direct_passthrough
+        or response.is_streamed
+        or "Content-Encoding" in response.headers
+        or response.mimetype not in COMPRESSIBLE_MIMETYPES
+    ):
+        return response
+
+    encoding = choose_encoding(request)
+    if encoding is None:
+        return response
+
+    data = response.get_data()
+    if len(data) < min_size:
+        return response
+
+    response.set_data(compress(data, encoding))
+    response.headers["Content-Encoding"] = encoding
+    response.vary.add("Accept-Encoding")
+    return response
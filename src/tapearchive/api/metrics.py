@@ -0,0 +1,29 @@
+import time
+
+from flask import Request, Response, g
+from flask_restful import Resource
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+
+from tapearchive import metrics
+
+
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+
+def observe_request(request: Request, response: Response) -> Response:
+    started = g.pop("request_started", None)
+    if started is not None:
+        # The rule keeps the label cardinality bounded, unlike the path
+        endpoint = request.url_rule.rule if request.url_rule is not None else "<unmatched>"
+        metrics.API_REQUEST_LATENCY.labels(request.method, endpoint, response.status_code).observe(
+            time.perf_counter() - started
+        )
+    return response
+
+
+class MetricsView(Resource):
+    """Prometheus metrics of the web api"""
+
+    def get(self) -> Response:
+        return Response(generate_latest(metrics.get_registry()), content_type=CONTENT_TYPE_LATEST)
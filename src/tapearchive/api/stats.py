@@ -0,0 +1,25 @@
+from datetime import timedelta
+from flask_restful import Resource
+from pymongo import MongoClient
+
+from tapearchive.models.catalog import CatalogDao
+from tapearchive.models.stats import ArchiveStats, ArchiveStatsAggregator, CatalogStatsDao
+
+
+class StatsController:
+    def __init__(self, mongo_client: MongoClient, refresh_interval: timedelta = timedelta(minutes=1)):
+        self._aggregator = ArchiveStatsAggregator(CatalogDao(mongo_client, cache_size=0), CatalogStatsDao(mongo_client))
+        self._refresh_interval = refresh_interval
+
+    def get_stats(self) -> ArchiveStats:
+        if self._aggregator.is_fresh(self._refresh_interval):
+            return self._aggregator.snapshot
+        return self._aggregator.refresh(max_age=self._refresh_interval)
+
+
+class StatsView(Resource):
+    def __init__(self, stats_controller: StatsController):
+        self.controller = stats_controller
+
+    def get(self) -> ArchiveStats:
+        return self.controller.get_stats()
@@ -0,0 +1,73 @@
+import pathlib
+from uuid import UUID
+
+from flask import Response, request
+from flask_restful import Resource
+import gridfs.errors
+from pymongo import MongoClient
+
+from tapearchive.api import http_cache
+from tapearchive.api.catalog import CatalogController
+from tapearchive.models.cache import LRUCache
+from tapearchive.models.catalog import Attachment
+from tapearchive.models.thumbnails import THUMBNAIL_ATTACHMENT_TYPES, ThumbnailDao
+from tapearchive.utils import images
+
+# The url stays the same if the scan is replaced, so it is not immutable, but a week of staleness is acceptable
+THUMBNAIL_CACHE_CONTROL = "public, max-age=604800"
+
+
+class ThumbnailController:
+    def __init__(self, mongo_client: MongoClient, data_directory: pathlib.Path, cache_size: int = 256):
+        self._thumbnail_dao = ThumbnailDao(mongo_client, data_directory=data_directory)
+        # (attachment id, source id, size) -> JPEG
+        self._thumbnails: LRUCache[bytes] = LRUCache(cache_size)
+
+    def source_id(self, attachment: Attachment) -> str:
+        return self._thumbnail_dao.source_id(attachment)
+
+    def get_thumbnail(self, attachment: Attachment, size: int) -> bytes:
+        """Rendered on the first request if it was not created on ingest"""
+        key = (attachment.id, self.source_id(attachment), size)
+        data = self._thumbnails.get(key)
+        if data is not None:
+            return data
+
+        data = self._thumbnail_dao.get_thumbnail(attachment, size)
+        if data is None:
+            data = self._thumbnail_dao.create_thumbnails(attachment, [size])[size]
+
+        self._thumbnails.put(key, data)
+        return data
+
+
+class ThumbnailView(Resource):
+    def __init__(self, catalog_controller: CatalogController, thumbnail_controller: ThumbnailController):
+        self.catalog_controller = catalog_controller
+        self.controller = thumbnail_controller
+
+    def get(self, catalog_id: str, attachment_id: str, size: int) -> Response:
+        if size not in images.THUMBNAIL_SIZES:
+            return {"message": f"Thumbnail sizes are {', '.join(str(s) for s in images.THUMBNAIL_SIZES)}"}, 404
+        if not images.is_supported():
+            return {"message": "Thumbnails are not supported by this server"}, 501
+
+        attachment = self.catalog_controller.get_attachment(UUID(catalog_id), UUID(attachment_id))
+        if attachment is None or attachment.type not in THUMBNAIL_ATTACHMENT_TYPES:
+            return {"message": f"No image attachment {attachment_id} in catalog {catalog_id}"}, 404
+
+        etag = http_cache.make_etag(attachment.id, size, self.controller.source_id(attachment))
+        if http_cache.is_not_modified(request.if_none_match, etag):
+            return http_cache.not_modified_response(etag, None, cache_control=THUMBNAIL_CACHE_CONTROL)
+
+        try:
+            data = self.controller.get_thumbnail(attachment, size)
+        except (FileNotFoundError, gridfs.errors.NoFile):
+            return {"message": f"Attachment {attachment_id} has no stored file"}, 404
+        except OSError:
+            return {"message": f"Attachment {attachment_id} is not a readable image"}, 415
+
+        response = Response(data, mimetype=images.THUMBNAIL_MIMETYPE)
+        response.set_etag(etag)
+        response.headers["Cache-Control"] = THUMBNAIL_CACHE_CONTROL
+        return response
@@ -0,0 +1,134 @@
+from uuid import UUID
+
+from flask import Response, request
+from flask_restful import Resource, reqparse
+from pymongo import MongoClient
+
+from tapearchive.models.uploads import CHECKSUM_ALGORITHM, UploadConflict, UploadDao, UploadSession
+
+UPLOAD_CONTENT_TYPE = "application/offset+octet-stream"
+
+
+class UploadController:
+    def __init__(self, mongo_client: MongoClient):
+        self._upload_dao = UploadDao(mongo_client)
+
+    def create_upload(self, filename: str, length: int) -> UploadSession:
+        return self._upload_dao.create_session(filename, length)
+
+    def get_upload(self, id: UUID) -> UploadSession:
+        return self._upload_dao.get_session(id)
+
+    def append(self, id: UUID, offset: int, stream) -> int:
+        return self._upload_dao.append(id, offset, stream)
+
+    def finalize(self, id: UUID) -> UploadSession:
+        return self._upload_dao.finalize(id)
+
+    def abort(self, id: UUID):
+        self._upload_dao.abort(id)
+
+
+def upload_status(session: UploadSession) -> dict:
+    status = {
+        "id": str(session.id),
+        "filename": session.filename,
+        "length": session.length,
+        "offset": session.offset,
+        "chunk_size": session.chunk_size,
+        "is_finalized": session.is_finalized,
+    }
+    if session.is_finalized:
+        status["file_id"] = session.file_id
+        status["checksum"] = session.checksum_state
+        status["checksum_algorithm"] = CHECKSUM_ALGORITHM
+    return status
+
+
+def offset_headers(session: UploadSession) -> dict:
+    return {
+        "Upload-Offset": str(session.offset),
+        "Upload-Length": str(session.length),
+        "Cache-Control": "no-store",
+    }
+
+
+class UploadListView(Resource):
+    """Creates an upload: `{"filename": ..., "length": ...}`"""
+
+    def __init__(self, upload_controller: UploadController):
+        self.controller = upload_controller
+
+        self._parser = reqparse.RequestParser()
+        self._parser.add_argument("filename", type=str, required=True, location="json")
+        self._parser.add_argument("length", type=int, required=True, location="json")
+
+    def post(self):
+        args = self._parser.parse_args()
+        if args.length < 0:
+            return {"message": "Length cannot be negative"}, 400
+
+        session = self.controller.create_upload(args.filename, args.length)
+        headers = offset_headers(session)
+        headers["Location"] = f"{request.base_url.rstrip('/')}/{session.id}"
+        return upload_status(session), 201, headers
+
+
+class UploadView(Resource):
+    """Status (HEAD/GET), chunk upload (PATCH with Upload-Offset) and abort (DELETE) of an upload, tus style"""
+
+    def __init__(self, upload_controller: UploadController):
+        self.controller = upload_controller
+
+    def head(self, upload_id: str):
+        session = self.controller.get_upload(UUID(upload_id))
+        if session is None:
+            return Response(status=404)
+        return Response(status=200, headers=offset_headers(session))
+
+    def get(self, upload_id: str):
+        session = self.controller.get_upload(UUID(upload_id))
+        if session is None:
+            return {"message": f"Upload {upload_id} not found"}, 404
+        return upload_status(session), 200, offset_headers(session)
+
+    def patch(self, upload_id: str):
+        if request.mimetype != UPLOAD_CONTENT_TYPE:
+            return {"message": f"Content-Type has to be {UPLOAD_CONTENT_TYPE}"}, 415
+
+        try:
+            offset = int(request.headers["Upload-Offset"])
+        except (KeyError, ValueError):
+            return {"message": "Missing or invalid Upload-Offset header"}, 400
+
+        id = UUID(upload_id)
+        try:
+            # The body is read chunk by chunk, it is never buffered as a whole
+            offset = self.controller.append(id, offset, request.stream)
+        except KeyError:
+            return {"message": f"Upload {upload_id} not found"}, 404
+        except UploadConflict as e:
+            return {"message": str(e)}, 409
+        except ValueError as e:
+            return {"message": str(e)}, 413
+
+        return Response(status=204, headers={"Upload-Offset": str(offset), "Cache-Control": "no-store"})
+
+    def delete(self, upload_id: str):
+        self.controller.abort(UUID(upload_id))
+        return Response(status=204)
+
+
+class UploadFinalizeView(Resource):
+    def __init__(self, upload_controller: UploadController):
+        self.controller = upload_controller
+
+    def post(self, upload_id: str):
+        try:
+            session = self.controller.finalize(UUID(upload_id))
+        except KeyError:
+            return {"message": f"Upload {upload_id} not found"}, 404
+        except UploadConflict as e:
+            return {"message": str(e)}, 409
+
+        return upload_status(session)
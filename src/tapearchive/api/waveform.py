@@ -0,0 +1,79 @@
+from typing import List, Optional
+from uuid import UUID
+
+from flask import Response, request
+from flask_restful import Resource, reqparse
+import gridfs.errors
+
+from tapearchive.analysis.waveform import peak_byte_range, pixel_range
+from tapearchive.api import http_cache
+from tapearchive.api.catalog import CatalogController
+from tapearchive.api.files import FileController, stream_file_range
+from tapearchive.models.catalog import WaveformLevel
+
+# The url stays the same when the waveform is regenerated, clients revalidate with the ETag of the peaks file
+WAVEFORM_CACHE_CONTROL = "public, no-cache"
+
+
+def select_level(levels: List[WaveformLevel], samples_per_pixel: Optional[int]) -> WaveformLevel:
+    """The coarsest level which is still at least as detailed as requested, the finest one otherwise"""
+    levels = sorted(levels, key=lambda level: level.samples_per_pixel)
+    if samples_per_pixel is None:
+        return levels[-1]
+    candidates = [level for level in levels if level.samples_per_pixel <= samples_per_pixel]
+    return candidates[-1] if candidates else levels[0]
+
+
+class WaveformView(Resource):
+    """Peaks of an audio attachment in a time range, at one zoom level.
+
+    The body is the raw quantized blob: (min, max, rms) signed integers of `X-Waveform-Bits` per pixel,
+    starting at pixel `X-Waveform-First-Pixel` of the level.
+    """
+
+    def __init__(self, catalog_controller: CatalogController, file_controller: FileController):
+        self.catalog_controller = catalog_controller
+        self.file_controller = file_controller
+
+        self._parser = reqparse.RequestParser()
+        self._parser.add_argument("samples_per_pixel", type=int, location="args")
+        self._parser.add_argument("start", type=float, default=0.0, location="args")
+        self._parser.add_argument("end", type=float, location="args")
+
+    def get(self, catalog_id: str, attachment_id: str) -> Response:
+        args = self._parser.parse_args()
+
+        attachment = self.catalog_controller.get_attachment(UUID(catalog_id), UUID(attachment_id))
+        waveform = getattr(attachment, "waveform", None)
+        if waveform is None or not waveform.levels:
+            return {"message": f"No waveform for attachment {attachment_id}"}, 404
+
+        level = select_level(waveform.levels, args.samples_per_pixel)
+        end = args.end if args.end is not None else waveform.sample_count / waveform.sample_rate
+        first_pixel, last_pixel = pixel_range(
+            args.start, end, waveform.sample_rate, level.samples_per_pixel, level.pixel_count
+        )
+
+        etag = http_cache.make_etag(level.file_id, first_pixel, last_pixel)
+        if http_cache.is_not_modified(request.if_none_match, etag):
+            return http_cache.not_modified_response(etag, None, cache_control=WAVEFORM_CACHE_CONTROL)
+
+        try:
+            grid_out = self.file_controller.open_file(level.file_id)
+        except gridfs.errors.NoFile:
+            return {"message": f"No waveform for attachment {attachment_id}"}, 404
+
+        start, stop = peak_byte_range(first_pixel, last_pixel, waveform.bits)
+        response = Response(
+            stream_file_range(grid_out, start, stop),
+            mimetype="application/octet-stream",
+            direct_passthrough=True,
+        )
+        response.content_length = stop - start
+        response.headers["X-Waveform-Sample-Rate"] = str(waveform.sample_rate)
+        response.headers["X-Waveform-Samples-Per-Pixel"] = str(level.samples_per_pixel)
+        response.headers["X-Waveform-First-Pixel"] = str(first_pixel)
+        response.headers["X-Waveform-Bits"] = str(waveform.bits)
+        response.set_etag(etag)
+        response.headers["Cache-Control"] = WAVEFORM_CACHE_CONTROL
+        return response
@@ -12,12 +12,17 @@ from tq.task_dispacher import TaskDispatcher
 from tq.redis_task_queue import RedisTaskQueue
 from tq.job_system import JobManager
 
+from tapearchive.analysis.executor import AnalysisExecutor
 from tapearchive.config import AppConfig
+from tapearchive.metrics import instrument_dispatcher, setup_task_queue_metrics
 
+from tapearchive.tasks.audio_analisis import FindKeyHandler
 from tapearchive.tasks.audio_convert import AudioConverterHandler
-
-# from tapearchive.workflow.tasks.audio_analisis import FindKeyHandler
-
+from tapearchive.tasks.audiogram import AudiogramHandler
+from tapearchive.tasks.fingerprint import FingerprintHandler
+from tapearchive.tasks.identify_tracks import IdentifyTracksHandler
+from tapearchive.tasks.thumbnails import ThumbnailHandler
+from tapearchive.tasks.waveform import WaveformHandler
 
 LOGGER = logging.getLogger(__name__)
 
@@ -28,9 +33,15 @@ def register_task_dispatchers(
     mongo_db: MongoClient,
     connection_pool: redis.ConnectionPool,
     config: AppConfig,
+    executor: AnalysisExecutor,
 ):
     dispatcher.register_task_handler(AudioConverterHandler(mongo_db, config=config))
-    # dispatcher.register_task_handler(FindKeyHandler(connection_pool, config=config))
+    dispatcher.register_task_handler(WaveformHandler(mongo_db, config=config))
+    dispatcher.register_task_handler(AudiogramHandler(mongo_db, config=config, executor=executor))
+    dispatcher.register_task_handler(ThumbnailHandler(mongo_db, config=config))
+    dispatcher.register_task_handler(FindKeyHandler(mongo_db, config=config, executor=executor))
+    dispatcher.register_task_handler(IdentifyTracksHandler(mongo_db, config=config, executor=executor))
+    dispatcher.register_task_handler(FingerprintHandler(mongo_db, config=config, executor=executor))
     pass
 
 
@@ -41,10 +52,13 @@ def create_dispatcher(
     stack: ExitStack,
 ) -> TaskDispatcher:
     task_queue = RedisTaskQueue(connection_pool)
+    # Shut down after the job manager, no handler is waiting for an analysis anymore by then
+    executor = stack.enter_context(AnalysisExecutor(config.analysis.processes))
     job_manager = stack.enter_context(JobManager())
     dispatcher = stack.enter_context(TaskDispatcher(task_queue, job_manager))
+    instrument_dispatcher(dispatcher, setup_task_queue_metrics(connection_pool))
 
-    register_task_dispatchers(dispatcher, mongo_db, connection_pool, config)
+    register_task_dispatchers(dispatcher, mongo_db, connection_pool, config, executor)
 
     # The task dispatcher should be running at this point
     return dispatcher
@@ -61,7 +75,8 @@ def create_db_connection(config: AppConfig) -> redis.ConnectionPool:
 
 
 def create_mongo_connection(config: AppConfig) -> MongoClient:
-    return MongoClient(config.mongo.url)
+    # MongoClient is not fork safe, every process has to create its own after forking
+    return MongoClient(config.mongo.url, maxPoolSize=config.mongo.max_pool_size)
 
 
 def create_app(config: AppConfig, stack: ExitStack):
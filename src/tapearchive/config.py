@@ -1,5 +1,5 @@
 from typing import Optional
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from dataclasses_json import DataClassJsonMixin
 from uuid import UUID, uuid4
 import pathlib
@@ -17,6 +17,26 @@ class RedisDBConfig(DataClassJsonMixin):
 @dataclass
 class MongoDBConfig(DataClassJsonMixin):
     url: str = "mongodb://localhost:27017"
+    max_pool_size: int = 100
+
+
+@dataclass
+class WebServerConfig(DataClassJsonMixin):
+    host: str = "0.0.0.0"
+    port: int = 5000
+    workers: int = 4
+    threads: int = 8
+    keepalive_seconds: int = 5
+    timeout_seconds: int = 120
+    graceful_timeout_seconds: int = 30
+
+
+@dataclass
+class AnalysisConfig(DataClassJsonMixin):
+    sample_rate: int = 22050  # Decoded audio is resampled to this rate for every analysis
+    pcm_cache_directory: pathlib.Path = pathlib.Path("/tmp/tapearchive/pcm")
+    pcm_cache_max_bytes: int = 8 * 1024**3
+    processes: int = 0  # Analysis processes of a worker, one per CPU core if 0
 
 
 @dataclass
@@ -27,8 +47,14 @@ class AppConfig(DataClassJsonMixin):
     is_gui_enabled: bool = True
     is_worker: bool = True
     max_threads: int = 0
+    catalog_cache_size: int = 1024
+    thumbnail_cache_size: int = 256
+    audiogram_tile_cache_size: int = 512  # 64 KiB per tile with the default geometry
+    # Metrics of the manager and the worker processes, 0 disables. Apart, both can run on a host, and off the ports of
+    # the usual exporters, eg. 9100 of node_exporter
+    manager_metrics_port: int = 9461
+    worker_metrics_port: int = 9462
     task_queue_uuid: UUID = uuid4()
     data_directory: pathlib.Path = pathlib.Path("/data")
-
-
-# TODO Flask config?
+    web: WebServerConfig = field(default_factory=WebServerConfig)
+    analysis: AnalysisConfig = field(default_factory=AnalysisConfig)
@@ -1,52 +1,46 @@
 import json
-from typing import Any, Dict, Optional, Tuple
-from collections import defaultdict
-from dataclasses import dataclass, field
+import os
+from typing import Any, Dict, List, Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field, replace
 from contextlib import ExitStack
-from uuid import UUID, uuid4
-from time import sleep
+from uuid import NAMESPACE_URL, UUID, uuid4, uuid5
 
 import pathlib
 import glob
 import argparse
 import logging
+import threading
 
 
 from tqdm import tqdm
 from tqdm.contrib.logging import logging_redirect_tqdm
 
+from dataclasses_json import DataClassJsonMixin
+
 from tq.database import BaseDao, BaseEntity, CustomJSONEncoder
 from tq.task_dispacher import task_handler
 
 from tapearchive import app
 from tapearchive.utils import get_config
 
-from tapearchive.workflow.tasks.audio_analisis import FindTuneKey, FindKeyFailed, FindKeyDone
-from tapearchive.models.raw_data import FileDao
+from tapearchive.analysis.key_tracking import KEY_ALGORITHM_VERSION
+from tapearchive.tasks.audio_analisis import FindTuneKey, FindKeyFailed, FindKeyDone
+from tapearchive.models.raw_data import FileDao, file_checksum
+from tapearchive.utils.producer import TaskProducer
 
 LOGGER = logging.getLogger(__name__)
 
 
-@dataclass
-class PendingTask(BaseEntity):
-    file_id: UUID
-    file_name: str
+# Ledger of the unfinished tasks, the same for every run, tasks of an interrupted run can be found by the next one
+PENDING_TASKS_KEY = "pending_tasks.find_keys"
 
 
 @dataclass
-class PendingTasksDao(BaseDao):
-    def __init__(self, db_pool):
-        super().__init__(db_pool, PendingTask.schema(), key_prefix=f"pending_tasks.{uuid4()}")
-        # Note: This should not be don this way. Daos are not chared yet. They should be singletons anyway.
-        self.pending_tasks: Dict[UUID, PendingTask] = defaultdict(PendingTask)
-
-    def create_or_update(self, obj: PendingTask) -> UUID:
-        self.pending_tasks[obj.id] = obj
-        return super().create_or_update(obj)
-
-    def delete(self, id: UUID):
-        del self.pending_tasks[id]
-        return super().delete(id)
+class PendingTask(DataClassJsonMixin):
+    file_id: str
+    file_name: str
+    checksum: Optional[str] = None
 
 
 @dataclass
@@ -57,6 +51,13 @@ class TuneKey(BaseEntity):
     most_likely_key_confidence: float
     second_most_likely_key: Optional[str]
     second_most_likely_key_confidence: Optional[float]
+    checksum: Optional[str] = None
+    algorithm_version: Optional[int] = None
+
+
+def tune_key_id(checksum: str) -> UUID:
+    """Id of the key of a file content by the current algorithm, a result is stored once and can be looked up"""
+    return uuid5(NAMESPACE_URL, f"tapearchive:tune_key:{KEY_ALGORITHM_VERSION}:{checksum}")
 
 
 class TuneKeysDao(BaseDao):
@@ -94,6 +95,31 @@ def parse_args() -> object:
         help="Application config",
     )
 
+    parser.add_argument(
+        "--jobs",
+        "-j",
+        dest="jobs",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="Files hashed in parallel",
+    )
+
+    parser.add_argument(
+        "--max-in-flight",
+        dest="max_in_flight",
+        type=int,
+        default=256,
+        help="Tasks posted but not finished at most",
+    )
+
+    parser.add_argument(
+        "--stale-timeout",
+        dest="stale_timeout",
+        type=float,
+        default=600,
+        help="Seconds to wait for a result of a task of an interrupted run before posting it again",
+    )
+
     parser.add_argument(
         "--verbose",
         dest="is_verbose",
@@ -105,38 +131,92 @@ def parse_args() -> object:
     return parser.parse_args()
 
 
+class KeyReport:
+    """Keys as JSON lines, a line per input file, appended as the results arrive, so the report costs the same for
+    every result. Files of the same content share the key found once, with their own paths. compact() turns the lines
+    into the final JSON report once at the end.
+    """
+
+    def __init__(self, path: pathlib.Path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = open(path, "w")
+        self._file_names: Dict[str, List[str]] = {}  # checksum -> paths of the input files
+        self._tune_keys: Dict[str, TuneKey] = {}  # checksum -> key
+
+    def add_file(self, file_name: str, checksum: str):
+        """An input file, its line is written once the key of its content is known"""
+        with self._lock:
+            self._file_names.setdefault(checksum, []).append(file_name)
+            tune_key = self._tune_keys.get(checksum)
+            if tune_key is not None:
+                self._write(tune_key, file_name)
+
+    def add_key(self, tune_key: TuneKey):
+        """A key found or known already, written for the input files of its content"""
+        with self._lock:
+            if tune_key.checksum is None:
+                self._write(tune_key, tune_key.file_name)
+                return
+            self._tune_keys[tune_key.checksum] = tune_key
+            for file_name in self._file_names.get(tune_key.checksum, []):
+                self._write(tune_key, file_name)
+
+    def _write(self, tune_key: TuneKey, file_name: str):
+        line = json.dumps(replace(tune_key, file_name=file_name), cls=CustomJSONEncoder)
+        self._file.write(f"{line}\n")
+        self._file.flush()
+
+    def compact(self, target_file: pathlib.Path):
+        with self._lock:
+            self._file.close()
+        tune_keys: Dict[str, Any] = {}
+        with open(self.path) as f:
+            for line in f:
+                item = json.loads(line)
+                tune_keys[item["file_name"]] = item
+        with open(target_file, "w") as f:
+            json.dump(list(tune_keys.values()), f)
+
+
 class FindKeyTaskResultHandler:
-    def __init__(self, pending_tasks_dao: PendingTasksDao, tune_keys_dao: TuneKeysDao) -> None:
-        self._pending_tasks_dao = pending_tasks_dao
+    def __init__(self, producer: TaskProducer, tune_keys_dao: TuneKeysDao, report: KeyReport) -> None:
+        self._producer = producer
         self._tune_keys_dao = tune_keys_dao
+        self._report = report
+
+    def _finish(self, task_id: UUID) -> Optional[PendingTask]:
+        record = self._producer.finish(task_id)
+        if record is None:
+            LOGGER.debug(f"Result of task {task_id} which is not waited for, the task has been posted again")
+            return None
+        return PendingTask.from_dict(record)
 
     @task_handler(FindKeyDone)
     def handle_find_key_done(self, task: FindKeyDone, *args, **kwargs):
-        task_entry: PendingTask = self._pending_tasks_dao.get_entity(task.task_id)
-        self._tune_keys_dao.create_or_update(
-            TuneKey(
-                id=uuid4(),
-                file_name=task_entry.file_name,
-                chroma_map=dict([(k, float(v)) for k, v in task.chroma_map.items()]),
-                most_likely_key=task.most_likely_key[0],
-                most_likely_key_confidence=float(task.most_likely_key[1]),
-                second_most_likely_key=task.second_most_likely_key[0] if task.second_most_likely_key else None,
-                second_most_likely_key_confidence=float(task.second_most_likely_key[1]) if task.second_most_likely_key else None,
-            )
+        task_entry = self._finish(task.task_id)
+        if task_entry is None:
+            return
+        tune_key = TuneKey(
+            id=tune_key_id(task_entry.checksum) if task_entry.checksum else uuid4(),
+            file_name=task_entry.file_name,
+            chroma_map=dict([(k, float(v)) for k, v in task.chroma_map.items()]),
+            most_likely_key=task.most_likely_key[0],
+            most_likely_key_confidence=float(task.most_likely_key[1]),
+            second_most_likely_key=task.second_most_likely_key[0] if task.second_most_likely_key else None,
+            second_most_likely_key_confidence=float(task.second_most_likely_key[1]) if task.second_most_likely_key else None,
+            checksum=task_entry.checksum,
+            algorithm_version=KEY_ALGORITHM_VERSION,
         )
-        self._pending_tasks_dao.delete(task.task_id)
+        self._tune_keys_dao.create_or_update(tune_key)
+        self._report.add_key(tune_key)
 
     @task_handler(FindKeyFailed)
     def handle_find_key_failed(self, task: FindKeyFailed, *args, **kwargs):
-        task_entry: PendingTask = self._pending_tasks_dao.get_entity(task.task_id)
+        task_entry = self._finish(task.task_id)
+        if task_entry is None:
+            return
         logging.error(f"Failed to find key for song {task_entry.file_name}. Reason: {task.error}")
-        self._pending_tasks_dao.delete(task.task_id)
-
-
-def dump_database(tune_keys_dao: TuneKeysDao, target_file: pathlib.Path):
-    with open(target_file, "w") as f:
-        all_data = list(tune_keys_dao.iterate_all())
-        json.dump(all_data, f, cls=CustomJSONEncoder)
 
 
 def main():
@@ -147,43 +227,86 @@ def main():
             app_config = get_config(args.config)
 
             connection_pool = app.create_db_connection(app_config)
-            dispatcher = app.create_dispatcher(connection_pool, app_config, exit_stack)
-
-            pending_tasks_dao = PendingTasksDao(connection_pool)
+            mongo_client = app.create_mongo_connection(app_config)
+            dispatcher = app.create_dispatcher(connection_pool, mongo_client, app_config, exit_stack)
+
+            producer = TaskProducer(
+                dispatcher,
+                connection_pool,
+                PENDING_TASKS_KEY,
+                max_in_flight=args.max_in_flight,
+                progress=tqdm(total=0, desc="Finding keys"),
+            )
             tune_keys_dao = TuneKeysDao(connection_pool)
+            report = KeyReport(args.target_file.with_suffix(".jsonl"))
+
+            def is_key_stored(record) -> bool:
+                checksum = PendingTask.from_dict(record).checksum
+                return checksum is not None and tune_keys_dao.get_entity(tune_key_id(checksum)) is not None
+
+            # Tasks of an interrupted run still in the queue are not posted again, their results are waited for
+            stale_tasks = [PendingTask.from_dict(record) for record in producer.adopt_stale(is_finished=is_key_stored)]
+            stale_checksums = set(task.checksum for task in stale_tasks if task.checksum is not None)
+            if stale_tasks:
+                LOGGER.info(f"Resuming an interrupted run, {len(stale_tasks)} tasks were not finished")
 
+            # Registered after adopting, so no result of the interrupted run is taken for unknown
             dispatcher.register_task_handler(
-                FindKeyTaskResultHandler(
-                    pending_tasks_dao=pending_tasks_dao,
-                    tune_keys_dao=tune_keys_dao,
-                )
+                FindKeyTaskResultHandler(producer=producer, tune_keys_dao=tune_keys_dao, report=report)
             )
 
-            file_dao = FileDao(connection_pool)
-            input_files = list([pathlib.Path(f) for f in glob.iglob(f"{args.data_dir}/**/*.*", recursive=True)])
-
-            total_task_count = 0
+            file_dao = FileDao(mongo_client)
+            file_dao.ensure_indexes()
+            input_files = [pathlib.Path(f) for f in glob.iglob(f"{args.data_dir}/**/*.*", recursive=True)]
+            input_files = [f for f in input_files if f.is_file()]
 
-            for input_file in tqdm(input_files, desc="Importing files"):
-                if input_file.is_file():
-                    file_id = file_dao.pull_from_disk(input_file)
+            with ThreadPoolExecutor(args.jobs) as executor:
+                checksums = list(
+                    tqdm(executor.map(file_checksum, input_files), total=len(input_files), desc="Hashing files")
+                )
 
+            posted_checksums = set()
+
+            imports = tqdm(zip(input_files, checksums), total=len(input_files), desc="Importing files")
+            for input_file, checksum in imports:
+                report.add_file(str(input_file), checksum)
+                if checksum in posted_checksums:
+                    LOGGER.debug(f"Same content as an other file: {input_file}")
+                    continue
+                posted_checksums.add(checksum)
+
+                if checksum in stale_checksums:
+                    LOGGER.debug(f"Key is being found by an interrupted run: {input_file}")
+                    continue
+
+                known_key = tune_keys_dao.get_entity(tune_key_id(checksum))
+                if known_key is not None:
+                    LOGGER.debug(f"Key is known already: {input_file}")
+                    report.add_key(known_key)
+                    continue
+
+                file_id = file_dao.find_by_checksum(checksum)
+                if file_id is None:
+                    file_id = file_dao.pull_from_disk(input_file, checksum=checksum)
                     LOGGER.info(f"File imported: {input_file} file_id={file_id}")
-                    task_id = dispatcher.post_task(FindTuneKey(source_file_id=file_id, source_format=input_file.suffix))
-                    pending_tasks_dao.create_or_update(PendingTask(id=task_id, file_id=file_id, file_name=str(input_file)))
+                else:
+                    LOGGER.debug(f"File is stored already: {input_file} file_id={file_id}")
 
-                    total_task_count += 1
+                producer.post(
+                    FindTuneKey(source_file_id=file_id, source_format=input_file.suffix),
+                    PendingTask(file_id=file_id, file_name=str(input_file), checksum=checksum).to_dict(),
+                )
 
             LOGGER.debug("------------")
 
-            progress = tqdm(total=total_task_count)
-            previous_value = total_task_count
-            while len(pending_tasks_dao.pending_tasks) > 0:
-                value = total_task_count - len(pending_tasks_dao.pending_tasks)
-                if value != previous_value:
-                    progress.update(value)
-                    dump_database(tune_keys_dao, args.target_file)
-                    previous_value = value
-                sleep(1)
-
-            dump_database(tune_keys_dao, args.target_file)
+            lost_tasks = [PendingTask.from_dict(record) for record in producer.wait(stale_timeout=args.stale_timeout)]
+            lost_tasks = [task for task in lost_tasks if task.checksum in posted_checksums]
+            if lost_tasks:
+                LOGGER.info(f"No results of {len(lost_tasks)} tasks of the interrupted run, posting them again")
+                for task in lost_tasks:
+                    producer.post(
+                        FindTuneKey(source_file_id=task.file_id, source_format=pathlib.Path(task.file_name).suffix),
+                        task.to_dict(),
+                    )
+                producer.wait()
+            report.compact(args.target_file)
@@ -1,14 +1,24 @@
 import json
-from flask import Flask, make_response
+from flask import Flask, make_response, request
 from flask_restful import Api
 
 from tapearchive.api import (
+    audiogram,
     catalog, 
+    files,
+    fingerprint,
+    http_cache,
+    metrics,
+    stats,
     status,
+    thumbnails,
+    uploads,
+    waveform,
 )
 
-from tapearchive.app import create_db_connection
+from tapearchive.app import create_db_connection, create_mongo_connection
 from tapearchive.config import AppConfig
+from tapearchive.metrics import setup_task_queue_metrics
 
 from tq.database import CustomJSONEncoder
 
@@ -18,11 +28,23 @@ API_V1_PREFIX = "/api/v1"
 
 
 def create_flask_app(config: AppConfig):
-    connection_pool = create_db_connection(config)
+    mongo_client = create_mongo_connection(config)
     app = Flask(__name__)
+    app.extensions["mongo_client"] = mongo_client
     api = Api(app)
 
-    catalog_controller = catalog.CatalogController(connection_pool)
+    catalog_controller = catalog.CatalogController(mongo_client, cache_size=config.catalog_cache_size)
+    stats_controller = stats.StatsController(mongo_client)
+    file_controller = files.FileController(mongo_client)
+    upload_controller = uploads.UploadController(mongo_client)
+    thumbnail_controller = thumbnails.ThumbnailController(
+        mongo_client, config.data_directory, cache_size=config.thumbnail_cache_size
+    )
+    audiogram_controller = audiogram.AudiogramController(mongo_client, cache_size=config.audiogram_tile_cache_size)
+    fingerprint_controller = fingerprint.FingerprintController(mongo_client)
+
+    # Queue depth is read from Redis on scrape
+    setup_task_queue_metrics(create_db_connection(config))
 
     @api.representation('application/json')
     def output_json(data, code, headers=None):
@@ -30,10 +52,51 @@ def create_flask_app(config: AppConfig):
         resp.headers.extend(headers or {})
         return resp
 
+    @app.before_request
+    def start_request_timer():
+        metrics.start_request_timer()
+
+    # After request hooks run in reverse order, registered first so compression is included in the latency
+    @app.after_request
+    def observe_request(response):
+        return metrics.observe_request(request, response)
+
+    @app.after_request
+    def compress_response(response):
+        return http_cache.compress_response(request, response)
+
     # TODO: Add error handlers
 
     api.add_resource(status.ContianerHeartbeat, f"{API_V1_PREFIX}/heartbeat")
+    api.add_resource(metrics.MetricsView, "/metrics")
+    api.add_resource(catalog.CatalogBatchView, f"{API_V1_PREFIX}/catalog/batch", resource_class_args=[catalog_controller])
     api.add_resource(catalog.CatalogEntryView, f"{API_V1_PREFIX}/catalog/<string:catalog_name>", resource_class_args=[catalog_controller])
     api.add_resource(catalog.CatalogListView, f"{API_V1_PREFIX}/catalog_names/", resource_class_args=[catalog_controller])
+    api.add_resource(catalog.CatalogSearchView, f"{API_V1_PREFIX}/search", resource_class_args=[catalog_controller])
+    api.add_resource(stats.StatsView, f"{API_V1_PREFIX}/stats", resource_class_args=[stats_controller])
+    api.add_resource(
+        waveform.WaveformView,
+        f"{API_V1_PREFIX}/catalog/<string:catalog_id>/attachments/<string:attachment_id>/waveform",
+        resource_class_args=[catalog_controller, file_controller],
+    )
+    api.add_resource(
+        thumbnails.ThumbnailView,
+        f"{API_V1_PREFIX}/catalog/<string:catalog_id>/attachments/<string:attachment_id>/thumbnail/<int:size>",
+        resource_class_args=[catalog_controller, thumbnail_controller],
+    )
+    api.add_resource(
+        audiogram.AudiogramTileView,
+        f"{API_V1_PREFIX}/catalog/<string:catalog_id>/attachments/<string:attachment_id>/audiogram/<int:level>/<int:x>",
+        resource_class_args=[catalog_controller, audiogram_controller],
+    )
+    api.add_resource(
+        fingerprint.DuplicatesView,
+        f"{API_V1_PREFIX}/catalog/<string:catalog_id>/recordings/<string:recording_id>/duplicates",
+        resource_class_args=[fingerprint_controller],
+    )
+    api.add_resource(files.FileStreamView, f"{API_V1_PREFIX}/files/<string:file_id>", resource_class_args=[file_controller])
+    api.add_resource(uploads.UploadListView, f"{API_V1_PREFIX}/uploads", resource_class_args=[upload_controller])
+    api.add_resource(uploads.UploadView, f"{API_V1_PREFIX}/uploads/<string:upload_id>", resource_class_args=[upload_controller])
+    api.add_resource(uploads.UploadFinalizeView, f"{API_V1_PREFIX}/uploads/<string:upload_id>/finalize", resource_class_args=[upload_controller])
     
     return app
@@ -5,6 +5,7 @@ from contextlib import ExitStack
 import marshmallow
 import yaml
 from tapearchive.flask_app import create_flask_app
+from tapearchive.web_server import WebServer
 from waiting import wait
 
 import logging
@@ -14,10 +15,12 @@ from tqdm import tqdm
 from tqdm.contrib.logging import logging_redirect_tqdm
 
 from tapearchive.config import AppConfig
+from tapearchive.metrics import start_metrics_server
 from tapearchive.models.catalog import CatalogDao, CatalogEntry
+from tapearchive.models.codec import get_codec
 from tapearchive.utils import find_all_files, get_config
 
-from tapearchive.app import create_app, create_db_connection, create_dispatcher
+from tapearchive.app import create_app, create_db_connection, create_dispatcher, create_mongo_connection
 
 LOGGER = logging.getLogger(__name__)
 
@@ -43,6 +46,14 @@ def fetch_args():
         help="App logging config file",
     )
 
+    parser.add_argument(
+        "--debug",
+        dest="is_debug",
+        action="store_true",
+        required=False,
+        help="Run the web api on the single process Flask development server",
+    )
+
     return parser.parse_args()
 
 
@@ -51,6 +62,8 @@ def main():
     config: AppConfig = get_config(args.config_path)
     logging.config.fileConfig(args.logging_config, disable_existing_loggers=False)
 
+    start_metrics_server(config.manager_metrics_port)
+
     with ExitStack() as stack:
         dispatcher = create_app(config, stack)
         wait(dispatcher.is_exit)
@@ -61,9 +74,11 @@ def worker_entrypoint():
     config: AppConfig = get_config(args.config_path)
     logging.config.fileConfig(args.logging_config, disable_existing_loggers=False)
     connection_pool = create_db_connection(config)
+    mongo_client = create_mongo_connection(config)
+    start_metrics_server(config.worker_metrics_port)
 
     with ExitStack() as stack:
-        dispatcher = create_dispatcher(connection_pool, config, stack)
+        dispatcher = create_dispatcher(connection_pool, mongo_client, config, stack)
         wait(dispatcher.is_exit)
 
 
@@ -72,8 +87,11 @@ def flask_entrypoint():
     config: AppConfig = get_config(args.config_path)
     logging.config.fileConfig(args.logging_config, disable_existing_loggers=False)
 
-    app = create_flask_app(config)
-    app.run(debug=True, host="0.0.0.0")
+    if args.is_debug:
+        app = create_flask_app(config)
+        app.run(debug=True, host=config.web.host, port=config.web.port)
+    else:
+        WebServer(config, logging_config=str(args.logging_config)).run()
 
 
 # ---
@@ -115,15 +133,16 @@ def data_import_entrypont():
 
     config = get_config(args.config)
     logging.info(f"AppConfig={config.to_dict()}")
-    pool = create_db_connection(config)
+    mongo_client = create_mongo_connection(config)
 
-    catalog_dao = CatalogDao(pool)
+    catalog_dao = CatalogDao(mongo_client)
+    catalog_codec = get_codec(CatalogEntry)
 
     with logging_redirect_tqdm():
         for yaml_path in tqdm(find_all_files("meta.yaml", args.data_path), desc="Loading manifests into db"):
             with open(yaml_path, "r") as f:
                 try:
-                    entry = CatalogEntry.schema().load(yaml.safe_load(f))
+                    entry = catalog_codec.decode(yaml.safe_load(f))
                     id = catalog_dao.create_or_update(entry)
                     LOGGER.info(f"Catalog entry [{entry.name}] had been imported id={id}")
                 except marshmallow.exceptions.ValidationError as e:
@@ -0,0 +1,184 @@
+import functools
+import logging
+import os
+import time
+from typing import Optional, Set
+
+import redis
+from prometheus_client import REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, multiprocess, start_http_server
+from prometheus_client.core import GaugeMetricFamily
+
+LOGGER = logging.getLogger(__name__)
+
+_TASK_BUCKETS = (0.1, 0.5, 1.0, 5.0, 15.0, 60.0, 300.0, 900.0, 3600.0, float("inf"))
+
+TASK_QUEUE_WAIT = Histogram(
+    "tapearchive_task_queue_wait_seconds",
+    "Time spent by tasks in the queue until a worker picked them up",
+    ["task_type"],
+    buckets=_TASK_BUCKETS,
+)
+TASK_EXECUTION = Histogram(
+    "tapearchive_task_execution_seconds",
+    "Execution time of task handlers",
+    ["task_type"],
+    buckets=_TASK_BUCKETS,
+)
+TASK_FAILURES = Counter(
+    "tapearchive_task_failures",
+    "Task handlers raised an exception",
+    ["task_type"],
+)
+FFMPEG_PROCESSES = Gauge(
+    "tapearchive_ffmpeg_processes",
+    "Running ffmpeg processes",
+    multiprocess_mode="livesum",
+)
+WORKFLOW_STEPS = Gauge(
+    "tapearchive_workflow_steps",
+    "Workflow steps by state",
+    ["state"],
+    multiprocess_mode="livesum",
+)
+GRIDFS_BYTES = Counter(
+    "tapearchive_gridfs_bytes",
+    "Bytes read from and written to GridFS",
+    ["direction"],
+)
+API_REQUEST_LATENCY = Histogram(
+    "tapearchive_api_request_seconds",
+    "Web api latency until the response is returned, streamed bodies are not included",
+    ["method", "endpoint", "status"],
+)
+
+# Task types with an instrumented handler, only these are tracked in the queue
+_TIMED_TASK_TYPES: Set[str] = set()
+
+_task_queue_metrics: Optional["TaskQueueMetrics"] = None
+
+
+class TaskQueueMetrics:
+    """Queue depth and queue wait per task type, shared by every process through Redis.
+
+    Posting a task pushes a timestamp to the list of its type, the worker picking up a task pops the oldest one.
+    The depth is the length of the list and the wait is measured from the oldest post, which is an estimate when tasks
+    are requeued, but it costs a single round trip per task.
+    """
+
+    KEY_PREFIX = "tapearchive:metrics:posted"
+    KEY_TASK_TYPES = "tapearchive:metrics:task_types"
+    MAX_TRACKED_TASKS = 100000
+
+    def __init__(self, connection_pool: redis.ConnectionPool):
+        self._redis = redis.Redis(connection_pool=connection_pool)
+
+    def task_posted(self, task_type: str):
+        key = f"{self.KEY_PREFIX}:{task_type}"
+        try:
+            with self._redis.pipeline(transaction=False) as pipe:
+                pipe.sadd(self.KEY_TASK_TYPES, task_type)
+                pipe.rpush(key, time.time())
+                pipe.ltrim(key, -self.MAX_TRACKED_TASKS, -1)
+                pipe.execute()
+        except redis.RedisError as e:
+            LOGGER.warning(f"Cannot track posted task {task_type}: {e}")
+
+    def task_started(self, task_type: str) -> Optional[float]:
+        """Returns the seconds the oldest task of the type was waiting, if it was tracked"""
+        try:
+            posted_at = self._redis.lpop(f"{self.KEY_PREFIX}:{task_type}")
+        except redis.RedisError as e:
+            LOGGER.warning(f"Cannot track started task {task_type}: {e}")
+            return None
+        if posted_at is None:
+            return None
+        return max(0.0, time.time() - float(posted_at))
+
+    def describe(self):
+        # Registering the collector should not hit Redis
+        return []
+
+    def collect(self):
+        depth = GaugeMetricFamily("tapearchive_task_queue_depth", "Tasks waiting in the queue", labels=["task_type"])
+        try:
+            task_types = sorted(task_type.decode() for task_type in self._redis.smembers(self.KEY_TASK_TYPES))
+            with self._redis.pipeline(transaction=False) as pipe:
+                for task_type in task_types:
+                    pipe.llen(f"{self.KEY_PREFIX}:{task_type}")
+                lengths = pipe.execute()
+        except redis.RedisError as e:
+            LOGGER.warning(f"Cannot collect task queue depth: {e}")
+            return
+
+        for task_type, length in zip(task_types, lengths):
+            depth.add_metric([task_type], length)
+        yield depth
+
+
+def setup_task_queue_metrics(connection_pool: redis.ConnectionPool) -> TaskQueueMetrics:
+    global _task_queue_metrics
+    if _task_queue_metrics is None:
+        _task_queue_metrics = TaskQueueMetrics(connection_pool)
+        REGISTRY.register(_task_queue_metrics)
+    return _task_queue_metrics
+
+
+def instrument_dispatcher(dispatcher, queue_metrics: TaskQueueMetrics):
+    """Tracks the tasks posted through the dispatcher in the queue metrics"""
+    post_task = dispatcher.post_task
+
+    @functools.wraps(post_task)
+    def instrumented_post_task(task, *args, **kwargs):
+        task_type = type(task).__name__
+        if task_type in _TIMED_TASK_TYPES:
+            queue_metrics.task_posted(task_type)
+        return post_task(task, *args, **kwargs)
+
+    dispatcher.post_task = instrumented_post_task
+    return dispatcher
+
+
+def timed_task(task_cls):
+    """Measures queue wait, execution time and failures of a task handler method.
+    Has to be applied under `@task_handler`, so the dispatcher registers the instrumented method.
+    """
+    task_type = task_cls.__name__
+    _TIMED_TASK_TYPES.add(task_type)
+
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(self, task, *args, **kwargs):
+            if _task_queue_metrics is not None:
+                wait_seconds = _task_queue_metrics.task_started(task_type)
+                if wait_seconds is not None:
+                    TASK_QUEUE_WAIT.labels(task_type).observe(wait_seconds)
+
+            with TASK_FAILURES.labels(task_type).count_exceptions(), TASK_EXECUTION.labels(task_type).time():
+                return fn(self, task, *args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def get_registry() -> CollectorRegistry:
+    """Prefork servers have to set PROMETHEUS_MULTIPROC_DIR, then the metrics of all worker processes are merged"""
+    if "PROMETHEUS_MULTIPROC_DIR" not in os.environ:
+        return REGISTRY
+
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    if _task_queue_metrics is not None:
+        registry.register(_task_queue_metrics)
+    return registry
+
+
+def start_metrics_server(port: int):
+    """Serves the metrics of a worker or manager process, port 0 disables it"""
+    if not port:
+        return
+    try:
+        start_http_server(port)
+        LOGGER.info(f"Serving metrics on port {port}")
+    except OSError as e:
+        LOGGER.error(f"Cannot serve metrics on port {port}: {e}")
@@ -0,0 +1,80 @@
+import re
+from typing import Optional
+from uuid import UUID
+
+import gridfs.errors
+
+from tapearchive.analysis.spectrogram import SpectrogramGeometry, pool_frames
+from tapearchive.metrics import GRIDFS_BYTES
+from tapearchive.models.catalog import Attachment, AttachmentType, CatalogEntry
+from tapearchive.models.raw_data import FileDao
+
+SOURCE_ATTACHMENT_ID = "source_attachment_id"  # meta of the audiogram, besides the geometry
+
+
+def find_audiogram(entry: CatalogEntry, attachment_id: UUID) -> Optional[Attachment]:
+    """Audiogram attachment of an audio attachment"""
+    for attachment in entry.attachments or []:
+        meta = attachment.meta or {}
+        if attachment.type == AttachmentType.AUDIOGRAM and meta.get(SOURCE_ATTACHMENT_ID) == str(attachment_id):
+            return attachment
+    return None
+
+
+def audiogram_geometry(audiogram: Attachment) -> SpectrogramGeometry:
+    return SpectrogramGeometry.from_meta(audiogram.meta)
+
+
+def tile_prefix(audiogram_file_id: str) -> str:
+    return f"audiogram-tile/{audiogram_file_id}/"
+
+
+def tile_filename(audiogram_file_id: str, level: int, x: int) -> str:
+    return f"{tile_prefix(audiogram_file_id)}{level}/{x}"
+
+
+class AudiogramTileDao(FileDao):
+    """Tiles of the audiogram pyramid in GridFS.
+
+    Tiles of the deepest level are read from the audiogram file itself. Tiles of the upper levels are pooled from the
+    frames they cover when they are first requested, then stored by the name of the audiogram file, so a regenerated
+    audiogram never serves stale tiles. The name is the id of the tile file as well: concurrent first requests of a
+    tile store it once, the others fail on the duplicate key.
+    """
+
+    def get_tile(self, audiogram: Attachment, level: int, x: int) -> bytes:
+        """Raises gridfs.errors.NoFile if the audiogram file is missing"""
+        geometry = audiogram_geometry(audiogram)
+        if level == geometry.deepest_level:
+            return pool_frames(self._read_frames(audiogram.file_id, geometry, level, x), geometry, level)
+
+        filename = tile_filename(audiogram.file_id, level, x)
+        try:
+            with self._bucket.open_download_stream(filename) as grid_out:
+                data = grid_out.read()
+            GRIDFS_BYTES.labels("read").inc(len(data))
+            return data
+        except gridfs.errors.NoFile:
+            pass
+
+        data = pool_frames(self._read_frames(audiogram.file_id, geometry, level, x), geometry, level)
+        try:
+            self._bucket.upload_from_stream_with_id(filename, filename, data, metadata={"level": level, "x": x})
+            GRIDFS_BYTES.labels("write").inc(len(data))
+        except gridfs.errors.FileExists:
+            pass  # stored by a concurrent request, the data is the same
+        return data
+
+    def delete_tiles(self, audiogram_file_id: str):
+        """Drops the cached tiles of an audiogram which is replaced"""
+        for grid_out in self._bucket.find({"filename": {"$regex": f"^{re.escape(tile_prefix(audiogram_file_id))}"}}):
+            self.delete_file(grid_out._id)
+
+    def _read_frames(self, file_id: str, geometry: SpectrogramGeometry, level: int, x: int) -> bytes:
+        frame_size = geometry.bin_count
+        start = x * geometry.frames_per_tile(level) * frame_size
+        with self.open_download_stream(file_id) as grid_out:
+            grid_out.seek(start)
+            data = grid_out.read(geometry.frames_per_tile(level) * frame_size)
+        GRIDFS_BYTES.labels("read").inc(len(data))
+        return data
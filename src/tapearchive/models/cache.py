@@ -0,0 +1,117 @@
+from collections import OrderedDict
+import threading
+from typing import Any, Dict, Generic, Hashable, Optional, Tuple, TypeVar
+
+T = TypeVar("T")
+
+
+class LRUCache(Generic[T]):
+    """Thread safe, size bounded least-recently-used cache."""
+
+    def __init__(self, max_size: int = 1024) -> None:
+        self._max_size = max_size
+        self._items: "OrderedDict[Hashable, T]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default: Optional[T] = None) -> Optional[T]:
+        with self._lock:
+            try:
+                value = self._items[key]
+            except KeyError:
+                return default
+            self._items.move_to_end(key)
+            return value
+
+    def put(self, key: Hashable, value: T):
+        with self._lock:
+            self._put(key, value)
+
+    def _put(self, key: Hashable, value: T):
+        if self._max_size <= 0:
+            return
+        self._items[key] = value
+        self._items.move_to_end(key)
+        while len(self._items) > self._max_size:
+            self._items.popitem(last=False)
+
+    def pop(self, key: Hashable, default: Optional[T] = None) -> Optional[T]:
+        with self._lock:
+            return self._items.pop(key, default)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+    def __contains__(self, key: Hashable) -> bool:
+        with self._lock:
+            return key in self._items
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._items)
+
+    @property
+    def max_size(self) -> int:
+        return self._max_size
+
+
+class VersionedCache(LRUCache[Tuple[int, Any]]):
+    """LRU cache where every value is stored along with the version of the document it was decoded from.
+    A lookup only hits if the caller presents the same version it has seen in the database.
+
+    A value loaded while its key is invalidated by pop() or clear() can be stale already: loaders take a reservation
+    with reserve() before loading, and put_reserved() drops the value if the key was invalidated since.
+    """
+
+    def __init__(self, max_size: int = 1024) -> None:
+        super().__init__(max_size)
+        self._sequence = 0
+        self._reservations: Dict[Hashable, int] = {}  # key -> number of loads in progress
+        # key -> sequence of its last invalidation, kept while it has loads in progress
+        self._invalidated: Dict[Hashable, int] = {}
+
+    def reserve(self, key: Hashable) -> int:
+        """Reservation for loading `key`, must be released with release()"""
+        with self._lock:
+            self._sequence += 1
+            self._reservations[key] = self._reservations.get(key, 0) + 1
+            return self._sequence
+
+    def release(self, key: Hashable, reservation: int):
+        with self._lock:
+            count = self._reservations.pop(key) - 1
+            if count > 0:
+                self._reservations[key] = count
+            else:
+                self._invalidated.pop(key, None)
+
+    def put_reserved(self, key: Hashable, reservation: int, version: int, value: Any) -> bool:
+        """Stores a value loaded under `reservation` unless `key` was invalidated since. Returns if it was stored"""
+        with self._lock:
+            if self._invalidated.get(key, 0) > reservation:
+                return False
+            self._put(key, (version, value))
+            return True
+
+    def pop(self, key: Hashable, default: Optional[Tuple[int, Any]] = None) -> Optional[Tuple[int, Any]]:
+        with self._lock:
+            self._sequence += 1
+            if key in self._reservations:
+                self._invalidated[key] = self._sequence
+            return self._items.pop(key, default)
+
+    def clear(self):
+        with self._lock:
+            self._sequence += 1
+            for key in self._reservations:
+                self._invalidated[key] = self._sequence
+            self._items.clear()
+
+    def get_version(self, key: Hashable, version: int) -> Optional[Any]:
+        item = self.get(key)
+        if item is not None and item[0] == version:
+            return item[1]
+        return None
+
+    def put_version(self, key: Hashable, version: int, value: Any):
+        self.put(key, (version, value))
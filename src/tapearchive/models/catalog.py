@@ -1,17 +1,27 @@
 from collections import defaultdict
 import enum
+import logging
 import pathlib
-from typing import Iterator, Optional, List, Dict, Tuple
+import re
+import threading
+from typing import Any, Callable, Iterator, Optional, List, Dict, Tuple
 from dataclasses import dataclass, field
 from uuid import UUID
 import bson
-from dataclasses_json import config
+from dataclasses_json import DataClassJsonMixin, config
 import marshmallow
+import pymongo
+import pymongo.errors
 
 
 from tq.database.db import transactional, BaseEntity
 from tq.database.mongo_dao import BaseMongoDao, MongoDaoContext
 
+from tapearchive.models.cache import VersionedCache
+from tapearchive.models.codec import get_codec
+
+LOGGER = logging.getLogger(__name__)
+
 
 @enum.unique
 class AttachmentType(str, enum.Enum):
@@ -46,11 +56,29 @@ class Attachment(BaseEntity):
         )
     )
     meta: Optional[Dict[str, str]] = field(default_factory=defaultdict(str))
+    file_id: Optional[str] = None  # GridFS file, if the attachment had been uploaded
+
+
+@dataclass
+class WaveformLevel(DataClassJsonMixin):
+    samples_per_pixel: int
+    pixel_count: int
+    file_id: str  # GridFS file of (min, max, rms) triplets per pixel
+
+
+@dataclass
+class WaveformPeaks(DataClassJsonMixin):
+    sample_rate: int
+    sample_count: int
+    bits: int  # 8 | 16, quantization of the peaks
+    levels: List[WaveformLevel]
 
 
 @dataclass
 class AudioAttachment(Attachment):
     format: Optional[str] = None  # mp3 | flac | etc
+    duration_seconds: Optional[float] = None
+    waveform: Optional[WaveformPeaks] = None
 
 
 @dataclass
@@ -58,6 +86,30 @@ class Group(BaseEntity):
     name: Optional[str] = None
 
 
+@dataclass
+class KeyTrackPoint(DataClassJsonMixin):
+    start_seconds: float
+    end_seconds: float
+    key: str
+    confidence: float
+    second_key: Optional[str] = None
+    second_confidence: Optional[float] = None
+
+
+@dataclass
+class TempoInfo(DataClassJsonMixin):
+    bpm: float
+    beat_seconds: List[float]
+    onset_frame_rate: float  # frames per second of the onset strength envelope
+    onset_file_id: Optional[str] = None  # GridFS file of float16 onset strength per frame
+
+
+@dataclass
+class TrackSegment(DataClassJsonMixin):
+    start_seconds: float
+    end_seconds: float
+
+
 @dataclass
 class RecordingEntry(BaseEntity):
     name: str
@@ -72,6 +124,9 @@ class RecordingEntry(BaseEntity):
     audio_files: Optional[List[AudioAttachment]] = None
     audio_sources: Optional[List[AudioAttachment]] = None
     meta: Optional[Dict[str, str]] = None
+    key_track: Optional[List[KeyTrackPoint]] = None  # Key over sliding windows of the recording
+    tempo: Optional[TempoInfo] = None
+    tracks: Optional[List[TrackSegment]] = None  # Sections of sound between the gaps of silence
 
 
 @dataclass
@@ -84,12 +139,303 @@ class CatalogEntry(BaseEntity):
     meta: Optional[Dict[str, str]] = None
 
 
+def iterate_attachments(entry: CatalogEntry) -> Iterator[Attachment]:
+    yield from entry.attachments or []
+    for recording in entry.recordings:
+        yield from recording.audio_files or []
+        yield from recording.audio_sources or []
+
+
+def find_attachment(entry: CatalogEntry, attachment_id: UUID) -> Optional[Attachment]:
+    for attachment in iterate_attachments(entry):
+        if attachment.id == attachment_id:
+            return attachment
+    return None
+
+
+@dataclass
+class CatalogSearchHit(DataClassJsonMixin):
+    id: UUID
+    name: str
+    description: Optional[str]
+    recording_count: int
+    score: float
+
+
+@dataclass
+class CatalogSearchResult(DataClassJsonMixin):
+    total: int
+    hits: List[CatalogSearchHit]
+    facets: Dict[str, Dict[str, int]]
+
+
+def _flatten(expression: str) -> dict:
+    """Aggregation expression which flattens an array of arrays, eg. `$recordings.audio_files.format`"""
+    return {
+        "$reduce": {
+            "input": {"$ifNull": [expression, []]},
+            "initialValue": [],
+            "in": {"$concatArrays": ["$$value", {"$ifNull": ["$$this", []]}]},
+        }
+    }
+
+
+# Facet name -> (values of a catalog entry, paths to filter on)
+SEARCH_FACETS: Dict[str, Tuple[dict, List[str]]] = {
+    "group": (
+        {"$ifNull": ["$groups.name", []]},
+        ["groups.name"],
+    ),
+    "attachment_type": (
+        {
+            "$concatArrays": [
+                {"$ifNull": ["$attachments.type", []]},
+                _flatten("$recordings.audio_sources.type"),
+                _flatten("$recordings.audio_files.type"),
+            ]
+        },
+        ["attachments.type", "recordings.audio_sources.type", "recordings.audio_files.type"],
+    ),
+    "channel_mode": (
+        {"$ifNull": ["$recordings.source_channel_mode", []]},
+        ["recordings.source_channel_mode"],
+    ),
+    "format": (
+        {
+            "$concatArrays": [
+                _flatten("$recordings.audio_sources.format"),
+                _flatten("$recordings.audio_files.format"),
+            ]
+        },
+        ["recordings.audio_sources.format", "recordings.audio_files.format"],
+    ),
+}
+
+
+# Fields which can be requested in a catalog entry summary, and their projection
+SUMMARY_FIELDS: Dict[str, object] = {
+    "name": 1,
+    "description": 1,
+    "meta": 1,
+    "recording_count": {"$size": {"$ifNull": ["$recordings", []]}},
+}
+
+
+MAX_UPDATE_ATTEMPTS = 8
+
+
+class CatalogUpdateConflict(Exception):
+    """An update of a catalog entry kept conflicting with other writers of the same fields"""
+
+
 # ---
 
 
 class CatalogDao(BaseMongoDao):
-    def __init__(self, db_pool):
+    """Catalog entries with a read-through cache of decoded entries.
+
+    Every write bumps a per-document version counter kept in a side collection, a cached entry is served only while
+    its version matches the one in the database. If a change stream is started (replica set only) cached entries are
+    invalidated by the change events instead, and reads skip the version lookup entirely.
+    Entries returned from the cache are shared between callers, so they must be treated read-only.
+    """
+
+    def __init__(self, db_pool, cache_size: int = 1024):
         super().__init__(db_pool, CatalogEntry, key_prefix="catalog")
+        self._cache = VersionedCache(cache_size)
+        self._change_stream_thread: Optional[threading.Thread] = None
+        self._is_watching = False
+
+    def get_entity(self, id: UUID) -> Optional[CatalogEntry]:
+        if self._is_watching:
+            cached = self._cache.get(id)
+            if cached is not None:
+                return cached[1]
+
+        # A change between reading the version and caching the loaded entry drops the entry
+        reservation = self._cache.reserve(id)
+        try:
+            version = self.get_version(id)
+            entry = self._cache.get_version(id, version)
+            if entry is None:
+                entry = self._load_entity(id)
+                if entry is not None:
+                    self._cache.put_reserved(id, reservation, version, entry)
+        finally:
+            self._cache.release(id, reservation)
+        return entry
+
+    @transactional
+    def _load_entity(self, id: UUID, ctx: MongoDaoContext) -> Optional[CatalogEntry]:
+        item = ctx.collection.find_one({"_id": bson.Binary.from_uuid(id)})
+        if item is not None:
+            return get_codec(CatalogEntry, unknown=marshmallow.EXCLUDE).decode(ctx.desanitize(item))
+        return None
+
+    def create_or_update(self, obj: CatalogEntry) -> UUID:
+        id = super().create_or_update(obj)
+        self._bump_versions([id])
+        return id
+
+    def bulk_create_or_update(self, objs: List[CatalogEntry]) -> List[UUID]:
+        ids = super().bulk_create_or_update(objs)
+        self._bump_versions(ids)
+        return ids
+
+    def delete(self, id: UUID):
+        result = super().delete(id)
+        self._bump_versions([id])
+        return result
+
+    def update_entry(self, id: UUID, update: Callable[[CatalogEntry], None]) -> Optional[CatalogEntry]:
+        """Same as update_attachment(), for the entry itself"""
+        return self._update_element(id, lambda entry: ([], entry), update)
+
+    def update_attachment(self, id: UUID, attachment_id: UUID, update: Callable[[Attachment], None]) -> Optional[Attachment]:
+        """Applies `update` on an attachment of a freshly loaded entry, then stores the fields it has changed.
+        Returns the updated attachment, or None if there is no such entry or attachment.
+        `update` is called again on a fresh copy if another writer changes the same fields meanwhile.
+        """
+
+        def locate(entry: CatalogEntry) -> Optional[Tuple[list, Attachment]]:
+            for index, attachment in enumerate(entry.attachments or []):
+                if attachment.id == attachment_id:
+                    return ["attachments", index], attachment
+            for recording_index, recording in enumerate(entry.recordings):
+                for field_name in ("audio_files", "audio_sources"):
+                    for index, attachment in enumerate(getattr(recording, field_name) or []):
+                        if attachment.id == attachment_id:
+                            return ["recordings", recording_index, field_name, index], attachment
+            return None
+
+        return self._update_element(id, locate, update)
+
+    def update_recording(self, id: UUID, recording_id: UUID, update: Callable[[RecordingEntry], None]) -> Optional[RecordingEntry]:
+        """Same as update_attachment(), for a recording"""
+
+        def locate(entry: CatalogEntry) -> Optional[Tuple[list, RecordingEntry]]:
+            for index, recording in enumerate(entry.recordings):
+                if recording.id == recording_id:
+                    return ["recordings", index], recording
+            return None
+
+        return self._update_element(id, locate, update)
+
+    @transactional
+    def _update_element(
+        self,
+        id: UUID,
+        locate: Callable[[CatalogEntry], Optional[Tuple[list, Any]]],
+        update: Callable[[Any], None],
+        ctx: MongoDaoContext = None,
+    ) -> Optional[Any]:
+        """Applies `update` on the element `locate` finds in a freshly loaded entry, `locate` returns the path of the
+        element in the document and the element. Only the fields changed by `update` are written, with a `$set`
+        conditional on the element still being at the path and the changed fields being as they were loaded. On a
+        conflict the update is retried on a fresh copy, writers of different fields of an element do not conflict.
+        """
+        for _ in range(MAX_UPDATE_ATTEMPTS):
+            item = ctx.collection.find_one({"_id": bson.Binary.from_uuid(id)})
+            if item is None:
+                return None
+            entry = get_codec(CatalogEntry, unknown=marshmallow.EXCLUDE).decode(ctx.desanitize(dict(item)))
+            located = locate(entry)
+            if located is None:
+                return None
+            path, element = located
+
+            before = element.to_dict(encode_json=True)
+            update(element)
+            after = element.to_dict(encode_json=True)
+            changed_fields = [field_name for field_name, value in after.items() if value != before.get(field_name)]
+            if not changed_fields:
+                return element
+
+            stored = item
+            for key in path:
+                stored = stored[key]
+            prefix = "".join(f"{key}." for key in path)
+            condition = {"_id": item["_id"]}
+            if path:
+                condition[f"{prefix}id"] = stored["id"]
+            for field_name in changed_fields:
+                condition[f"{prefix}{field_name}"] = stored[field_name] if field_name in stored else {"$exists": False}
+
+            result = ctx.collection.update_one(
+                condition, {"$set": dict((f"{prefix}{field_name}", after[field_name]) for field_name in changed_fields)}
+            )
+            if result.matched_count == 1:
+                self._bump_versions([id])
+                return element
+            LOGGER.debug(f"Catalog entry {id} was changed by another writer at {prefix or 'the root'}, retrying")
+
+        raise CatalogUpdateConflict(f"Catalog entry {id} kept changing, gave up after {MAX_UPDATE_ATTEMPTS} attempts")
+
+    def get_current_version(self, id: UUID) -> int:
+        """Same as get_version(), but answered from the cache while the change stream keeps it up to date"""
+        if self._is_watching:
+            cached = self._cache.get(id)
+            if cached is not None:
+                return cached[0]
+        return self.get_version(id)
+
+    @transactional
+    def get_version(self, id: UUID, ctx: MongoDaoContext) -> int:
+        item = self._versions(ctx).find_one({"_id": bson.Binary.from_uuid(id)}, {"version": 1})
+        return item["version"] if item is not None else 0
+
+    @transactional
+    def _bump_versions(self, ids: List[UUID], ctx: MongoDaoContext):
+        if not ids:
+            return
+        self._versions(ctx).bulk_write(
+            [
+                pymongo.UpdateOne({"_id": bson.Binary.from_uuid(id)}, {"$inc": {"version": 1}}, upsert=True)
+                for id in ids
+            ],
+            ordered=False,
+        )
+        for id in ids:
+            self._cache.pop(id)
+
+    @staticmethod
+    def _versions(ctx: MongoDaoContext):
+        return ctx.collection.database[f"{ctx.collection.name}_versions"]
+
+    def start_change_stream(self):
+        """Invalidates cached entries from a Mongo change stream, opened in the background. Until it is open, or if the
+        server does not support change streams, entries are checked against their version.
+        """
+        if self._change_stream_thread is not None:
+            return
+        self._change_stream_thread = threading.Thread(
+            target=self._watch_changes, name="catalog-change-stream", daemon=True
+        )
+        self._change_stream_thread.start()
+
+    def _watch_changes(self):
+        try:
+            for id in self._iterate_changed_ids():
+                self._cache.pop(id)
+        except pymongo.errors.PyMongoError as e:
+            LOGGER.warning(f"Catalog change stream is not available, falling back to version checks: {e}")
+        finally:
+            self._is_watching = False
+            self._cache.clear()
+
+    @transactional
+    def _iterate_changed_ids(self, ctx: MongoDaoContext) -> Iterator[UUID]:
+        with ctx.collection.watch() as stream:
+            # Entries cached or being loaded before the stream was opened could have missed events
+            self._cache.clear()
+            self._is_watching = True
+            for change in stream:
+                document_key = change.get("documentKey")
+                if document_key is not None:
+                    yield bson.Binary.as_uuid(document_key["_id"])
+                else:
+                    # drop, rename, invalidate: anything can be stale now
+                    self._cache.clear()
 
     @transactional
     def get_id_by_catalog_name(
@@ -106,14 +452,298 @@ class CatalogDao(BaseMongoDao):
         item = ctx.collection.find_one({"name": catalog_name})
         if item is not None:
             item = ctx.desanitize(item)
-            return self.schema.from_dict(item)
+            return get_codec(CatalogEntry, unknown=marshmallow.EXCLUDE).decode(item)
         return None
 
+    @transactional
+    def get_entities(
+        self,
+        ids: Optional[List[UUID]] = None,
+        names: Optional[List[str]] = None,
+        ctx: MongoDaoContext = None,
+    ) -> List[CatalogEntry]:
+        """Catalog entries by id or name, fetched with a single query. Missing entries are left out."""
+        ids = list(ids or [])
+        entries: List[CatalogEntry] = []
+
+        if self._is_watching:
+            # The change stream keeps cached entries fresh, only the rest has to be fetched
+            missing_ids = []
+            for id in ids:
+                cached = self._cache.get(id)
+                if cached is not None:
+                    entries.append(cached[1])
+                else:
+                    missing_ids.append(id)
+            ids = missing_ids
+
+        query = self._ids_or_names_query(ids, names)
+        if query is not None:
+            codec = get_codec(CatalogEntry, unknown=marshmallow.EXCLUDE)
+            entries.extend(codec.decode_many([ctx.desanitize(item) for item in ctx.collection.find(query)]))
+
+        return entries
+
+    @transactional
+    def get_entity_summaries(
+        self,
+        fields: List[str],
+        ids: Optional[List[UUID]] = None,
+        names: Optional[List[str]] = None,
+        ctx: MongoDaoContext = None,
+    ) -> List[dict]:
+        """Projection of catalog entries by id or name, fetched with a single query.
+        Fields are top level fields of CatalogEntry, or `recording_count`.
+        """
+        unknown_fields = set(fields) - set(SUMMARY_FIELDS)
+        if unknown_fields:
+            raise ValueError(f"Unknown catalog entry fields: {', '.join(sorted(unknown_fields))}")
+
+        query = self._ids_or_names_query(ids, names)
+        if query is None:
+            return []
+
+        projection = dict((field_name, SUMMARY_FIELDS[field_name]) for field_name in fields)
+        if "name" not in projection:
+            # Needed to match the results up with the requested names
+            projection["name"] = 1
+
+        result = []
+        for item in ctx.collection.aggregate([{"$match": query}, {"$project": projection}]):
+            item["id"] = bson.Binary.as_uuid(item.pop("_id"))
+            result.append(item)
+        return result
+
+    @staticmethod
+    def _ids_or_names_query(ids: Optional[List[UUID]], names: Optional[List[str]]) -> Optional[dict]:
+        conditions = []
+        if ids:
+            conditions.append({"_id": {"$in": [bson.Binary.from_uuid(id) for id in ids]}})
+        if names:
+            conditions.append({"name": {"$in": list(names)}})
+        if not conditions:
+            return None
+        return conditions[0] if len(conditions) == 1 else {"$or": conditions}
+
     @transactional
     def get_all_catalog_names(self, ctx: MongoDaoContext) -> Iterator[Tuple[UUID, str]]:
         for item in ctx.collection.find({}, {"name": 1}):
             yield bson.Binary.as_uuid(item["_id"]), item["name"]
 
+    @transactional
+    def get_catalog_names_page(
+        self,
+        limit: int,
+        after_name: Optional[str] = None,
+        after_id: Optional[UUID] = None,
+        prefix: Optional[str] = None,
+        sort_by: str = "name",
+        descending: bool = False,
+        ctx: MongoDaoContext = None,
+    ) -> Iterator[Tuple[UUID, str]]:
+        """Keyset pagination over catalog names. Pages are sorted by name (ties broken by id) or by id, and continue
+        after the last (name, id) pair of the previous page, so page cost does not grow with the offset.
+        """
+        if sort_by not in ("name", "id"):
+            raise ValueError(f"Cannot sort catalog names by '{sort_by}'")
+
+        direction = pymongo.DESCENDING if descending else pymongo.ASCENDING
+        after_op = "$lt" if descending else "$gt"
+
+        conditions = []
+        if prefix:
+            conditions.append({"name": {"$regex": f"^{re.escape(prefix)}"}})
+
+        if after_id is not None:
+            after_key = bson.Binary.from_uuid(after_id)
+            if sort_by == "name":
+                conditions.append(
+                    {
+                        "$or": [
+                            {"name": {after_op: after_name}},
+                            {"name": after_name, "_id": {after_op: after_key}},
+                        ]
+                    }
+                )
+            else:
+                conditions.append({"_id": {after_op: after_key}})
+
+        sort = [("name", direction), ("_id", direction)] if sort_by == "name" else [("_id", direction)]
+        query = {"$and": conditions} if conditions else {}
+
+        for item in ctx.collection.find(query, {"name": 1}).sort(sort).limit(limit):
+            yield bson.Binary.as_uuid(item["_id"]), item["name"]
+
+    @transactional
+    def search(
+        self,
+        text: Optional[str] = None,
+        filters: Optional[Dict[str, str]] = None,
+        page: int = 0,
+        page_size: int = 20,
+        ctx: MongoDaoContext = None,
+    ) -> CatalogSearchResult:
+        """Full text search over catalog and recording names, descriptions and comments.
+        One page of hits, the total count and the value counts of every facet are computed in a single aggregation.
+        """
+        conditions = []
+        if text:
+            conditions.append({"$text": {"$search": text}})
+
+        for facet_name, value in (filters or {}).items():
+            if facet_name not in SEARCH_FACETS:
+                raise ValueError(f"Unknown search facet '{facet_name}'")
+            _, paths = SEARCH_FACETS[facet_name]
+            conditions.append({"$or": [{path: value} for path in paths]})
+
+        pipeline = []
+        if conditions:
+            pipeline.append({"$match": {"$and": conditions}})
+
+        sort = {"score": {"$meta": "textScore"}, "name": pymongo.ASCENDING} if text else {"name": pymongo.ASCENDING}
+        hit_projection = {
+            "name": 1,
+            "description": 1,
+            "recording_count": {"$size": {"$ifNull": ["$recordings", []]}},
+            "score": {"$meta": "textScore"} if text else {"$literal": 0.0},
+        }
+
+        facets = {
+            "hits": [{"$sort": sort}, {"$skip": page * page_size}, {"$limit": page_size}, {"$project": hit_projection}],
+            "total": [{"$count": "count"}],
+        }
+        for facet_name, (values, _) in SEARCH_FACETS.items():
+            facets[facet_name] = [
+                # Count every catalog once per distinct value
+                {"$project": {"value": {"$setUnion": [values, []]}}},
+                {"$unwind": "$value"},
+                {"$group": {"_id": "$value", "count": {"$sum": 1}}},
+            ]
+        pipeline.append({"$facet": facets})
+
+        result = next(ctx.collection.aggregate(pipeline), None) or {}
+        total = result.get("total") or [{"count": 0}]
+
+        return CatalogSearchResult(
+            total=total[0]["count"],
+            hits=[
+                CatalogSearchHit(
+                    id=bson.Binary.as_uuid(item["_id"]),
+                    name=item["name"],
+                    description=item.get("description"),
+                    recording_count=item["recording_count"],
+                    score=item["score"],
+                )
+                for item in result.get("hits", [])
+            ],
+            facets=dict(
+                (facet_name, dict((str(item["_id"]), item["count"]) for item in result.get(facet_name, []) if item["_id"] is not None))
+                for facet_name in SEARCH_FACETS
+            ),
+        )
+
+    @transactional
+    def iterate_versions(self, ctx: MongoDaoContext) -> Iterator[Tuple[UUID, int]]:
+        """Version counter of every catalog entry, 0 for entries which were never written through this dao"""
+        pipeline = [
+            {"$project": {"_id": 1}},
+            {"$lookup": {"from": self._versions(ctx).name, "localField": "_id", "foreignField": "_id", "as": "version"}},
+            {"$project": {"version": {"$ifNull": [{"$arrayElemAt": ["$version.version", 0]}, 0]}}},
+        ]
+        for item in ctx.collection.aggregate(pipeline):
+            yield bson.Binary.as_uuid(item["_id"]), item["version"]
+
+    @transactional
+    def aggregate_stats(self, ids: List[UUID], gridfs_bucket: str = "fs", ctx: MongoDaoContext = None) -> Iterator[dict]:
+        """Recording count and per format file count, duration and stored bytes of the given catalog entries.
+        Sizes are taken from the GridFS files collection, attachments without an uploaded file count with 0 bytes.
+        The audio sources are summed up separately, as the converted files hold the same audio once more.
+        """
+        sources = {
+            "$map": {
+                "input": {"$ifNull": ["$recordings.audio_sources", []]},
+                "in": {"$mergeObjects": ["$$this", {"is_source": True}]},
+            }
+        }
+        files = {"$concatArrays": [sources, {"$ifNull": ["$recordings.audio_files", []]}]}
+        # GridFS ids are ObjectIds unless the uploader picked its own
+        gridfs_id = {"$convert": {"input": "$$file_id", "to": "objectId", "onError": "$$file_id", "onNull": None}}
+
+        pipeline = [
+            {"$match": {"_id": {"$in": [bson.Binary.from_uuid(id) for id in ids]}}},
+            {"$unwind": {"path": "$recordings", "includeArrayIndex": "recording_index", "preserveNullAndEmptyArrays": True}},
+            {"$project": {"recording_index": 1, "file": files}},
+            {"$unwind": {"path": "$file", "preserveNullAndEmptyArrays": True}},
+            {
+                "$lookup": {
+                    "from": f"{gridfs_bucket}.files",
+                    "let": {"file_id": "$file.file_id"},
+                    "pipeline": [{"$match": {"$expr": {"$eq": ["$_id", gridfs_id]}}}, {"$project": {"length": 1}}],
+                    "as": "blob",
+                }
+            },
+            {
+                "$group": {
+                    "_id": {"catalog": "$_id", "format": "$file.format"},
+                    "recordings": {"$addToSet": "$recording_index"},
+                    "file_count": {"$sum": {"$cond": [{"$ifNull": ["$file", False]}, 1, 0]}},
+                    "duration_seconds": {"$sum": {"$ifNull": ["$file.duration_seconds", 0]}},
+                    "source_duration_seconds": {
+                        "$sum": {"$cond": ["$file.is_source", {"$ifNull": ["$file.duration_seconds", 0]}, 0]}
+                    },
+                    "size_bytes": {"$sum": {"$ifNull": [{"$arrayElemAt": ["$blob.length", 0]}, 0]}},
+                }
+            },
+            {
+                "$group": {
+                    "_id": "$_id.catalog",
+                    "recordings": {"$push": "$recordings"},
+                    "formats": {
+                        "$push": {
+                            "format": {"$ifNull": ["$_id.format", "unknown"]},
+                            "file_count": "$file_count",
+                            "duration_seconds": "$duration_seconds",
+                            "source_duration_seconds": "$source_duration_seconds",
+                            "size_bytes": "$size_bytes",
+                        }
+                    },
+                }
+            },
+            {
+                "$project": {
+                    "recording_count": {
+                        "$size": {
+                            "$filter": {
+                                "input": {"$reduce": {"input": "$recordings", "initialValue": [], "in": {"$setUnion": ["$$value", "$$this"]}}},
+                                "cond": {"$ne": ["$$this", None]},
+                            }
+                        }
+                    },
+                    "formats": {"$filter": {"input": "$formats", "cond": {"$gt": ["$$this.file_count", 0]}}},
+                }
+            },
+        ]
+
+        for item in ctx.collection.aggregate(pipeline):
+            item["_id"] = bson.Binary.as_uuid(item["_id"])
+            yield item
+
+    @transactional
+    def ensure_indexes(self, ctx: MongoDaoContext):
+        ctx.collection.create_index([("name", pymongo.ASCENDING), ("_id", pymongo.ASCENDING)])
+        ctx.collection.create_index(
+            [
+                ("name", pymongo.TEXT),
+                ("description", pymongo.TEXT),
+                ("meta.comment", pymongo.TEXT),
+                ("recordings.name", pymongo.TEXT),
+                ("recordings.description", pymongo.TEXT),
+                ("recordings.meta.comment", pymongo.TEXT),
+            ],
+            weights={"name": 10, "recordings.name": 5},
+            name="catalog_text_search",
+        )
+
     # TODO:
     #       - CRUD recordings
     #       - CRUD recording attachments [both]
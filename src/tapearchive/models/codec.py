@@ -0,0 +1,182 @@
+"""Precompiled encoders and decoders for the catalog dataclasses.
+
+dataclasses_json builds a marshmallow schema on every `schema()` call and walks type hints again on every
+`from_dict()`, which dominates the cost of loading catalogs with many nested recordings and attachments.
+`get_codec()` resolves the field types of a dataclass once and turns them into a flat list of converter functions.
+
+Encoded dicts have the layout of `schema().dump()`, enums by name, and either that or the `to_dict()` layout, enums by
+value, is decoded. Catalog manifests on disk were dumped with the former, documents in Mongo with the latter.
+"""
+import dataclasses
+import enum
+import functools
+import pathlib
+from typing import Any, Callable, Dict, List, Tuple, Type, TypeVar, Union, get_args, get_origin, get_type_hints
+from uuid import UUID
+
+import marshmallow
+
+T = TypeVar("T")
+
+Converter = Callable[[Any], Any]
+
+
+def _identity(value: Any) -> Any:
+    return value
+
+
+def _optional(converter: Converter) -> Converter:
+    if converter is _identity:
+        return converter
+    return lambda value: None if value is None else converter(value)
+
+
+def _list_of(converter: Converter) -> Converter:
+    if converter is _identity:
+        return list
+    return lambda values: [converter(value) for value in values]
+
+
+def _dict_of(converter: Converter) -> Converter:
+    if converter is _identity:
+        return dict
+    return lambda values: {key: converter(value) for key, value in values.items()}
+
+
+def _decode_uuid(value: Any) -> UUID:
+    return value if isinstance(value, UUID) else UUID(str(value))
+
+
+def _encode_enum(value: enum.Enum) -> str:
+    return value.name
+
+
+def _decode_enum(enum_type: Type[enum.Enum]) -> Converter:
+    def decode(value: Any) -> enum.Enum:
+        if isinstance(value, enum_type):
+            return value
+        try:
+            return enum_type(value)
+        except ValueError:
+            if isinstance(value, str) and value in enum_type.__members__:
+                return enum_type[value]
+            raise ValueError(f"{value!r} is not a valid {enum_type.__name__}")
+
+    return decode
+
+
+def _is_optional(field_type: Any) -> bool:
+    return get_origin(field_type) is Union and type(None) in get_args(field_type)
+
+
+def _is_enum(field_type: Any) -> bool:
+    if _is_optional(field_type):
+        arguments = [arg for arg in get_args(field_type) if arg is not type(None)]
+        return len(arguments) == 1 and _is_enum(arguments[0])
+    return isinstance(field_type, type) and issubclass(field_type, enum.Enum)
+
+
+def _converters_for_type(field_type: Any, unknown: str) -> Tuple[Converter, Converter]:
+    """Returns (encoder, decoder) for a type hint."""
+    origin = get_origin(field_type)
+
+    if origin is Union:
+        arguments = [arg for arg in get_args(field_type) if arg is not type(None)]
+        if len(arguments) == 1:
+            encoder, decoder = _converters_for_type(arguments[0], unknown)
+            return _optional(encoder), _optional(decoder)
+        return _identity, _identity
+
+    if origin in (list, List):
+        (item_type,) = get_args(field_type) or (Any,)
+        encoder, decoder = _converters_for_type(item_type, unknown)
+        return _optional(_list_of(encoder)), _optional(_list_of(decoder))
+
+    if origin in (dict, Dict):
+        _, value_type = get_args(field_type) or (Any, Any)
+        encoder, decoder = _converters_for_type(value_type, unknown)
+        return _optional(_dict_of(encoder)), _optional(_dict_of(decoder))
+
+    if dataclasses.is_dataclass(field_type):
+        codec = get_codec(field_type, unknown=unknown)
+        return codec.encode, codec.decode
+
+    if isinstance(field_type, type):
+        if issubclass(field_type, enum.Enum):
+            return _encode_enum, _decode_enum(field_type)
+        if issubclass(field_type, UUID):
+            return str, _decode_uuid
+        if issubclass(field_type, pathlib.PurePath):
+            return str, pathlib.Path
+
+    return _identity, _identity
+
+
+@dataclasses.dataclass(frozen=True)
+class _FieldCodec:
+    name: str
+    encoder: Converter
+    decoder: Converter
+    is_required: bool
+
+
+class Codec:
+    """Encodes a dataclass to a plain dict (same layout as `schema().dump()`) and decodes it back.
+
+    `unknown` is what decode() does with keys which are not fields, like in marshmallow: RAISE a ValidationError, or
+    EXCLUDE them.
+    """
+
+    def __init__(self, cls: type, unknown: str = marshmallow.RAISE) -> None:
+        self._cls = cls
+        self._unknown = unknown
+        self._fields: List[_FieldCodec] = []
+
+        type_hints = get_type_hints(cls)
+        for field in dataclasses.fields(cls):
+            field_type = type_hints[field.name]
+            encoder, decoder = _converters_for_type(field_type, unknown)
+
+            # Honour per-field overrides set with dataclasses_json.config(). Enum overrides are by value only, they
+            # would reject the names in the manifests dumped by marshmallow.
+            if not _is_enum(field_type):
+                overrides = field.metadata.get("dataclasses_json", {})
+                encoder = overrides.get("encoder", encoder)
+                decoder = overrides.get("decoder", decoder)
+
+            is_required = field.default is dataclasses.MISSING and field.default_factory is dataclasses.MISSING
+            self._fields.append(_FieldCodec(field.name, encoder, decoder, is_required))
+        self._field_names = frozenset(field.name for field in self._fields)
+
+    def encode(self, obj: Any) -> Dict[str, Any]:
+        return {field.name: field.encoder(getattr(obj, field.name)) for field in self._fields}
+
+    def decode(self, data: Dict[str, Any]) -> Any:
+        kwargs = {}
+        errors = {}
+        for field in self._fields:
+            if field.name in data:
+                try:
+                    kwargs[field.name] = field.decoder(data[field.name])
+                except (ValueError, TypeError, KeyError, AttributeError, marshmallow.ValidationError) as e:
+                    errors[field.name] = e.messages if isinstance(e, marshmallow.ValidationError) else [str(e)]
+            elif field.is_required:
+                errors[field.name] = ["Missing data for required field."]
+
+        if self._unknown == marshmallow.RAISE:
+            for key in data.keys() - self._field_names:
+                errors[key] = ["Unknown field."]
+
+        if errors:
+            raise marshmallow.ValidationError(errors, data=data)
+
+        return self._cls(**kwargs)
+
+    def decode_many(self, items: List[Dict[str, Any]]) -> List[Any]:
+        decode = self.decode
+        return [decode(item) for item in items]
+
+
+@functools.lru_cache(maxsize=None)
+def get_codec(cls: Type[T], unknown: str = marshmallow.RAISE) -> Codec:
+    return Codec(cls, unknown)
@@ -0,0 +1,239 @@
+from dataclasses import dataclass
+import logging
+from typing import Dict, Iterable, List, Optional, Tuple
+from uuid import UUID
+
+import bson
+from dataclasses_json import DataClassJsonMixin
+import marshmallow
+import more_itertools
+import numpy as np
+import pymongo
+import pymongo.errors
+
+from tq.database.db import transactional, BaseEntity
+from tq.database.mongo_dao import BaseMongoDao, MongoDaoContext
+
+from tapearchive.models.codec import get_codec
+
+LOGGER = logging.getLogger(__name__)
+
+MAX_HASH_POSTINGS = 2000  # landmarks of a hash in the whole archive, more common hashes are not indexed
+LANDMARK_CHUNK_SIZE = 65536  # landmarks of a recording per document, 512 KiB
+
+_DUPLICATE_KEY = 11000
+
+
+@dataclass
+class Fingerprint(BaseEntity):
+    """Landmarks of a recording, id is the id of the recording"""
+
+    catalog_id: UUID
+    source_file_id: str
+    landmark_count: int
+    frames_per_second: float
+
+
+@dataclass
+class DuplicateCandidate(DataClassJsonMixin):
+    catalog_id: UUID
+    recording_id: UUID
+    matches: int  # landmarks matching at the offset
+    offset_seconds: float  # time in the candidate minus time in the recording
+    start_seconds: float  # range of the recording matching the candidate
+    end_seconds: float
+
+
+def group_postings(hashes: np.ndarray, frames: np.ndarray) -> Iterable[Tuple[int, np.ndarray]]:
+    """Frames of the landmarks of a recording per hash, in hash order"""
+    if len(hashes) == 0:
+        return
+    order = np.argsort(hashes, kind="stable")
+    sorted_hashes = hashes[order]
+    starts = np.flatnonzero(np.concatenate(([True], sorted_hashes[1:] != sorted_hashes[:-1])))
+    for start, end in zip(starts, np.append(starts[1:], len(order))):
+        yield int(sorted_hashes[start]), frames[order[start:end]]
+
+
+def decode_postings(
+    items: Iterable[dict], exclude: Optional[UUID] = None
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray, List[UUID]]:
+    """Hashes, frames and recording indices of the landmarks in posting documents, and the recording ids the indices
+    refer to. Postings of the `exclude` recording are left out.
+    """
+    excluded = exclude.bytes if exclude is not None else None
+    recordings: List[UUID] = []
+    indices: Dict[bytes, int] = {}
+    hashes, frames, candidates = [], [], []
+    for item in items:
+        for posting in item["p"]:
+            recording = bytes(posting["r"])
+            if recording == excluded:
+                continue
+            index = indices.get(recording)
+            if index is None:
+                index = indices[recording] = len(recordings)
+                recordings.append(UUID(bytes=recording))
+            posting_frames = np.frombuffer(posting["t"], dtype="<u4")
+            hashes.append(np.full(len(posting_frames), item["_id"], dtype=np.int64))
+            frames.append(posting_frames)
+            candidates.append(np.full(len(posting_frames), index, dtype=np.int64))
+
+    if not frames:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty, empty, recordings
+    return np.concatenate(hashes), np.concatenate(frames).astype(np.int64), np.concatenate(candidates), recordings
+
+
+class FingerprintDao(BaseMongoDao):
+    """Fingerprints of the recordings, with an inverted index of their landmarks.
+
+    The index is a document per hash in the `_postings` side collection: `n` landmarks of the hash in the archive and
+    `p` postings, a recording id `r` and the frames `t` of its landmarks of the hash as little endian uint32. A lookup
+    reads a document per distinct hash, not one per landmark. Hashes with more than MAX_HASH_POSTINGS landmarks, eg.
+    of hum or tones, match everything alike: they are marked stopped `s`, their postings are dropped and they are not
+    looked up anymore.
+
+    The landmarks of a recording are kept in time order in the `_landmarks` side collection, in chunks of
+    LANDMARK_CHUNK_SIZE with the first and last frame `f0`, `f1` of the chunk.
+    """
+
+    def __init__(self, db_pool, batch_size: int = 5000):
+        super().__init__(db_pool, Fingerprint, key_prefix="fingerprint")
+        self._batch_size = batch_size
+
+    @transactional
+    def store(self, fingerprint: Fingerprint, hashes: np.ndarray, frames: np.ndarray, ctx: MongoDaoContext):
+        """Replaces the landmarks of a recording"""
+        self._remove_landmarks(fingerprint.id, ctx)
+        recording = bson.Binary.from_uuid(fingerprint.id)
+        hashes, frames = hashes.astype("<u4"), frames.astype("<u4")
+
+        for n, start in enumerate(range(0, len(hashes), LANDMARK_CHUNK_SIZE)):
+            end = min(start + LANDMARK_CHUNK_SIZE, len(hashes))
+            self._landmarks(ctx).insert_one(
+                {
+                    "r": recording,
+                    "n": n,
+                    "f0": int(frames[start]),
+                    "f1": int(frames[end - 1]),
+                    "h": bson.Binary(hashes[start:end].tobytes()),
+                    "t": bson.Binary(frames[start:end].tobytes()),
+                }
+            )
+
+        postings = self._postings(ctx)
+        for batch in more_itertools.chunked(group_postings(hashes, frames), self._batch_size):
+            # Stopped hashes do not match the filter, their upserts fail on the duplicate key and are skipped
+            requests = [
+                pymongo.UpdateOne(
+                    {"_id": h, "s": {"$ne": True}},
+                    {
+                        "$inc": {"n": len(posting_frames)},
+                        "$push": {"p": {"r": recording, "t": bson.Binary(posting_frames.tobytes())}},
+                    },
+                    upsert=True,
+                )
+                for h, posting_frames in batch
+            ]
+            try:
+                postings.bulk_write(requests, ordered=False)
+            except pymongo.errors.BulkWriteError as e:
+                if any(error["code"] != _DUPLICATE_KEY for error in e.details["writeErrors"]):
+                    raise
+            postings.update_many(
+                {"_id": {"$in": [h for h, _ in batch]}, "n": {"$gt": MAX_HASH_POSTINGS}},
+                {"$set": {"s": True, "p": []}},
+            )
+
+        self.create_or_update(fingerprint)
+
+    @transactional
+    def get_fingerprint(self, id: UUID, ctx: MongoDaoContext) -> Optional[Fingerprint]:
+        item = ctx.collection.find_one({"_id": bson.Binary.from_uuid(id)})
+        if item is not None:
+            return get_codec(Fingerprint, unknown=marshmallow.EXCLUDE).decode(ctx.desanitize(item))
+        return None
+
+    @transactional
+    def get_fingerprints(self, ids: List[UUID], ctx: MongoDaoContext) -> Dict[UUID, Fingerprint]:
+        items = ctx.collection.find({"_id": {"$in": [bson.Binary.from_uuid(id) for id in ids]}})
+        codec = get_codec(Fingerprint, unknown=marshmallow.EXCLUDE)
+        fingerprints = codec.decode_many([ctx.desanitize(item) for item in items])
+        return dict((fingerprint.id, fingerprint) for fingerprint in fingerprints)
+
+    @transactional
+    def get_landmarks(
+        self, id: UUID, start_frame: int = 0, end_frame: Optional[int] = None, ctx: MongoDaoContext = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Hashes and frames of the landmarks of a recording from `start_frame` up to `end_frame`, only the chunks
+        covering the range are read
+        """
+        hashes, frames = self._read_landmarks(id, start_frame, end_frame, ctx)
+        is_selected = frames >= start_frame
+        if end_frame is not None:
+            is_selected &= frames < end_frame
+        return hashes[is_selected], frames[is_selected]
+
+    def _read_landmarks(
+        self, id: UUID, start_frame: int, end_frame: Optional[int], ctx: MongoDaoContext
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Hashes and frames of the landmark chunks of a recording which overlap the range"""
+        query = {"r": bson.Binary.from_uuid(id), "f1": {"$gte": start_frame}}
+        if end_frame is not None:
+            query["f0"] = {"$lt": end_frame}
+        items = list(self._landmarks(ctx).find(query, {"_id": 0, "h": 1, "t": 1}).sort("n", pymongo.ASCENDING))
+        if not items:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+
+        hashes = np.concatenate([np.frombuffer(item["h"], dtype="<u4") for item in items]).astype(np.int64)
+        frames = np.concatenate([np.frombuffer(item["t"], dtype="<u4") for item in items]).astype(np.int64)
+        return hashes, frames
+
+    @transactional
+    def find_landmarks(
+        self, hashes: np.ndarray, exclude_id: Optional[UUID] = None, ctx: MongoDaoContext = None
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray, List[UUID]]:
+        """Landmarks of other recordings with any of the hashes: hashes, frames, recording indices and the
+        recording ids the indices refer to. Stopped hashes are left out.
+        """
+
+        def iterate_postings():
+            for batch in more_itertools.chunked(np.unique(hashes).tolist(), self._batch_size):
+                yield from self._postings(ctx).find({"_id": {"$in": batch}, "s": {"$ne": True}}, {"p": 1})
+
+        return decode_postings(iterate_postings(), exclude=exclude_id)
+
+    @transactional
+    def delete_fingerprint(self, id: UUID, ctx: MongoDaoContext):
+        self._remove_landmarks(id, ctx)
+        ctx.collection.delete_one({"_id": bson.Binary.from_uuid(id)})
+
+    def _remove_landmarks(self, id: UUID, ctx: MongoDaoContext):
+        """Removes the landmarks of a recording and its postings"""
+        recording = bson.Binary.from_uuid(id)
+        hashes, frames = self._read_landmarks(id, 0, None, ctx)
+        for batch in more_itertools.chunked(group_postings(hashes, frames), self._batch_size):
+            self._postings(ctx).bulk_write(
+                [
+                    pymongo.UpdateOne(
+                        {"_id": h, "s": {"$ne": True}},
+                        {"$inc": {"n": -len(posting_frames)}, "$pull": {"p": {"r": recording}}},
+                    )
+                    for h, posting_frames in batch
+                ],
+                ordered=False,
+            )
+        self._landmarks(ctx).delete_many({"r": recording})
+
+    @transactional
+    def ensure_indexes(self, ctx: MongoDaoContext):
+        self._landmarks(ctx).create_index([("r", pymongo.ASCENDING), ("n", pymongo.ASCENDING)], unique=True)
+
+    @staticmethod
+    def _postings(ctx: MongoDaoContext):
+        return ctx.collection.database[f"{ctx.collection.name}_postings"]
+
+    @staticmethod
+    def _landmarks(ctx: MongoDaoContext):
+        return ctx.collection.database[f"{ctx.collection.name}_landmarks"]
@@ -0,0 +1,90 @@
+import hashlib
+import pathlib
+from typing import Optional, Union
+
+import bson
+import gridfs
+import numpy as np
+import pymongo
+from pymongo import MongoClient
+
+from tq.database.gridfs_dao import BucketGridFsDao
+
+from tapearchive.analysis.pcm_cache import PcmCache
+from tapearchive.metrics import GRIDFS_BYTES
+
+FileId = Union[str, bson.ObjectId]
+
+FILE_CHECKSUM_ALGORITHM = "sha256"
+
+
+def to_gridfs_id(file_id: FileId) -> FileId:
+    """File ids are passed around as strings, GridFS assigns ObjectIds unless the uploader picked its own id"""
+    if isinstance(file_id, str) and bson.ObjectId.is_valid(file_id):
+        return bson.ObjectId(file_id)
+    return file_id
+
+
+def file_checksum(path: pathlib.Path, block_size: int = 1024 * 1024) -> str:
+    """sha256 of a file read block by block. hashlib releases the GIL on large blocks, files can be hashed in threads"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class FileDao(BucketGridFsDao):
+    """GridFS file storage with streamed, seekable access to the stored files."""
+
+    def __init__(self, db_pool: MongoClient, bucket_name: str = "fs"):
+        super().__init__(db_pool)
+        self._bucket = gridfs.GridFSBucket(db_pool.get_default_database(), bucket_name=bucket_name)
+        self._files = db_pool.get_default_database()[f"{bucket_name}.files"]
+
+    def open_download_stream(self, file_id: FileId) -> gridfs.GridOut:
+        """Seekable read stream, reads only the chunks which are covering the requested bytes.
+        Raises gridfs.errors.NoFile if there is no such file.
+        """
+        return self._bucket.open_download_stream(to_gridfs_id(file_id))
+
+    def upload(self, filename: str, data: bytes, metadata: Optional[dict] = None) -> str:
+        file_id = self._bucket.upload_from_stream(filename, data, metadata=metadata)
+        GRIDFS_BYTES.labels("write").inc(len(data))
+        return str(file_id)
+
+    def open_upload_stream(self, filename: str, metadata: Optional[dict] = None) -> gridfs.GridIn:
+        """Write stream for files produced piece by piece, the file is stored when the stream is closed"""
+        return self._bucket.open_upload_stream(filename, metadata=metadata)
+
+    def load_pcm(self, file_id: FileId, pcm_cache: PcmCache) -> np.ndarray:
+        """Decoded audio of a file from the node-local cache, downloaded and decoded on a miss.
+        Raises gridfs.errors.NoFile if there is no such file, RuntimeError if it cannot be decoded.
+        """
+        pcm = pcm_cache.get(str(file_id))
+        if pcm is None:
+            with self.open_download_stream(file_id) as grid_out:
+                pcm = pcm_cache.put(str(file_id), grid_out)
+                GRIDFS_BYTES.labels("read").inc(grid_out.length)
+        return pcm
+
+    def delete_file(self, file_id: FileId):
+        self._bucket.delete(to_gridfs_id(file_id))
+
+    def find_by_checksum(self, checksum: str) -> Optional[str]:
+        """Id of a file with the content of the checksum, stored by pull_from_disk()"""
+        item = self._files.find_one(
+            {"metadata.checksum": checksum, "metadata.checksum_algorithm": FILE_CHECKSUM_ALGORITHM}, {"_id": 1}
+        )
+        return str(item["_id"]) if item is not None else None
+
+    def pull_from_disk(self, path: pathlib.Path, checksum: Optional[str] = None) -> str:
+        """Uploads a file, the checksum of file_checksum() is stored with it to find it by its content later"""
+        metadata = {"checksum": checksum, "checksum_algorithm": FILE_CHECKSUM_ALGORITHM} if checksum else None
+        with open(path, "rb") as f:
+            file_id = self._bucket.upload_from_stream(pathlib.Path(path).name, f, metadata=metadata)
+            GRIDFS_BYTES.labels("write").inc(f.tell())
+            return str(file_id)
+
+    def ensure_indexes(self):
+        self._files.create_index([("metadata.checksum", pymongo.ASCENDING)], sparse=True)
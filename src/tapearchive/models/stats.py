@@ -0,0 +1,189 @@
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+import logging
+import threading
+from typing import Dict, Iterator, List, Optional, Tuple
+from uuid import UUID
+
+import bson
+from dataclasses_json import DataClassJsonMixin
+import more_itertools
+
+from tq.database.db import transactional, BaseEntity
+from tq.database.mongo_dao import BaseMongoDao, MongoDaoContext
+
+from tapearchive.models.catalog import CatalogDao
+from tapearchive.models.codec import get_codec
+
+LOGGER = logging.getLogger(__name__)
+
+# Stored catalog stats of an older schema are aggregated again
+STATS_SCHEMA_VERSION = 1
+
+
+@dataclass
+class FormatStats(DataClassJsonMixin):
+    format: str
+    file_count: int = 0
+    duration_seconds: float = 0.0
+    source_duration_seconds: float = 0.0  # of the audio sources only, converted files repeat their audio
+    size_bytes: int = 0
+
+
+@dataclass
+class CatalogStats(BaseEntity):
+    """Contribution of a single catalog entry to the archive totals, id is the id of the catalog entry"""
+
+    version: int
+    recording_count: int
+    formats: List[FormatStats] = field(default_factory=list)
+    schema_version: int = 0
+
+
+@dataclass
+class ArchiveStats(DataClassJsonMixin):
+    catalog_count: int
+    recording_count: int
+    file_count: int
+    audio_hours: float
+    size_bytes: int
+    formats: Dict[str, FormatStats]
+    updated_at: datetime
+
+
+class CatalogStatsDao(BaseMongoDao):
+    def __init__(self, db_pool):
+        super().__init__(db_pool, CatalogStats, key_prefix="catalog_stats")
+
+    @transactional
+    def iterate_versions(self, ctx: MongoDaoContext) -> Iterator[Tuple[UUID, Optional[int]]]:
+        """Catalog version the stats were aggregated from, None if they are of an older schema"""
+        for item in ctx.collection.find({}, {"version": 1, "schema_version": 1}):
+            is_current = item.get("schema_version", 0) == STATS_SCHEMA_VERSION
+            yield bson.Binary.as_uuid(item["_id"]), item["version"] if is_current else None
+
+    @transactional
+    def get_totals(self, ctx: MongoDaoContext) -> ArchiveStats:
+        pipeline = [
+            {
+                "$facet": {
+                    "totals": [
+                        {"$group": {"_id": None, "catalog_count": {"$sum": 1}, "recording_count": {"$sum": "$recording_count"}}}
+                    ],
+                    "formats": [
+                        {"$unwind": "$formats"},
+                        {
+                            "$group": {
+                                "_id": "$formats.format",
+                                "file_count": {"$sum": "$formats.file_count"},
+                                "duration_seconds": {"$sum": "$formats.duration_seconds"},
+                                "source_duration_seconds": {"$sum": "$formats.source_duration_seconds"},
+                                "size_bytes": {"$sum": "$formats.size_bytes"},
+                            }
+                        },
+                    ],
+                }
+            }
+        ]
+        result = next(ctx.collection.aggregate(pipeline))
+        totals = more_itertools.first(result["totals"], {"catalog_count": 0, "recording_count": 0})
+        formats = dict(
+            (
+                item["_id"],
+                FormatStats(
+                    format=item["_id"],
+                    file_count=item["file_count"],
+                    duration_seconds=item["duration_seconds"],
+                    source_duration_seconds=item["source_duration_seconds"],
+                    size_bytes=item["size_bytes"],
+                ),
+            )
+            for item in result["formats"]
+        )
+
+        return ArchiveStats(
+            catalog_count=totals["catalog_count"],
+            recording_count=totals["recording_count"],
+            file_count=sum(f.file_count for f in formats.values()),
+            audio_hours=sum(f.source_duration_seconds for f in formats.values()) / 3600.0,
+            size_bytes=sum(f.size_bytes for f in formats.values()),
+            formats=formats,
+            updated_at=datetime.now(),
+        )
+
+
+class ArchiveStatsAggregator:
+    """Keeps per catalog statistics in sync with the catalog version counters and sums them up into a snapshot.
+    A refresh only aggregates catalog entries which were created, changed or deleted since the previous one.
+
+    The totals count the bytes of the attachments stored in GridFS and the duration of the audio sources, which are
+    known once a source was uploaded and analyzed, or imported from a readable file. Other attachments count as 0.
+    """
+
+    def __init__(self, catalog_dao: CatalogDao, catalog_stats_dao: CatalogStatsDao, batch_size: int = 500, gridfs_bucket: str = "fs"):
+        self._catalog_dao = catalog_dao
+        self._catalog_stats_dao = catalog_stats_dao
+        self._batch_size = batch_size
+        self._gridfs_bucket = gridfs_bucket
+
+        self._lock = threading.Lock()
+        self._snapshot: Optional[ArchiveStats] = None
+        self._checked_at: Optional[datetime] = None
+
+    def refresh(self, max_age: Optional[timedelta] = None) -> ArchiveStats:
+        """Aggregates the changes since the previous refresh. With `max_age` the snapshot is returned as it is if it
+        was checked for changes within that time, eg. by a concurrent request.
+        """
+        with self._lock:
+            if self._is_fresh(max_age):
+                return self._snapshot
+
+            catalog_versions = dict(self._catalog_dao.iterate_versions())
+            stats_versions = dict(self._catalog_stats_dao.iterate_versions())
+
+            changed_ids = [id for id, version in catalog_versions.items() if stats_versions.get(id) != version]
+            deleted_ids = [id for id in stats_versions if id not in catalog_versions]
+
+            for ids in more_itertools.chunked(changed_ids, self._batch_size):
+                self._update_catalog_stats(ids, catalog_versions)
+
+            for id in deleted_ids:
+                self._catalog_stats_dao.delete(id)
+
+            if changed_ids or deleted_ids or self._snapshot is None:
+                LOGGER.info(f"Archive stats refreshed, changed={len(changed_ids)} deleted={len(deleted_ids)}")
+                self._snapshot = self._catalog_stats_dao.get_totals()
+
+            # Set on every refresh, the snapshot itself is only replaced when something changed
+            self._checked_at = datetime.now()
+            return self._snapshot
+
+    def is_fresh(self, max_age: timedelta) -> bool:
+        return self._is_fresh(max_age)
+
+    def _is_fresh(self, max_age: Optional[timedelta]) -> bool:
+        return (
+            max_age is not None
+            and self._snapshot is not None
+            and self._checked_at is not None
+            and datetime.now() - self._checked_at <= max_age
+        )
+
+    def _update_catalog_stats(self, ids: List[UUID], catalog_versions: Dict[UUID, int]):
+        format_stats_codec = get_codec(FormatStats)
+        stats = [
+            CatalogStats(
+                id=item["_id"],
+                version=catalog_versions[item["_id"]],
+                recording_count=item["recording_count"],
+                formats=format_stats_codec.decode_many(item["formats"]),
+                schema_version=STATS_SCHEMA_VERSION,
+            )
+            for item in self._catalog_dao.aggregate_stats(ids, gridfs_bucket=self._gridfs_bucket)
+        ]
+        if stats:
+            self._catalog_stats_dao.bulk_create_or_update(stats)
+
+    @property
+    def snapshot(self) -> Optional[ArchiveStats]:
+        return self._snapshot
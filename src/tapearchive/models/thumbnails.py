@@ -0,0 +1,83 @@
+import pathlib
+from typing import BinaryIO, Dict, Iterable, Optional
+from uuid import UUID
+
+import gridfs.errors
+from pymongo import MongoClient
+
+from tapearchive.metrics import GRIDFS_BYTES
+from tapearchive.models.catalog import Attachment, AttachmentType
+from tapearchive.models.raw_data import FileDao, to_gridfs_id
+from tapearchive.utils.images import THUMBNAIL_MIMETYPE, THUMBNAIL_SIZES, render_thumbnails
+
+THUMBNAIL_ATTACHMENT_TYPES = (AttachmentType.COVER, AttachmentType.DOCUMENT)
+
+
+def thumbnail_filename(attachment_id: UUID, size: int) -> str:
+    return f"thumbnail/{attachment_id}/{size}"
+
+
+def thumbnail_source_id(attachment: Attachment, data_directory: pathlib.Path) -> str:
+    """GridFS id of an uploaded source, or path, mtime and size of a file in the archive directory"""
+    if attachment.file_id:
+        return attachment.file_id
+    try:
+        stat = (pathlib.Path(data_directory) / attachment.path).stat()
+    except OSError:
+        return f"path:{attachment.path}"
+    return f"path:{attachment.path}:{stat.st_mtime_ns}:{stat.st_size}"
+
+
+class ThumbnailDao(FileDao):
+    """Thumbnail variants in GridFS, keyed by (attachment id, size) through the file name.
+
+    Attachments are read from GridFS if they had been uploaded, from the archive directory otherwise. The source a
+    variant was rendered from is kept in its metadata, so a replaced source is not served stale.
+    """
+
+    def __init__(self, db_pool: MongoClient, data_directory: pathlib.Path, bucket_name: str = "fs"):
+        super().__init__(db_pool, bucket_name=bucket_name)
+        self._data_directory = pathlib.Path(data_directory)
+
+    def source_id(self, attachment: Attachment) -> str:
+        return thumbnail_source_id(attachment, self._data_directory)
+
+    def get_thumbnail(self, attachment: Attachment, size: int) -> Optional[bytes]:
+        try:
+            grid_out = self._bucket.open_download_stream_by_name(thumbnail_filename(attachment.id, size))
+        except gridfs.errors.NoFile:
+            return None
+
+        with grid_out:
+            if (grid_out.metadata or {}).get("source_id") != self.source_id(attachment):
+                return None
+            data = grid_out.read()
+        GRIDFS_BYTES.labels("read").inc(len(data))
+        return data
+
+    def create_thumbnails(self, attachment: Attachment, sizes: Iterable[int] = THUMBNAIL_SIZES) -> Dict[int, bytes]:
+        """Renders and stores the variants. Raises FileNotFoundError or gridfs.errors.NoFile if the source is missing."""
+        with self._open_source(attachment) as source:
+            thumbnails = render_thumbnails(source, sizes)
+
+        for size, data in thumbnails.items():
+            self._store_thumbnail(attachment, size, data)
+        return thumbnails
+
+    def _open_source(self, attachment: Attachment) -> BinaryIO:
+        if attachment.file_id:
+            return self.open_download_stream(attachment.file_id)
+        return open(self._data_directory / attachment.path, "rb")
+
+    def _store_thumbnail(self, attachment: Attachment, size: int, data: bytes):
+        filename = thumbnail_filename(attachment.id, size)
+        file_id = self.upload(
+            filename,
+            data,
+            metadata={"source_id": self.source_id(attachment), "contentType": THUMBNAIL_MIMETYPE},
+        )
+
+        # Only the latest variant is read, earlier ones are dropped. ObjectIds grow in time, so a concurrent request
+        # storing the same variant never deletes the newer one.
+        for grid_out in self._bucket.find({"filename": filename, "_id": {"$lt": to_gridfs_id(file_id)}}):
+            self.delete_file(grid_out._id)
@@ -0,0 +1,243 @@
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+import hashlib
+import logging
+from typing import BinaryIO, List, Optional, Tuple
+from uuid import UUID, uuid4
+
+import bson
+import marshmallow
+import pymongo
+
+from tq.database.db import transactional, BaseEntity
+from tq.database.mongo_dao import BaseMongoDao, MongoDaoContext
+
+from tapearchive.metrics import GRIDFS_BYTES
+from tapearchive.models.codec import get_codec
+
+LOGGER = logging.getLogger(__name__)
+
+DEFAULT_CHUNK_SIZE = 255 * 1024  # GridFS default
+CHECKSUM_ALGORITHM = "sha256-chain"
+_EMPTY_CHECKSUM_STATE = bytes(32).hex()
+CLAIM_TIMEOUT = timedelta(minutes=5)  # a request writing an upload which has not made progress for this long is dead
+
+
+def chain_checksum(state: bytes, block: bytes) -> bytes:
+    """Checksum of an upload: state_n = sha256(state_n-1 + sha256(block_n)), over blocks of chunk_size bytes
+    starting with 32 zero bytes. Unlike a plain sha256 the state fits into the upload session, so it can be
+    continued by any process after an interruption.
+    """
+    return hashlib.sha256(state + hashlib.sha256(block).digest()).digest()
+
+
+class UploadConflict(Exception):
+    """The upload offset does not match the one sent by the client, or another request has changed it meanwhile"""
+
+
+@dataclass
+class UploadSession(BaseEntity):
+    filename: str
+    length: int
+    file_id: str
+    chunk_size: int = DEFAULT_CHUNK_SIZE
+    offset: int = 0
+    checksum_state: str = _EMPTY_CHECKSUM_STATE
+    is_finalized: bool = False
+
+
+class UploadDao(BaseMongoDao):
+    """Resumable uploads written straight into GridFS chunks.
+
+    Complete chunks are written to the chunks collection of the bucket as the data arrives, only the last incomplete
+    chunk (the tail) is kept in the upload session. The files document is inserted on finalize, until then the file
+    is not visible to GridFS readers.
+
+    A request appending to an upload claims it first: `claim` and `claimed_at` in the session. Only the claiming
+    request writes chunks, others get a conflict, so the stored chunks always belong to the data of the checksum. The
+    claim is renewed before every write and released at the end of the request, claims of requests which died are
+    taken over after CLAIM_TIMEOUT.
+    """
+
+    def __init__(self, db_pool, bucket_name: str = "fs", chunks_per_write: int = 16):
+        super().__init__(db_pool, UploadSession, key_prefix="upload_session")
+        self._bucket_name = bucket_name
+        self._chunks_per_write = chunks_per_write
+
+    def create_session(self, filename: str, length: int, chunk_size: int = DEFAULT_CHUNK_SIZE) -> UploadSession:
+        session = UploadSession(id=uuid4(), filename=filename, length=length, file_id=str(bson.ObjectId()), chunk_size=chunk_size)
+        self.create_or_update(session)
+        return session
+
+    @transactional
+    def get_session(self, id: UUID, ctx: MongoDaoContext) -> Optional[UploadSession]:
+        item = ctx.collection.find_one({"_id": bson.Binary.from_uuid(id)}, {"tail": 0})
+        if item is not None:
+            return get_codec(UploadSession, unknown=marshmallow.EXCLUDE).decode(ctx.desanitize(item))
+        return None
+
+    @transactional
+    def append(self, id: UUID, offset: int, stream: BinaryIO, ctx: MongoDaoContext) -> int:
+        """Appends data read from `stream` at `offset`, returns the new offset.
+        Progress is persisted after every few chunks, so an interrupted request can be resumed from the last offset.
+        """
+        item = ctx.collection.find_one({"_id": bson.Binary.from_uuid(id)})
+        if item is None:
+            raise KeyError(id)
+
+        session = get_codec(UploadSession, unknown=marshmallow.EXCLUDE).decode(ctx.desanitize(dict(item)))
+        if session.is_finalized:
+            raise UploadConflict(f"Upload {id} is already finalized")
+        if session.offset != offset:
+            raise UploadConflict(f"Upload {id} is at offset {session.offset}, not at {offset}")
+
+        tail = bytes(item.get("tail", b""))
+        state = bytes.fromhex(session.checksum_state)
+        chunk_index = session.offset // session.chunk_size
+        chunks: List[Tuple[int, bytes]] = []
+
+        claim = self._claim(ctx, session)
+        try:
+            while True:
+                data = stream.read(session.chunk_size - len(tail))
+                if not data:
+                    break
+                if offset + len(data) > session.length:
+                    raise ValueError(f"Upload {id} would exceed its length of {session.length} bytes")
+
+                offset += len(data)
+                tail += data
+                GRIDFS_BYTES.labels("write").inc(len(data))
+                if len(tail) == session.chunk_size:
+                    state = chain_checksum(state, tail)
+                    chunks.append((chunk_index, tail))
+                    chunk_index += 1
+                    tail = b""
+
+                if len(chunks) == self._chunks_per_write:
+                    self._write_progress(ctx, session, claim, chunks, tail, state, offset)
+                    chunks = []
+
+            self._write_progress(ctx, session, claim, chunks, tail, state, offset)
+        finally:
+            ctx.collection.update_one(
+                {"_id": bson.Binary.from_uuid(id), "claim": claim}, {"$unset": {"claim": "", "claimed_at": ""}}
+            )
+        return offset
+
+    def _claim(self, ctx: MongoDaoContext, session: UploadSession) -> bson.ObjectId:
+        """Claims the upload at the offset of the session for the request, raises UploadConflict if another request
+        has claimed it or has moved the offset
+        """
+        claim = bson.ObjectId()
+        now = datetime.utcnow()
+        result = ctx.collection.update_one(
+            {
+                "_id": bson.Binary.from_uuid(session.id),
+                "offset": session.offset,
+                "is_finalized": False,
+                "$or": [{"claim": {"$exists": False}}, {"claimed_at": {"$lt": now - CLAIM_TIMEOUT}}],
+            },
+            {"$set": {"claim": claim, "claimed_at": now}},
+        )
+        if result.matched_count == 0:
+            raise UploadConflict(f"Upload {session.id} is written by another request")
+        return claim
+
+    def _write_progress(
+        self,
+        ctx: MongoDaoContext,
+        session: UploadSession,
+        claim: bson.ObjectId,
+        chunks: List[Tuple[int, bytes]],
+        tail: bytes,
+        state: bytes,
+        offset: int,
+    ):
+        query = {"_id": bson.Binary.from_uuid(session.id), "offset": session.offset, "claim": claim}
+        # Renewed before the chunks are written, a claim taken over meanwhile must not overwrite them
+        if ctx.collection.update_one(query, {"$set": {"claimed_at": datetime.utcnow()}}).matched_count == 0:
+            raise UploadConflict(f"Upload {session.id} was claimed by another request")
+        self._write_chunks(ctx, session, chunks)
+
+        result = ctx.collection.update_one(
+            query,
+            {
+                "$set": {
+                    "offset": offset,
+                    "tail": bson.Binary(tail),
+                    "checksum_state": state.hex(),
+                    "claimed_at": datetime.utcnow(),
+                }
+            },
+        )
+        if result.matched_count == 0:
+            raise UploadConflict(f"Upload {session.id} was modified by another request")
+        session.offset = offset
+        session.checksum_state = state.hex()
+
+    def _write_chunks(self, ctx: MongoDaoContext, session: UploadSession, chunks: List[Tuple[int, bytes]]):
+        if not chunks:
+            return
+        files_id = bson.ObjectId(session.file_id)
+        # Upserts keep retries of a partially persisted request idempotent
+        ctx.collection.database[f"{self._bucket_name}.chunks"].bulk_write(
+            [
+                pymongo.ReplaceOne(
+                    {"files_id": files_id, "n": n},
+                    {"files_id": files_id, "n": n, "data": bson.Binary(data)},
+                    upsert=True,
+                )
+                for n, data in chunks
+            ],
+            ordered=False,
+        )
+
+    @transactional
+    def finalize(self, id: UUID, ctx: MongoDaoContext) -> UploadSession:
+        item = ctx.collection.find_one({"_id": bson.Binary.from_uuid(id)})
+        if item is None:
+            raise KeyError(id)
+
+        session = get_codec(UploadSession, unknown=marshmallow.EXCLUDE).decode(ctx.desanitize(dict(item)))
+        if session.is_finalized:
+            return session
+        if session.offset != session.length:
+            raise UploadConflict(f"Upload {id} has {session.offset} of {session.length} bytes")
+
+        tail = bytes(item.get("tail", b""))
+        state = bytes.fromhex(session.checksum_state)
+        if tail:
+            state = chain_checksum(state, tail)
+            self._write_chunks(ctx, session, [(session.offset // session.chunk_size, tail)])
+
+        ctx.collection.database[f"{self._bucket_name}.files"].replace_one(
+            {"_id": bson.ObjectId(session.file_id)},
+            {
+                "_id": bson.ObjectId(session.file_id),
+                "length": session.length,
+                "chunkSize": session.chunk_size,
+                "uploadDate": datetime.utcnow(),
+                "filename": session.filename,
+                "metadata": {"checksum": state.hex(), "checksum_algorithm": CHECKSUM_ALGORITHM},
+            },
+            upsert=True,
+        )
+
+        ctx.collection.update_one(
+            {"_id": bson.Binary.from_uuid(id)},
+            {"$set": {"is_finalized": True, "checksum_state": state.hex()}, "$unset": {"tail": ""}},
+        )
+        session.is_finalized = True
+        session.checksum_state = state.hex()
+        LOGGER.info(f"Upload {id} finalized as file_id={session.file_id} length={session.length}")
+        return session
+
+    @transactional
+    def abort(self, id: UUID, ctx: MongoDaoContext):
+        session = self.get_session(id)
+        if session is None:
+            return
+        if not session.is_finalized:
+            ctx.collection.database[f"{self._bucket_name}.chunks"].delete_many({"files_id": bson.ObjectId(session.file_id)})
+        ctx.collection.delete_one({"_id": bson.Binary.from_uuid(id)})
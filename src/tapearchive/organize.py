@@ -7,6 +7,7 @@ import logging
 import shutil
 
 import marshmallow.exceptions
+import soundfile
 
 from uuid import uuid4
 from typing import Dict, Optional, Set, Tuple
@@ -18,6 +19,7 @@ from tqdm import tqdm
 from tqdm.contrib.logging import logging_redirect_tqdm
 
 from tapearchive.models import catalog
+from tapearchive.models.codec import get_codec
 from tapearchive.utils import find_all_files
 
 
@@ -38,7 +40,7 @@ class CsvEntry(DataClassJsonMixin):
     catalog: str
     side: str
     type: AttachmentType
-    comment: Optional[str]
+    comment: Optional[str] = None
 
 
 def parse_args() -> object:
@@ -105,8 +107,9 @@ def parse_args() -> object:
 def load_csv_entries(csv_file: pathlib.Path) -> CsvEntry:
     with open(csv_file, "r") as csv_data_file:
         csv_data = csv.DictReader(csv_data_file)
+        csv_codec = get_codec(CsvEntry)
         for record_data in csv_data:
-            yield CsvEntry.schema().load(record_data)
+            yield csv_codec.decode(record_data)
 
 
 def new_catalog_entry(csv_entry: CsvEntry) -> catalog.CatalogEntry:
@@ -124,7 +127,7 @@ def new_catalog_entry(csv_entry: CsvEntry) -> catalog.CatalogEntry:
 def load_or_create_catalog_entry(catalog_file: pathlib.Path, csv_entry: CsvEntry) -> catalog.CatalogEntry:
     if pathlib.Path(catalog_file).exists():
         with open(catalog_file, "r") as f:
-            return catalog.CatalogEntry.schema().load(yaml.safe_load(f))
+            return get_codec(catalog.CatalogEntry).decode(yaml.safe_load(f))
     return new_catalog_entry(csv_entry)
 
 
@@ -136,8 +139,17 @@ def fetch_audio_channels(attachment_type: AttachmentType) -> catalog.ChannelMode
     return []
 
 
+def read_duration_seconds(file_name: str) -> Optional[float]:
+    try:
+        return soundfile.info(file_name).duration
+    except (RuntimeError, OSError) as e:
+        LOGGER.warning(f"Cannot read the duration of {file_name}: {e}")
+        return None
+
+
 def attach_record_to_catalog(csv_entry: CsvEntry, catalog: catalog.CatalogEntry):
     if csv_entry.type == AttachmentType.AUDIO_MONO or csv_entry.type == AttachmentType.AUDIO_STEREO:
+        duration_seconds = read_duration_seconds(csv_entry.file)
         for channel in fetch_audio_channels(csv_entry.type):
             audio_source = catalog.AudioAttachment(
                 id=uuid4(),
@@ -146,6 +158,7 @@ def attach_record_to_catalog(csv_entry: CsvEntry, catalog: catalog.CatalogEntry)
                 format=pathlib.Path(csv_entry.file).suffix.replace(".", ""),
                 name=pathlib.Path(csv_entry.file).name,
                 meta={"source_file": csv_entry.file},
+                duration_seconds=duration_seconds,
             )
             recording = catalog.RecordingEntry(
                 id=uuid4(),
@@ -201,7 +214,7 @@ def import_from_csv(args):
         catalog_dst.mkdir(parents=True, exist_ok=True)
         with open(catalog_dst / "meta.yaml", "w") as yaml_file:
             LOGGER.info(f"Exporting metadata for {catalog_entry.name} recordings={len(catalog_entry.recordings)}")
-            data = catalog.CatalogEntry.schema().dump(catalog_entry)
+            data = get_codec(catalog.CatalogEntry).encode(catalog_entry)
             yaml.dump(data, yaml_file, sort_keys=True, default_flow_style=False)
         for recording in catalog_entry.recordings:
             for audio_file in recording.audio_sources:
@@ -237,7 +250,7 @@ def export_to_csv(args):
     for yaml_path in tqdm(find_all_files("meta.yaml", args.archive_dir), desc="Loading manifests into db"):
         with open(yaml_path, "r") as f:
             try:
-                entry = catalog.CatalogEntry.schema().load(yaml.safe_load(f))
+                entry = get_codec(catalog.CatalogEntry).decode(yaml.safe_load(f))
                 for recording in entry.recordings:
                     csv_entry = CsvEntry(
                         file=recording.audio_sources[0].path,
@@ -1,151 +1,259 @@
-# from asyncio.log import logger
-# from dataclasses import dataclass
-# import imp
-# import pathlib
-# from typing import Dict, Optional, Tuple
-# from uuid import UUID
-# import numpy as np
-# import librosa
-# from tapearchive.models.raw_data import FileDao
-# from tq.job_system import LOGGER, Job, JobManager
-
-# from tq.task_dispacher import Task, TaskDispatcher, TaskResult, task_handler
-
-# # class that uses the librosa library to analyze the key that an mp3 is in
-# # arguments:
-# #     waveform: an mp3 file loaded by librosa, ideally separated out from any percussive sources
-# #     sr: sampling rate of the mp3, which can be obtained when the file is read with librosa
-# #     tstart and tend: the range in seconds of the file to be analyzed; default to the beginning and end of file if not specified
-# class TonalFragment(object):
-#     def __init__(self, waveform, sr, tstart=None, tend=None):
-#         self.waveform = waveform
-#         self.sr = sr
-#         self.tstart = tstart
-#         self.tend = tend
-
-#     def calculate(self):
-#         if self.tstart is not None:
-#             self.tstart = librosa.time_to_samples(self.tstart, sr=self.sr)
-#         if self.tend is not None:
-#             self.tend = librosa.time_to_samples(self.tend, sr=self.sr)
-#         self.y_segment = self.waveform[self.tstart : self.tend]
-#         self.chromograph = librosa.feature.chroma_cqt(y=self.y_segment, sr=self.sr, bins_per_octave=24)
-
-#         # chroma_vals is the amount of each pitch class present in this time interval
-#         self.chroma_vals = []
-#         for i in range(12):
-#             self.chroma_vals.append(np.sum(self.chromograph[i]))
-#         pitches = ["C", "C#", "D", "D#", "E", "F", "F#", "G", "G#", "A", "A#", "B"]
-#         # dictionary relating pitch names to the associated intensity in the song
-#         self.keyfreqs = {pitches[i]: self.chroma_vals[i] for i in range(12)}
-
-#         keys = [pitches[i] + " major" for i in range(12)] + [pitches[i] + " minor" for i in range(12)]
-
-#         # use of the Krumhansl-Schmuckler key-finding algorithm, which compares the chroma
-#         # data above to typical profiles of major and minor keys:
-#         maj_profile = [6.35, 2.23, 3.48, 2.33, 4.38, 4.09, 2.52, 5.19, 2.39, 3.66, 2.29, 2.88]
-#         min_profile = [6.33, 2.68, 3.52, 5.38, 2.60, 3.53, 2.54, 4.75, 3.98, 2.69, 3.34, 3.17]
-
-#         # finds correlations between the amount of each pitch class in the time interval and the above profiles,
-#         # starting on each of the 12 pitches. then creates dict of the musical keys (major/minor) to the correlation
-#         self.min_key_corrs = []
-#         self.maj_key_corrs = []
-#         for i in range(12):
-#             key_test = [self.keyfreqs.get(pitches[(i + m) % 12]) for m in range(12)]
-#             # correlation coefficients (strengths of correlation for each key)
-#             self.maj_key_corrs.append(round(np.corrcoef(maj_profile, key_test)[1, 0], 3))
-#             self.min_key_corrs.append(round(np.corrcoef(min_profile, key_test)[1, 0], 3))
-
-#         # names of all major and minor keys
-#         self.key_dict = {**{keys[i]: self.maj_key_corrs[i] for i in range(12)}, **{keys[i + 12]: self.min_key_corrs[i] for i in range(12)}}
-
-#         # this attribute represents the key determined by the algorithm
-#         self.key = max(self.key_dict, key=self.key_dict.get)
-#         self.bestcorr = max(self.key_dict.values())
-
-#         # this attribute represents the second-best key determined by the algorithm,
-#         # if the correlation is close to that of the actual key determined
-#         self.altkey = None
-#         self.altbestcorr = None
-
-#         for key, corr in self.key_dict.items():
-#             if corr > self.bestcorr * 0.9 and corr != self.bestcorr:
-#                 self.altkey = key
-#                 self.altbestcorr = corr
-
-#     @property
-#     def chroma_map(self):
-#         self.chroma_max = max(self.chroma_vals)
-#         return dict([(key, chrom / self.chroma_max) for key, chrom in self.keyfreqs.items()])
-
-#     @property
-#     def likely_key(self) -> Tuple[str, float]:
-#         return max(self.key_dict, key=self.key_dict.get), self.bestcorr
-
-#     @property
-#     def second_likely_key(self) -> Optional[Tuple[str, float]]:
-#         if self.altkey is not None:
-#             return self.altkey, self.altbestcorr
-#         return None
-
-
-# @dataclass
-# class FindTuneKey(Task):
-#     source_file_id: UUID
-#     source_format: str
-
-
-# @dataclass
-# class FindKeyDone(TaskResult):
-#     chroma_map: Dict[str, float]
-#     most_likely_key: Tuple[str, float]
-#     second_most_likely_key: Optional[Tuple[str, float]]
-
-
-# @dataclass
-# class FindKeyFailed(TaskResult):
-#     error: str
-
-
-# class FindKeyHandler:
-#     def __init__(self, db_pool, **kwargs) -> None:
-#         self.file_dao = FileDao(db_pool)
-
-#     @task_handler(FindTuneKey)
-#     def find_key(self, task: FindTuneKey, dispatcher: TaskDispatcher = None, job: Job = None, manager: JobManager = None):
-#         try:
-#             with self.file_dao.as_tempfile(task.source_file_id, suffix=task.source_format) as tmpfile:
-#                 input_file = pathlib.Path(tmpfile.name)
-
-#                 # -- Job 1
-#                 y, sr = librosa.load(
-#                     input_file,
-#                 )
-
-#                 LOGGER.debug(f"Audio data={len(y)} samples")
-
-#                 y_harmonic, y_percussive = librosa.effects.hpss(y)
-
-#                 # TODO: Find bpm for song as well?
-
-#                 # -- Job 2
-#                 tf = TonalFragment(y_harmonic, sr)
-#                 tf.calculate()
-
-#                 # -- Result
-#                 dispatcher.post_task(
-#                     FindKeyDone(
-#                         task=task,
-#                         chroma_map=tf.chroma_map,
-#                         most_likely_key=tf.likely_key,
-#                         second_most_likely_key=tf.second_likely_key,
-#                     )
-#                 )
-#         except Exception as e:
-#             logger.error("Error", exc_info=e)
-#             dispatcher.post_task(
-#                 FindKeyFailed(
-#                     task=task,
-#                     error="Failed to find key",
-#                 )
-#             )
+from dataclasses import dataclass
+import logging
+from typing import Dict, List, Optional, Tuple
+from uuid import UUID
+
+import gridfs.errors
+import librosa
+import numpy as np
+
+from tq.job_system import Job, JobManager
+from tq.task_dispacher import Task, TaskDispatcher, TaskResult, task_handler
+
+from tapearchive.analysis import key_estimation
+from tapearchive.analysis.executor import AnalysisExecutor, AnalysisPoolError
+from tapearchive.analysis.key_tracking import HOP_LENGTH, KeyTrackWindow, track_keys
+from tapearchive.analysis.pcm_cache import create_pcm_cache
+from tapearchive.analysis.rhythm import analyze_key_and_rhythm
+from tapearchive.config import AppConfig
+from tapearchive.metrics import timed_task
+from tapearchive.models.catalog import CatalogDao, KeyTrackPoint, TempoInfo
+from tapearchive.models.raw_data import FileDao
+
+LOGGER = logging.getLogger(__name__)
+
+
+class TonalFragment:
+    """Key of a fragment of audio, by the Krumhansl-Schmuckler key-finding algorithm.
+    `waveform` is ideally separated from percussive sources, `tstart` and `tend` select a range in seconds.
+    """
+
+    def __init__(self, waveform: np.ndarray, sr: int, tstart: Optional[float] = None, tend: Optional[float] = None):
+        self.waveform = waveform
+        self.sr = sr
+        self.tstart = tstart
+        self.tend = tend
+        self.chroma_vals: Optional[np.ndarray] = None
+        self.estimate: Optional[key_estimation.KeyEstimate] = None
+
+    def calculate(self):
+        start = librosa.time_to_samples(self.tstart, sr=self.sr) if self.tstart is not None else None
+        end = librosa.time_to_samples(self.tend, sr=self.sr) if self.tend is not None else None
+        chromagram = librosa.feature.chroma_cqt(y=self.waveform[start:end], sr=self.sr, bins_per_octave=24)
+
+        # Amount of each pitch class present in the fragment
+        self.chroma_vals = chromagram.sum(axis=1)
+        (self.estimate,) = key_estimation.estimate_keys(self.chroma_vals)
+
+    @property
+    def chroma_map(self) -> Dict[str, float]:
+        return key_estimation.chroma_map(self.chroma_vals)
+
+    @property
+    def likely_key(self) -> Tuple[str, float]:
+        return self.estimate.key, self.estimate.confidence
+
+    @property
+    def second_likely_key(self) -> Optional[Tuple[str, float]]:
+        if self.estimate.second_key is not None:
+            return self.estimate.second_key, self.estimate.second_confidence
+        return None
+
+
+@dataclass
+class FindTuneKey(Task):
+    source_file_id: str
+    source_format: str
+
+
+@dataclass
+class FindKeyDone(TaskResult):
+    chroma_map: Optional[Dict[str, float]] = None
+    most_likely_key: Optional[Tuple[str, float]] = None
+    second_most_likely_key: Optional[Tuple[str, float]] = None
+
+
+@dataclass
+class FindKeyFailed(TaskResult):
+    error: Optional[str] = None
+
+
+@dataclass
+class FindKeyTrack(Task):
+    catalog_id: UUID
+    recording_id: UUID
+    source_file_id: str
+    window_seconds: float = 10.0
+    hop_seconds: float = 5.0
+
+
+@dataclass
+class FindKeyTrackResult(TaskResult):
+    key_track: Optional[List[KeyTrackPoint]] = None
+
+
+@dataclass
+class AnalyzeRecording(Task):
+    """Key track, tempo, beats and onsets of a recording from a single HPSS pass"""
+
+    catalog_id: UUID
+    recording_id: UUID
+    source_file_id: str
+    window_seconds: float = 10.0
+    hop_seconds: float = 5.0
+
+
+@dataclass
+class AnalyzeRecordingResult(TaskResult):
+    key_track: Optional[List[KeyTrackPoint]] = None
+    tempo: Optional[TempoInfo] = None
+
+
+def to_key_track(windows: List[KeyTrackWindow]) -> List[KeyTrackPoint]:
+    return [
+        KeyTrackPoint(
+            start_seconds=window.start_seconds,
+            end_seconds=window.end_seconds,
+            key=window.estimate.key,
+            confidence=window.estimate.confidence,
+            second_key=window.estimate.second_key,
+            second_confidence=window.estimate.second_confidence,
+        )
+        for window in windows
+    ]
+
+
+class FindKeyHandler:
+    """Keys and rhythm are found on the decoded audio from the PCM cache, in the analysis processes"""
+
+    def __init__(self, db_pool, config: AppConfig = None, executor: AnalysisExecutor = None, **kwargs) -> None:
+        self.file_dao = FileDao(db_pool)
+        self.catalog_dao = CatalogDao(db_pool)
+        self.pcm_cache = create_pcm_cache(config.analysis)
+        self.executor = executor or AnalysisExecutor(config.analysis.processes)
+
+    def _track_keys(
+        self, file_id: str, window_seconds: Optional[float], hop_seconds: float
+    ) -> Tuple[np.ndarray, List[KeyTrackWindow]]:
+        with self.pcm_cache.pinned(file_id) as path:
+            self.file_dao.load_pcm(file_id, self.pcm_cache)
+            return self.executor.run(track_keys, str(path), self.pcm_cache.sample_rate, window_seconds, hop_seconds)
+
+    @task_handler(FindTuneKey)
+    @timed_task(FindTuneKey)
+    def find_key(self, task: FindTuneKey, dispatcher: TaskDispatcher = None, job: Job = None, manager: JobManager = None):
+        try:
+            # The key of the whole file is estimated from all the chroma frames, windows are not needed
+            total_chroma, _ = self._track_keys(task.source_file_id, window_seconds=None, hop_seconds=0)
+            (estimate,) = key_estimation.estimate_keys(total_chroma)
+            second_key = (estimate.second_key, estimate.second_confidence) if estimate.second_key else None
+
+            dispatcher.post_task(
+                FindKeyDone(
+                    task=task,
+                    chroma_map=key_estimation.chroma_map(total_chroma),
+                    most_likely_key=(estimate.key, estimate.confidence),
+                    second_most_likely_key=second_key,
+                )
+            )
+        except Exception as e:
+            LOGGER.error("Failed to find key", exc_info=e)
+            dispatcher.post_task(
+                FindKeyFailed(
+                    task=task,
+                    error="Failed to find key",
+                )
+            )
+
+    @task_handler(FindKeyTrack)
+    @timed_task(FindKeyTrack)
+    def find_key_track(
+        self,
+        task: FindKeyTrack,
+        dispatcher: TaskDispatcher = None,
+        job: Job = None,
+        manager: JobManager = None,
+    ):
+        try:
+            _, windows = self._track_keys(task.source_file_id, task.window_seconds, task.hop_seconds)
+        except AnalysisPoolError as e:
+            LOGGER.error(f"Analysis of {task.source_file_id} failed", exc_info=e)
+            dispatcher.post_task(FindKeyTrackResult(task=task).failed(str(e)))
+            return
+        except (OSError, RuntimeError, gridfs.errors.NoFile) as e:
+            LOGGER.error(f"Cannot read audio file {task.source_file_id}", exc_info=e)
+            dispatcher.post_task(FindKeyTrackResult(task=task).failed(f"Cannot read audio file: {e}"))
+            return
+
+        key_track = to_key_track(windows)
+
+        def set_key_track(recording):
+            recording.key_track = key_track
+
+        if self.catalog_dao.update_recording(task.catalog_id, task.recording_id, set_key_track) is None:
+            dispatcher.post_task(
+                FindKeyTrackResult(task=task).failed(f"No recording {task.recording_id} in catalog {task.catalog_id}")
+            )
+            return
+
+        LOGGER.debug(f"Key track of {task.source_file_id}: {len(key_track)} windows")
+        dispatcher.post_task(FindKeyTrackResult(task=task, key_track=key_track))
+
+    @task_handler(AnalyzeRecording)
+    @timed_task(AnalyzeRecording)
+    def analyze_recording(
+        self,
+        task: AnalyzeRecording,
+        dispatcher: TaskDispatcher = None,
+        job: Job = None,
+        manager: JobManager = None,
+    ):
+        try:
+            with self.pcm_cache.pinned(task.source_file_id) as path:
+                self.file_dao.load_pcm(task.source_file_id, self.pcm_cache)
+                _, windows, bpm, beat_seconds, onset_envelope = self.executor.run(
+                    analyze_key_and_rhythm,
+                    str(path),
+                    self.pcm_cache.sample_rate,
+                    task.window_seconds,
+                    task.hop_seconds,
+                )
+        except AnalysisPoolError as e:
+            LOGGER.error(f"Analysis of {task.source_file_id} failed", exc_info=e)
+            dispatcher.post_task(AnalyzeRecordingResult(task=task).failed(str(e)))
+            return
+        except (OSError, RuntimeError, gridfs.errors.NoFile) as e:
+            LOGGER.error(f"Cannot read audio file {task.source_file_id}", exc_info=e)
+            dispatcher.post_task(AnalyzeRecordingResult(task=task).failed(f"Cannot read audio file: {e}"))
+            return
+
+        key_track = to_key_track(windows)
+        tempo = TempoInfo(
+            bpm=bpm,
+            beat_seconds=[round(float(seconds), 3) for seconds in beat_seconds],
+            onset_frame_rate=self.pcm_cache.sample_rate / HOP_LENGTH,
+            onset_file_id=self.file_dao.upload(
+                f"onsets/{task.recording_id}",
+                onset_envelope.astype("<f2").tobytes(),
+                metadata={"source_file_id": task.source_file_id},
+            ),
+        )
+        replaced = []
+
+        def set_analysis(recording):
+            replaced[:] = [recording.tempo]  # called again if the recording changed meanwhile
+            recording.key_track = key_track
+            recording.tempo = tempo
+
+        if self.catalog_dao.update_recording(task.catalog_id, task.recording_id, set_analysis) is None:
+            self.file_dao.delete_file(tempo.onset_file_id)
+            reason = f"No recording {task.recording_id} in catalog {task.catalog_id}"
+            dispatcher.post_task(AnalyzeRecordingResult(task=task).failed(reason))
+            return
+
+        # Onsets of an earlier run are not referenced anymore
+        if replaced[0] is not None and replaced[0].onset_file_id is not None:
+            self.file_dao.delete_file(replaced[0].onset_file_id)
+
+        LOGGER.debug(f"Analysis of {task.source_file_id}: {len(key_track)} key windows, {bpm:.1f} bpm")
+        dispatcher.post_task(AnalyzeRecordingResult(task=task, key_track=key_track, tempo=tempo))
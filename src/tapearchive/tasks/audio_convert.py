@@ -15,6 +15,7 @@ from tq.job_system import JobManager, Job
 from tq.task_dispacher import Task, TaskDispatcher, TaskResult, task_handler
 from tq.database.gridfs_dao import BucketGridFsDao
 
+from tapearchive.metrics import FFMPEG_PROCESSES, GRIDFS_BYTES, timed_task
 from tapearchive.models.catalog import ChannelMode
 from tapearchive.tasks.utils import poll_subprocess
 
@@ -40,6 +41,7 @@ class SliceAudio(Task):
     source_file_id: str
     file_format: str = "mp3"
     segment_length: int = 15
+    segment_times: Optional[List[float]] = None  # Cut points in seconds, instead of segments of equal length
 
 
 @dataclass
@@ -70,6 +72,7 @@ class AudioConverterHandler:
         self._max_processes = 16
 
     @task_handler(ConvertAudio)
+    @timed_task(ConvertAudio)
     def convert_audio(
         self,
         task: ConvertAudio,
@@ -119,6 +122,7 @@ class AudioConverterHandler:
                 )
             ).name
         )
+        GRIDFS_BYTES.labels("read").inc(source_file.stat().st_size)
 
         ffmpeg_commnad = f"ffmpeg -y -i {source_file.absolute()} -filter_complex {';'.join(filter_stack)} -map [out]{bitrate_option} {target_file.absolute()}".split()
 
@@ -128,14 +132,18 @@ class AudioConverterHandler:
             ffmpeg_commnad, stdout=subprocess.PIPE, stderr=subprocess.PIPE
         )
         self._running_processes.append(ffmpeg_process)
-
-        ffmpeg_job = manager.create_child_job(
-            job,
-            bind_function(AudioConverterHandler._poll_ffmpeg, self),
-            ffmpeg_process,
-        )
-        manager.schedule_job(ffmpeg_job)
-        manager.wait(ffmpeg_job)
+        FFMPEG_PROCESSES.inc()
+        try:
+            ffmpeg_job = manager.create_child_job(
+                job,
+                bind_function(AudioConverterHandler._poll_ffmpeg, self),
+                ffmpeg_process,
+            )
+            manager.schedule_job(ffmpeg_job)
+            manager.wait(ffmpeg_job)
+        finally:
+            self._running_processes.remove(ffmpeg_process)
+            FFMPEG_PROCESSES.dec()
 
         LOGGER.debug(
             f"FFMPEG {ffmpeg_process.pid} finished, return code: {ffmpeg_job.result}"
@@ -146,7 +154,9 @@ class AudioConverterHandler:
             db_file = context.enter_context(
                 self._file_dao.open(f"{uuid4()}.{task.target_format}", "wb")
             )
-            db_file.write(target_temp_file.read())
+            data = target_temp_file.read()
+            db_file.write(data)
+            GRIDFS_BYTES.labels("write").inc(len(data))
 
             dispatcher.post_task(
                 ConvertAudioResult(
@@ -162,7 +172,6 @@ class AudioConverterHandler:
                 ).failed(f"FFMPEG failed with return code {ffmpeg_job.result}")
             )
 
-        self._running_processes.remove(ffmpeg_process)
         context.close()
 
     @task_handler(ConvertAudioResult)
@@ -181,6 +190,7 @@ class AudioConverterHandler:
                 )
 
     @task_handler(SliceAudio)
+    @timed_task(SliceAudio)
     def slice_audio(
         self,
         task: SliceAudio,
@@ -199,8 +209,14 @@ class AudioConverterHandler:
             context.enter_context(self._file_dao.as_tempfile(task.source_file_id)).name
         )
         tmp_target = pathlib.Path(context.enter_context(tempfile.TemporaryDirectory()))
+        GRIDFS_BYTES.labels("read").inc(tmp_source.stat().st_size)
+
+        if task.segment_times:
+            segment_option = f"-segment_times {','.join(f'{seconds:.3f}' for seconds in task.segment_times)}"
+        else:
+            segment_option = f"-segment_time {task.segment_length}"
 
-        ffmpeg_command = f"ffmpeg -y -i {tmp_source} -f segment -segment_time {task.segment_length} -c copy {tmp_target}/output_%03d.{task.file_format}".split()
+        ffmpeg_command = f"ffmpeg -y -i {tmp_source} -f segment {segment_option} -c copy {tmp_target}/output_%03d.{task.file_format}".split()
 
         LOGGER.debug(f"FFMPEG command: {' '.join(ffmpeg_command)}")
 
@@ -209,14 +225,18 @@ class AudioConverterHandler:
         )
 
         self._running_processes.append(ffmpeg_process)
-
-        ffmpeg_job = manager.create_child_job(
-            job,
-            bind_function(AudioConverterHandler._poll_ffmpeg, self),
-            ffmpeg_process,
-        )
-        manager.schedule_job(ffmpeg_job)
-        manager.wait(ffmpeg_job)
+        FFMPEG_PROCESSES.inc()
+        try:
+            ffmpeg_job = manager.create_child_job(
+                job,
+                bind_function(AudioConverterHandler._poll_ffmpeg, self),
+                ffmpeg_process,
+            )
+            manager.schedule_job(ffmpeg_job)
+            manager.wait(ffmpeg_job)
+        finally:
+            self._running_processes.remove(ffmpeg_process)
+            FFMPEG_PROCESSES.dec()
 
         LOGGER.debug(
             f"FFMPEG {ffmpeg_process.pid} finished, return code: {ffmpeg_job.result}"
@@ -224,7 +244,8 @@ class AudioConverterHandler:
 
         if ffmpeg_job.result == 0:
             target_files = []
-            for file_path in tmp_target.iterdir():
+            # In the order of the segments
+            for file_path in sorted(tmp_target.iterdir()):
                 file_copy_context = ExitStack()
 
                 file = file_copy_context.enter_context(open(file_path, "rb"))
@@ -232,7 +253,9 @@ class AudioConverterHandler:
                 db_file = file_copy_context.enter_context(
                     self._file_dao.open(f"{uuid4()}.mp3", "wb")
                 )
-                db_file.write(file.read())
+                data = file.read()
+                db_file.write(data)
+                GRIDFS_BYTES.labels("write").inc(len(data))
                 target_files.append(str(db_file._id))
 
                 file_copy_context.close()
@@ -252,8 +275,6 @@ class AudioConverterHandler:
                 ).failed(f"FFMPEG failed with return code {ffmpeg_job.result}")
             )
 
-        self._running_processes.remove(ffmpeg_process)
-
         context.close()
 
     @task_handler(SliceAudioResult)
@@ -272,6 +293,7 @@ class AudioConverterHandler:
                 )
 
     @task_handler(AppendAlbumArt)
+    @timed_task(AppendAlbumArt)
     def append_album_art(
         self,
         task: AppendAlbumArt,
@@ -1,71 +1,156 @@
-from typing import List, Optional
-from dataclasses import dataclass
-from uuid import UUID
+from dataclasses import dataclass, field
+import logging
 import pathlib
-import tempfile
+from typing import Optional
+from uuid import UUID
 
-import librosa
-import numpy as np
-import matplotlib.pyplot as plt
+import gridfs.errors
 
 from tq.job_system import JobManager, Job
 from tq.task_dispacher import Task, TaskDispatcher, TaskResult, task_handler
 
+from tapearchive.analysis import spectrogram
+from tapearchive.analysis.executor import AnalysisExecutor, AnalysisPoolError
+from tapearchive.analysis.pcm_cache import create_pcm_cache
+from tapearchive.analysis.spectrogram import SpectrogramGeometry, compute_spectrogram
+from tapearchive.config import AppConfig
+from tapearchive.metrics import GRIDFS_BYTES, timed_task
+from tapearchive.models.audiogram import SOURCE_ATTACHMENT_ID, AudiogramTileDao, find_audiogram
+from tapearchive.models.catalog import Attachment, AttachmentType, CatalogDao, CatalogEntry, find_attachment
+from tapearchive.models.raw_data import FileDao
+
+LOGGER = logging.getLogger(__name__)
+
 
 @dataclass
 class AudiogramSettings:
-    block_length: int = 128
-    frame_length: int = 4096
-    fft_length: int = 512
-    image_resolution: int = 64
-    hop_length: Optional[int] = None
-    duration: Optional[int] = None
+    fft_length: int = spectrogram.FFT_LENGTH
+    hop_length: int = spectrogram.HOP_LENGTH
+    bin_count: int = spectrogram.BIN_COUNT
+    tile_width: int = spectrogram.TILE_WIDTH
+    min_db: float = spectrogram.MIN_DB
 
 
 @dataclass
-class CreateSpectorgram(Task):
-    id: UUID
-    filename: pathlib.Path
-    settings: AudiogramSettings
+class CreateAudiogram(Task):
+    catalog_id: UUID
+    attachment_id: UUID
+    source_file_id: str
+    settings: AudiogramSettings = field(default_factory=AudiogramSettings)
 
 
 @dataclass
-class CreateSpectorgramResult(TaskResult):
-    spectogram_ids: List[UUID]
-
-    # class AudiogramHandler:
-    #     def gen_audio_blocks(infile: pathlib.Path, settings: AudiogramSettings = AudiogramSettings()) -> np.array:
-    #         hop_length = settings.hop_length if settings.hop_length else settings.frame_length
-    #         for block in librosa.stream(infile, block_length=settings.block_length, frame_length=settings.frame_length, hop_length=hop_length, duration=settings.duration):
-    #             yield block
-
-    #     def gen_spectral_data(block: np.array, settings: AudiogramSettings = AudiogramSettings()) -> np.ndarray:
-    #         hop_length = settings.hop_length if settings.hop_length else settings.frame_length
-    #         return librosa.amplitude_to_db(np.abs(librosa.stft(block, n_fft=settings.fft_length, hop_length=hop_length)), ref=np.max)
-
-    #     def gen_spectorgram_image(spectrum_data: np.ndarray, sample_rate: float, audio_length: float, settings: AudiogramSettings = AudiogramSettings()) -> bytearray:
-    #         # This is not the most optimal way to store, It would rather more optimal if the raw data would be nicely interpolated and carried out instead of png mafgic.
-    #         fig, spectorgram = plt.subplots(figsize=(0.1 * settings.image_resolution, 0.1 * settings.image_resolution), dpi=100, sharex=True)
-    #         librosa.display.specshow(spectrum_data, sr=sample_rate / 8, ax=spectorgram, y_axis="log", x_axis="time")
-    #         spectorgram.set(xlim=(0, audio_length))
-
-    #         spectorgram.set_axis_off()
-    #         fig.subplots_adjust(left=0, right=1, top=1, bottom=0)
-    #         with tempfile.NamedTemporaryFile("wb", suffix=".png") as tmp:
-    #             fig.savefig(tmp, bbox_inches="tight", pad_inches=0, dpi=10, format="png")
-    #             tmp.seek(0)
-    #             return bytearray(tmp.read())
-
-    @task_handler(CreateSpectorgram)
-    def create_spectorgram(self, task: CreateSpectorgram, dispatcher: TaskDispatcher = None, job: Job = None, manager: JobManager = None):
-        sample_rate = librosa.get_samplerate(task.filename)
-        for block in self.gen_audio_blocks(task.filename, settings=task.settings):
-            # create task here
-            spectrum_data = self.gen_spectral_data(block, settings=task.settings)
-            # ceate child task here
-            spectrum_image = self.gen_spectorgram_image(spectrum_data, sample_rate, block.size / sample_rate, settings=task.settings)
-            # save everything to db
-            # ...
-            # raise finished signal
-            # ...
-            pass
+class CreateAudiogramResult(TaskResult):
+    audiogram: Optional[Attachment] = None
+
+
+class AudiogramHandler:
+    """Audiograms are stored as quantized log-frequency spectrogram tiles, concatenated into one GridFS file.
+    The geometry of the tiles is kept in the meta of the audiogram attachment.
+    """
+
+    def __init__(self, db_pool, config: AppConfig = None, executor: AnalysisExecutor = None, **kwargs) -> None:
+        self._file_dao = FileDao(db_pool)
+        self._tile_dao = AudiogramTileDao(db_pool)
+        self._catalog_dao = CatalogDao(db_pool)
+        self._pcm_cache = create_pcm_cache(config.analysis)
+        self._executor = executor or AnalysisExecutor(config.analysis.processes)
+
+    @task_handler(CreateAudiogram)
+    @timed_task(CreateAudiogram)
+    def create_audiogram(
+        self,
+        task: CreateAudiogram,
+        dispatcher: TaskDispatcher = None,
+        job: Job = None,
+        manager: JobManager = None,
+    ):
+        try:
+            geometry, file_id = self._build_tiles(task)
+        except AnalysisPoolError as e:
+            LOGGER.error(f"Analysis of {task.source_file_id} failed", exc_info=e)
+            dispatcher.post_task(CreateAudiogramResult(task=task).failed(str(e)))
+            return
+        except (OSError, RuntimeError, gridfs.errors.NoFile) as e:
+            LOGGER.error(f"Cannot read audio file {task.source_file_id}", exc_info=e)
+            dispatcher.post_task(CreateAudiogramResult(task=task).failed(f"Cannot read audio file: {e}"))
+            return
+
+        audiogram = Attachment(
+            name=f"audiogram-{task.attachment_id}",
+            type=AttachmentType.AUDIOGRAM,
+            path=pathlib.Path(f"audiogram/{task.attachment_id}"),
+            meta={**geometry.to_meta(), SOURCE_ATTACHMENT_ID: str(task.attachment_id)},
+            file_id=file_id,
+        )
+        replaced = []
+        added = []
+
+        def set_audiogram(entry: CatalogEntry):
+            # Called again if the entry changed meanwhile
+            replaced.clear()
+            added.clear()
+            if find_attachment(entry, task.attachment_id) is None:
+                return
+            previous = find_audiogram(entry, task.attachment_id)
+            if previous is not None:
+                entry.attachments.remove(previous)
+                replaced.append(previous)
+            entry.attachments = (entry.attachments or []) + [audiogram]
+            added.append(audiogram)
+
+        if self._catalog_dao.update_entry(task.catalog_id, set_audiogram) is None or not added:
+            self._file_dao.delete_file(file_id)
+            dispatcher.post_task(
+                CreateAudiogramResult(task=task).failed(f"No attachment {task.attachment_id} in catalog {task.catalog_id}")
+            )
+            return
+
+        # Tiles of an earlier run are not referenced anymore
+        for previous in replaced:
+            if previous.file_id is not None:
+                self._file_dao.delete_file(previous.file_id)
+                self._tile_dao.delete_tiles(previous.file_id)
+
+        LOGGER.debug(f"Audiogram of {task.source_file_id}: {geometry.frame_count} frames, {geometry.tile_count} tiles")
+        dispatcher.post_task(CreateAudiogramResult(task=task, audiogram=audiogram))
+
+    def _build_tiles(self, task: CreateAudiogram):
+        settings = task.settings
+        with self._pcm_cache.pinned(task.source_file_id) as path:
+            self._file_dao.load_pcm(task.source_file_id, self._pcm_cache)
+            geometry, rows = self._executor.run(
+                compute_spectrogram,
+                str(path),
+                SpectrogramGeometry(
+                    sample_rate=self._pcm_cache.sample_rate,
+                    fft_length=settings.fft_length,
+                    hop_length=settings.hop_length,
+                    bin_count=settings.bin_count,
+                    tile_width=settings.tile_width,
+                    min_db=settings.min_db,
+                ),
+            )
+        # The rows come back from the analysis process at once, they are copied to bytes a tile at a time only
+        grid_in = self._file_dao.open_upload_stream(
+            f"audiogram/{task.attachment_id}", metadata={"source_file_id": task.source_file_id}
+        )
+        try:
+            for start in range(0, len(rows), geometry.tile_width):
+                grid_in.write(rows[start : start + geometry.tile_width].tobytes())
+        except BaseException:
+            grid_in.abort()
+            raise
+        grid_in.close()
+        GRIDFS_BYTES.labels("write").inc(rows.nbytes)
+        return geometry, str(grid_in._id)
+
+    @task_handler(CreateAudiogramResult)
+    def create_audiogram_result(
+        self,
+        task_result: CreateAudiogramResult,
+        *args,
+        **kwargs,
+    ):
+        if task_result.is_failed:
+            LOGGER.error(f"Audiogram creation failed: {task_result.failure_reason}")
@@ -0,0 +1,85 @@
+from dataclasses import dataclass
+import logging
+from typing import Optional
+from uuid import UUID
+
+import gridfs.errors
+
+from tq.job_system import Job, JobManager
+from tq.task_dispacher import Task, TaskDispatcher, TaskResult, task_handler
+
+from tapearchive.analysis import fingerprint
+from tapearchive.analysis.executor import AnalysisExecutor, AnalysisPoolError
+from tapearchive.analysis.pcm_cache import create_pcm_cache
+from tapearchive.config import AppConfig
+from tapearchive.metrics import timed_task
+from tapearchive.models.catalog import CatalogDao
+from tapearchive.models.fingerprint import Fingerprint, FingerprintDao
+from tapearchive.models.raw_data import FileDao
+
+LOGGER = logging.getLogger(__name__)
+
+
+@dataclass
+class CreateFingerprint(Task):
+    catalog_id: UUID
+    recording_id: UUID
+    source_file_id: str
+
+
+@dataclass
+class CreateFingerprintResult(TaskResult):
+    landmark_count: Optional[int] = None
+
+
+class FingerprintHandler:
+    def __init__(self, db_pool, config: AppConfig = None, executor: AnalysisExecutor = None, **kwargs) -> None:
+        self.file_dao = FileDao(db_pool)
+        self.catalog_dao = CatalogDao(db_pool)
+        self.fingerprint_dao = FingerprintDao(db_pool)
+        self.fingerprint_dao.ensure_indexes()
+        self.pcm_cache = create_pcm_cache(config.analysis)
+        self.executor = executor or AnalysisExecutor(config.analysis.processes)
+
+    @task_handler(CreateFingerprint)
+    @timed_task(CreateFingerprint)
+    def create_fingerprint(
+        self,
+        task: CreateFingerprint,
+        dispatcher: TaskDispatcher = None,
+        job: Job = None,
+        manager: JobManager = None,
+    ):
+        entry = self.catalog_dao.get_entity(task.catalog_id)
+        if entry is None or not any(recording.id == task.recording_id for recording in entry.recordings):
+            reason = f"No recording {task.recording_id} in catalog {task.catalog_id}"
+            dispatcher.post_task(CreateFingerprintResult(task=task).failed(reason))
+            return
+
+        try:
+            with self.pcm_cache.pinned(task.source_file_id) as path:
+                self.file_dao.load_pcm(task.source_file_id, self.pcm_cache)
+                hashes, frames = self.executor.run(fingerprint.fingerprint, str(path), self.pcm_cache.sample_rate)
+        except AnalysisPoolError as e:
+            LOGGER.error(f"Analysis of {task.source_file_id} failed", exc_info=e)
+            dispatcher.post_task(CreateFingerprintResult(task=task).failed(str(e)))
+            return
+        except (OSError, RuntimeError, gridfs.errors.NoFile) as e:
+            LOGGER.error(f"Cannot read audio file {task.source_file_id}", exc_info=e)
+            dispatcher.post_task(CreateFingerprintResult(task=task).failed(f"Cannot read audio file: {e}"))
+            return
+
+        self.fingerprint_dao.store(
+            Fingerprint(
+                id=task.recording_id,
+                catalog_id=task.catalog_id,
+                source_file_id=task.source_file_id,
+                landmark_count=len(hashes),
+                frames_per_second=self.pcm_cache.sample_rate / fingerprint.HOP_LENGTH,
+            ),
+            hashes,
+            frames,
+        )
+
+        LOGGER.debug(f"Fingerprint of {task.source_file_id}: {len(hashes)} landmarks")
+        dispatcher.post_task(CreateFingerprintResult(task=task, landmark_count=len(hashes)))
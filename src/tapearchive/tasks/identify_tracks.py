@@ -0,0 +1,98 @@
+from dataclasses import dataclass
+import logging
+from typing import List, Optional
+from uuid import UUID
+
+import gridfs.errors
+
+from tq.job_system import Job, JobManager
+from tq.task_dispacher import Task, TaskDispatcher, TaskResult, task_handler
+
+from tapearchive.analysis.executor import AnalysisExecutor, AnalysisPoolError
+from tapearchive.analysis.pcm_cache import create_pcm_cache
+from tapearchive.analysis.silence import MIN_GAP_SECONDS, SILENCE_DB, SOUND_DB, cut_points, find_tracks
+from tapearchive.config import AppConfig
+from tapearchive.metrics import timed_task
+from tapearchive.models.catalog import CatalogDao, TrackSegment
+from tapearchive.models.raw_data import FileDao
+from tapearchive.tasks.audio_convert import SliceAudio
+
+LOGGER = logging.getLogger(__name__)
+
+
+@dataclass
+class IdentifyTracks(Task):
+    """Tracks of a recording of a whole tape side, from the gaps of silence between them.
+    If `slice_format` is set, the source is cut into one file per track as well.
+    """
+
+    catalog_id: UUID
+    recording_id: UUID
+    source_file_id: str
+    silence_db: float = SILENCE_DB
+    sound_db: float = SOUND_DB
+    min_gap_seconds: float = MIN_GAP_SECONDS
+    slice_format: Optional[str] = None
+
+
+@dataclass
+class IdentifyTracksResult(TaskResult):
+    tracks: Optional[List[TrackSegment]] = None
+
+
+class IdentifyTracksHandler:
+    def __init__(self, db_pool, config: AppConfig = None, executor: AnalysisExecutor = None, **kwargs) -> None:
+        self.file_dao = FileDao(db_pool)
+        self.catalog_dao = CatalogDao(db_pool)
+        self.pcm_cache = create_pcm_cache(config.analysis)
+        self.executor = executor or AnalysisExecutor(config.analysis.processes)
+
+    @task_handler(IdentifyTracks)
+    @timed_task(IdentifyTracks)
+    def identify_tracks(
+        self,
+        task: IdentifyTracks,
+        dispatcher: TaskDispatcher = None,
+        job: Job = None,
+        manager: JobManager = None,
+    ):
+        try:
+            with self.pcm_cache.pinned(task.source_file_id) as path:
+                self.file_dao.load_pcm(task.source_file_id, self.pcm_cache)
+                segments = self.executor.run(
+                    find_tracks,
+                    str(path),
+                    self.pcm_cache.sample_rate,
+                    task.silence_db,
+                    task.sound_db,
+                    task.min_gap_seconds,
+                )
+        except AnalysisPoolError as e:
+            LOGGER.error(f"Analysis of {task.source_file_id} failed", exc_info=e)
+            dispatcher.post_task(IdentifyTracksResult(task=task).failed(str(e)))
+            return
+        except (OSError, RuntimeError, ValueError, gridfs.errors.NoFile) as e:
+            LOGGER.error(f"Cannot find tracks of {task.source_file_id}", exc_info=e)
+            dispatcher.post_task(IdentifyTracksResult(task=task).failed(f"Cannot find tracks: {e}"))
+            return
+
+        tracks = [TrackSegment(start_seconds=round(start, 3), end_seconds=round(end, 3)) for start, end in segments]
+
+        def set_tracks(recording):
+            recording.tracks = tracks
+
+        if self.catalog_dao.update_recording(task.catalog_id, task.recording_id, set_tracks) is None:
+            reason = f"No recording {task.recording_id} in catalog {task.catalog_id}"
+            dispatcher.post_task(IdentifyTracksResult(task=task).failed(reason))
+            return
+
+        LOGGER.debug(f"Found {len(tracks)} tracks in {task.source_file_id}")
+        if task.slice_format is not None and len(segments) > 1:
+            dispatcher.post_task(
+                SliceAudio(
+                    source_file_id=task.source_file_id,
+                    file_format=task.slice_format,
+                    segment_times=cut_points(segments),
+                )
+            )
+        dispatcher.post_task(IdentifyTracksResult(task=task, tracks=tracks))
@@ -0,0 +1,73 @@
+from dataclasses import dataclass, field
+import logging
+from typing import List
+from uuid import UUID
+
+import gridfs.errors
+
+from tq.job_system import JobManager, Job
+from tq.task_dispacher import Task, TaskDispatcher, TaskResult, task_handler
+
+from tapearchive.config import AppConfig
+from tapearchive.metrics import timed_task
+from tapearchive.models.catalog import CatalogDao, find_attachment
+from tapearchive.models.thumbnails import THUMBNAIL_ATTACHMENT_TYPES, ThumbnailDao
+from tapearchive.utils.images import THUMBNAIL_SIZES
+
+LOGGER = logging.getLogger(__name__)
+
+
+@dataclass
+class CreateThumbnails(Task):
+    catalog_id: UUID
+    attachment_id: UUID
+    sizes: List[int] = field(default_factory=lambda: list(THUMBNAIL_SIZES))
+
+
+@dataclass
+class CreateThumbnailsResult(TaskResult):
+    pass
+
+
+class ThumbnailHandler:
+    """Renders the thumbnails of cover and document scans ahead of the first request"""
+
+    def __init__(self, db_pool, config: AppConfig = None, **kwargs) -> None:
+        self._catalog_dao = CatalogDao(db_pool)
+        self._thumbnail_dao = ThumbnailDao(db_pool, data_directory=config.data_directory)
+
+    @task_handler(CreateThumbnails)
+    @timed_task(CreateThumbnails)
+    def create_thumbnails(
+        self,
+        task: CreateThumbnails,
+        dispatcher: TaskDispatcher = None,
+        job: Job = None,
+        manager: JobManager = None,
+    ):
+        entry = self._catalog_dao.get_entity(task.catalog_id)
+        attachment = find_attachment(entry, task.attachment_id) if entry is not None else None
+        if attachment is None or attachment.type not in THUMBNAIL_ATTACHMENT_TYPES:
+            dispatcher.post_task(
+                CreateThumbnailsResult(task=task).failed(f"No image attachment {task.attachment_id} in catalog {task.catalog_id}")
+            )
+            return
+
+        try:
+            self._thumbnail_dao.create_thumbnails(attachment, task.sizes)
+        except (OSError, RuntimeError, gridfs.errors.NoFile) as e:
+            LOGGER.error(f"Cannot create thumbnails of attachment {attachment.id}", exc_info=e)
+            dispatcher.post_task(CreateThumbnailsResult(task=task).failed(f"Cannot create thumbnails: {e}"))
+            return
+
+        dispatcher.post_task(CreateThumbnailsResult(task=task))
+
+    @task_handler(CreateThumbnailsResult)
+    def create_thumbnails_result(
+        self,
+        task_result: CreateThumbnailsResult,
+        *args,
+        **kwargs,
+    ):
+        if task_result.is_failed:
+            LOGGER.error(f"Thumbnail creation failed: {task_result.failure_reason}")
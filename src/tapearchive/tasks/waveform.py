@@ -0,0 +1,107 @@
+from dataclasses import dataclass, field
+import logging
+from typing import List, Optional
+from uuid import UUID
+
+import gridfs.errors
+
+from tq.job_system import JobManager, Job
+from tq.task_dispacher import Task, TaskDispatcher, TaskResult, task_handler
+
+from tapearchive.analysis.pcm_cache import create_pcm_cache, iterate_blocks
+from tapearchive.analysis.waveform import DEFAULT_LEVELS, PeakBuilder
+from tapearchive.config import AppConfig
+from tapearchive.metrics import timed_task
+from tapearchive.models.catalog import CatalogDao, WaveformLevel, WaveformPeaks
+from tapearchive.models.raw_data import FileDao
+
+LOGGER = logging.getLogger(__name__)
+
+
+@dataclass
+class CreateWaveform(Task):
+    catalog_id: UUID
+    attachment_id: UUID
+    source_file_id: str
+    bits: int = 8
+    levels: List[int] = field(default_factory=lambda: list(DEFAULT_LEVELS))
+
+
+@dataclass
+class CreateWaveformResult(TaskResult):
+    waveform: Optional[WaveformPeaks] = None
+
+
+class WaveformHandler:
+    def __init__(self, db_pool, config: AppConfig = None, **kwargs) -> None:
+        self._file_dao = FileDao(db_pool)
+        self._catalog_dao = CatalogDao(db_pool)
+        self._pcm_cache = create_pcm_cache(config.analysis)
+
+    @task_handler(CreateWaveform)
+    @timed_task(CreateWaveform)
+    def create_waveform(
+        self,
+        task: CreateWaveform,
+        dispatcher: TaskDispatcher = None,
+        job: Job = None,
+        manager: JobManager = None,
+    ):
+        try:
+            builder, sample_rate = self._build_peaks(task)
+        except (RuntimeError, gridfs.errors.NoFile) as e:
+            LOGGER.error(f"Cannot read audio file {task.source_file_id}", exc_info=e)
+            dispatcher.post_task(CreateWaveformResult(task=task).failed(f"Cannot read audio file: {e}"))
+            return
+
+        levels = []
+        for level in builder.finish():
+            file_id = self._file_dao.upload(
+                f"waveform/{task.attachment_id}/{level.samples_per_pixel}",
+                level.to_bytes(task.bits),
+                metadata={"samples_per_pixel": level.samples_per_pixel, "bits": task.bits},
+            )
+            levels.append(WaveformLevel(level.samples_per_pixel, level.pixel_count, file_id))
+
+        waveform = WaveformPeaks(sample_rate=sample_rate, sample_count=builder.sample_count, bits=task.bits, levels=levels)
+
+        replaced = []
+
+        def set_waveform(attachment):
+            replaced[:] = [getattr(attachment, "waveform", None)]  # called again if the attachment changed meanwhile
+            attachment.waveform = waveform
+            attachment.duration_seconds = builder.sample_count / sample_rate
+            if attachment.file_id is None:
+                attachment.file_id = task.source_file_id
+
+        if self._catalog_dao.update_attachment(task.catalog_id, task.attachment_id, set_waveform) is None:
+            for level in levels:
+                self._file_dao.delete_file(level.file_id)
+            dispatcher.post_task(
+                CreateWaveformResult(task=task).failed(f"No attachment {task.attachment_id} in catalog {task.catalog_id}")
+            )
+            return
+
+        # Peaks of an earlier run are not referenced anymore
+        if replaced[0] is not None:
+            for level in replaced[0].levels:
+                self._file_dao.delete_file(level.file_id)
+
+        LOGGER.debug(f"Waveform of {task.source_file_id}: {builder.sample_count} samples, {len(levels)} levels")
+        dispatcher.post_task(CreateWaveformResult(task=task, waveform=waveform))
+
+    def _build_peaks(self, task: CreateWaveform):
+        builder = PeakBuilder(task.levels)
+        for block in iterate_blocks(self._file_dao.load_pcm(task.source_file_id, self._pcm_cache)):
+            builder.push(block)
+        return builder, self._pcm_cache.sample_rate
+
+    @task_handler(CreateWaveformResult)
+    def create_waveform_result(
+        self,
+        task_result: CreateWaveformResult,
+        *args,
+        **kwargs,
+    ):
+        if task_result.is_failed:
+            LOGGER.error(f"Waveform creation failed: {task_result.failure_reason}")
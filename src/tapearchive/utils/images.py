@@ -0,0 +1,39 @@
+import io
+from typing import BinaryIO, Dict, Iterable
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Optional, thumbnails are not available without it
+    Image = None
+
+THUMBNAIL_SIZES = (128, 256, 512)
+THUMBNAIL_MIMETYPE = "image/jpeg"
+JPEG_QUALITY = 80
+
+
+def is_supported() -> bool:
+    return Image is not None
+
+
+def render_thumbnails(source: BinaryIO, sizes: Iterable[int] = THUMBNAIL_SIZES) -> Dict[int, bytes]:
+    """JPEG thumbnails fitting into size x size boxes, the source image is decoded once for all the sizes.
+
+    JPEG scans are decoded at a reduced scale right away (draft mode), which skips most of the decoding work.
+    Raises RuntimeError if Pillow is not installed, and PIL.UnidentifiedImageError if the source is not an image.
+    """
+    if Image is None:
+        raise RuntimeError("Pillow is required for thumbnails, install the `images` extra")
+
+    sizes = sorted(set(sizes), reverse=True)
+    with Image.open(source) as image:
+        image.draft("RGB", (sizes[0], sizes[0]))
+        image = ImageOps.exif_transpose(image).convert("RGB")
+
+    thumbnails = {}
+    for size in sizes:
+        # Each size is reduced from the previous one, which is still larger than it
+        image.thumbnail((size, size), Image.LANCZOS)
+        data = io.BytesIO()
+        image.save(data, format="JPEG", quality=JPEG_QUALITY, optimize=True, progressive=True)
+        thumbnails[size] = data.getvalue()
+    return thumbnails
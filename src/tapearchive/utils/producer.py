@@ -0,0 +1,156 @@
+import json
+import logging
+import threading
+from typing import Any, Callable, Dict, List, Optional, Set
+from uuid import UUID
+
+import redis
+from tqdm import tqdm
+
+from tq.task_dispacher import Task, TaskDispatcher
+
+LOGGER = logging.getLogger(__name__)
+
+
+class TaskProducer:
+    """Posts the tasks of a bulk job, with at most `max_in_flight` of them unfinished at a time.
+
+    post() blocks while the window is full, the result handlers free a place by calling finish() with the id of the
+    finished task. The producer keeps a JSON record per unfinished task in a Redis hash, the ledger, so the records of
+    an interrupted run can be found by the next one. Ledger writes are buffered and sent in pipelined batches; a record
+    which is finished before its batch is sent never reaches Redis at all.
+
+    The next run adopts the records with adopt_stale(): the tasks of the interrupted run still in the queue are not
+    posted again, their results are finished like the results of the tasks posted by this run. Adopted tasks do not
+    take places of the window, they were posted already.
+    """
+
+    def __init__(
+        self,
+        dispatcher: TaskDispatcher,
+        connection_pool: redis.ConnectionPool,
+        ledger_key: str,
+        max_in_flight: int = 256,
+        batch_size: int = 64,
+        progress: Optional[tqdm] = None,
+    ):
+        self._dispatcher = dispatcher
+        self._redis = redis.Redis(connection_pool=connection_pool)
+        self._ledger_key = ledger_key
+        self._batch_size = batch_size
+        self._progress = progress
+
+        self._slots = threading.BoundedSemaphore(max_in_flight)
+        self._lock = threading.Lock()
+        self._finished = threading.Condition(self._lock)
+        self._records: Dict[str, Any] = {}  # task id -> record of the unfinished tasks
+        self._adopted: Set[str] = set()  # task ids of the unfinished tasks of an interrupted run
+        self._unsent_records: Dict[str, str] = {}
+        self._unsent_deletes: List[str] = []
+        self._posted_count = 0
+
+    def adopt_stale(self, is_finished: Optional[Callable[[Any], bool]] = None) -> List[Any]:
+        """Records left in the ledger by an interrupted run, their tasks are waited for as if this producer had posted
+        them. Records for which `is_finished` is true, eg. the result was stored but the record was not deleted yet,
+        are deleted instead.
+        """
+        with self._lock:
+            adopted = []
+            for key, value in self._redis.hgetall(self._ledger_key).items():
+                key, record = key.decode(), json.loads(value)
+                if is_finished is not None and is_finished(record):
+                    self._unsent_deletes.append(key)
+                    continue
+                self._records[key] = record
+                self._adopted.add(key)
+                adopted.append(record)
+            self._posted_count += len(adopted)
+            self._update_progress_total()
+            self._flush()
+        return adopted
+
+    def post(self, task: Task, record: Any) -> UUID:
+        """Posts `task` once there is a free place in the window. `record` is any JSON serializable value."""
+        self._slots.acquire()
+        # A result can arrive before post_task() returns, finish() waits for the record to be registered
+        with self._lock:
+            try:
+                task_id = self._dispatcher.post_task(task)
+            except BaseException:
+                self._slots.release()
+                raise
+            key = str(task_id)
+            self._records[key] = record
+            self._unsent_records[key] = json.dumps(record)
+            self._posted_count += 1
+            self._update_progress_total()
+            self._flush_if_full()
+        return task_id
+
+    def finish(self, task_id: UUID) -> Optional[Any]:
+        """Record of a finished task, None if the task was not posted by this producer, eg. by an interrupted run"""
+        with self._lock:
+            key = str(task_id)
+            if key not in self._records:
+                return None
+            record = self._records.pop(key)
+            if self._unsent_records.pop(key, None) is None:
+                self._unsent_deletes.append(key)
+            if self._progress is not None:
+                self._progress.update(1)
+            self._flush_if_full()
+            self._finished.notify_all()
+            if key in self._adopted:
+                self._adopted.remove(key)
+                return record
+        self._slots.release()
+        return record
+
+    def wait(self, stale_timeout: Optional[float] = None) -> List[Any]:
+        """Waits until every task has finished. Adopted tasks are waited for as long as their results keep arriving:
+        once the tasks of this run have finished, the adopted ones without a result for `stale_timeout` seconds are
+        given up, eg. their results were lost with the interrupted run. Their records are deleted and returned, so
+        they can be posted again.
+        """
+        with self._lock:
+            self._flush()
+            while len(self._records) > len(self._adopted):
+                self._finished.wait()
+            while self._adopted:
+                if not self._finished.wait(timeout=stale_timeout):
+                    break
+
+            given_up = []
+            for key in self._adopted:
+                given_up.append(self._records.pop(key))
+                self._unsent_deletes.append(key)
+            self._adopted.clear()
+            self._posted_count -= len(given_up)
+            self._update_progress_total()
+            self._flush()
+        return given_up
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._records)
+
+    def _flush_if_full(self):
+        if len(self._unsent_records) + len(self._unsent_deletes) >= self._batch_size:
+            self._flush()
+
+    def _flush(self):
+        if not self._unsent_records and not self._unsent_deletes:
+            return
+        with self._redis.pipeline(transaction=False) as pipe:
+            if self._unsent_records:
+                pipe.hset(self._ledger_key, mapping=self._unsent_records)
+            if self._unsent_deletes:
+                pipe.hdel(self._ledger_key, *self._unsent_deletes)
+            pipe.execute()
+        self._unsent_records = {}
+        self._unsent_deletes = []
+
+    def _update_progress_total(self):
+        if self._progress is not None:
+            self._progress.total = self._posted_count
+            self._progress.refresh()
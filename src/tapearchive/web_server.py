@@ -0,0 +1,59 @@
+import logging
+import os
+from typing import Optional
+
+from gunicorn.app.base import BaseApplication
+from prometheus_client import multiprocess
+
+from tapearchive.config import AppConfig
+from tapearchive.flask_app import create_flask_app
+
+LOGGER = logging.getLogger(__name__)
+
+
+def _close_mongo_client(server, worker):
+    mongo_client = getattr(worker.wsgi, "extensions", {}).get("mongo_client")
+    if mongo_client is not None:
+        mongo_client.close()
+
+
+def _mark_metrics_process_dead(server, worker):
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        multiprocess.mark_process_dead(worker.pid)
+
+
+class WebServer(BaseApplication):
+    """Prefork gunicorn server for the web api.
+
+    The app is not preloaded, so every worker process creates its own Flask app and Mongo client after the fork.
+    Workers are threaded (gthread) to keep connections alive and to serve long running file streams concurrently.
+    Set PROMETHEUS_MULTIPROC_DIR to an empty directory to merge the metrics of all workers on /metrics.
+    """
+
+    def __init__(self, config: AppConfig, logging_config: Optional[str] = None):
+        self._config = config
+        self._logging_config = logging_config
+        super().__init__()
+
+    def load_config(self):
+        web_config = self._config.web
+        settings = {
+            "bind": f"{web_config.host}:{web_config.port}",
+            "workers": web_config.workers,
+            "threads": web_config.threads,
+            "worker_class": "gthread",
+            "keepalive": web_config.keepalive_seconds,
+            "timeout": web_config.timeout_seconds,
+            "graceful_timeout": web_config.graceful_timeout_seconds,
+            "preload_app": False,
+            "worker_exit": _close_mongo_client,
+            "child_exit": _mark_metrics_process_dead,
+        }
+        if self._logging_config:
+            settings["logconfig"] = self._logging_config
+
+        for key, value in settings.items():
+            self.cfg.set(key, value)
+
+    def load(self):
+        return create_flask_app(self._config)
@@ -1,4 +1,5 @@
 import abc
+import collections
 from dataclasses import dataclass, field
 from datetime import datetime
 import enum
@@ -9,6 +10,8 @@ from statemachine import StateMachine, State
 
 from tq.task_dispacher import TaskResult, TaskResultType, TaskType, task_handler
 
+from tapearchive.metrics import WORKFLOW_STEPS
+
 
 LOGGER = logging.getLogger(__name__)
 
@@ -126,6 +129,10 @@ class AbstractFlowStep(abc.ABC):
     def name(self) -> str:
         return self._name
 
+    @property
+    def state(self) -> str:
+        return self._state_macine.current_state.name
+
     @property
     def task_id(self) -> Optional[UUID]:
         return self._task_id
@@ -255,6 +262,13 @@ class WorkflowManager:
             else:
                 workflow.poll()
 
+        self._update_step_metrics()
+
+    def _update_step_metrics(self):
+        counts = collections.Counter(step.state for workflow in self._workflows for step in workflow.iterate_steps())
+        for state in FlowStateMachine.states:
+            WORKFLOW_STEPS.labels(state.name).set(counts[state.name])
+
     @property
     def all_done(self):
         return all(workflow.is_done() for workflow in self._workflows)
@@ -1,14 +1,20 @@
+from datetime import timedelta
 import uuid
 import pytest
 
 from tapearchive.models.catalog import (
+    Attachment,
     AttachmentType,
     AudioAttachment,
     CatalogDao,
     CatalogEntry,
     ChannelMode,
+    KeyTrackPoint,
     RecordingEntry,
+    TrackSegment,
+    find_attachment,
 )
+from tapearchive.models.stats import ArchiveStatsAggregator, CatalogStatsDao
 
 
 @pytest.fixture(scope="function")
@@ -102,3 +108,221 @@ def test_fetch_all_catalog_names(catalog_dao: CatalogDao, dummy_catalog_entries:
     for catalog_id, catalog_name in catalog:
         assert catalog_name in [entry.name for entry in dummy_catalog_entries]
         assert catalog_id in entity_ids
+
+
+def test_catalog_cache_serves_decoded_entry(catalog_dao: CatalogDao, dummy_catalog_entries: list):
+    entity_id = catalog_dao.create_or_update(dummy_catalog_entries[0])
+
+    first = catalog_dao.get_entity(entity_id)
+    second = catalog_dao.get_entity(entity_id)
+
+    assert first is second
+    validate_catalog_entry(second, dummy_catalog_entries[0])
+
+
+def test_catalog_cache_invalidated_by_other_writer(mongodb_client, catalog_dao: CatalogDao, dummy_catalog_entries: list):
+    entry = dummy_catalog_entries[0]
+    entity_id = catalog_dao.create_or_update(entry)
+    version = catalog_dao.get_version(entity_id)
+    assert catalog_dao.get_entity(entity_id).description == entry.description
+
+    other_dao = CatalogDao(mongodb_client)
+    entry.description = "updated elsewhere"
+    other_dao.create_or_update(entry)
+
+    assert catalog_dao.get_version(entity_id) == version + 1
+    assert catalog_dao.get_entity(entity_id).description == "updated elsewhere"
+
+
+def test_fetch_catalog_names_paginated(catalog_dao: CatalogDao, dummy_catalog_entries: list):
+    catalog_dao.bulk_create_or_update(dummy_catalog_entries)
+
+    pages = []
+    after_name, after_id = None, None
+    while True:
+        page = list(catalog_dao.get_catalog_names_page(3, after_name=after_name, after_id=after_id))
+        if not page:
+            break
+        pages.append(page)
+        after_id, after_name = page[-1]
+
+    names = [name for page in pages for _, name in page]
+    assert len(pages) == 4
+    assert names == sorted(entry.name for entry in dummy_catalog_entries)
+
+
+def test_fetch_catalog_names_by_prefix(catalog_dao: CatalogDao, dummy_catalog_entries: list):
+    dummy_catalog_entries[0].name = "B4"
+    dummy_catalog_entries[1].name = "B42"
+    catalog_dao.bulk_create_or_update(dummy_catalog_entries)
+
+    page = list(catalog_dao.get_catalog_names_page(10, prefix="B4", descending=True))
+
+    assert [name for _, name in page] == ["B42", "B4"]
+
+
+def test_search_catalog_entries(catalog_dao: CatalogDao, dummy_catalog_entries: list):
+    catalog_dao.ensure_indexes()
+    dummy_catalog_entries[0].description = "Live recording from the summer festival"
+    catalog_dao.bulk_create_or_update(dummy_catalog_entries)
+
+    result = catalog_dao.search("festival")
+
+    assert result.total == 1
+    assert result.hits[0].id == dummy_catalog_entries[0].id
+    assert result.hits[0].recording_count == len(dummy_catalog_entries[0].recordings)
+    assert result.facets["format"] == {"mp3": 1}
+    assert result.facets["channel_mode"] == {"stereo": 1}
+
+
+def test_search_catalog_entries_by_facet(catalog_dao: CatalogDao, dummy_catalog_entries: list):
+    catalog_dao.ensure_indexes()
+    for recording in dummy_catalog_entries[0].recordings:
+        for audio_file in recording.audio_files:
+            audio_file.format = "flac"
+    catalog_dao.bulk_create_or_update(dummy_catalog_entries)
+
+    result = catalog_dao.search(filters={"format": "flac"}, page_size=5)
+
+    assert result.total == 1
+    assert result.facets["format"] == {"flac": 1, "mp3": 1}
+
+    result = catalog_dao.search(filters={"format": "mp3"}, page_size=5)
+
+    assert result.total == len(dummy_catalog_entries)
+    assert len(result.hits) == 5
+
+
+def test_archive_stats_refresh(mongodb_client, catalog_dao: CatalogDao, dummy_catalog_entries: list):
+    for recording in dummy_catalog_entries[0].recordings:
+        for audio_file in recording.audio_sources + recording.audio_files:
+            audio_file.duration_seconds = 36.0  # converted files repeat the audio of the sources
+    catalog_dao.bulk_create_or_update(dummy_catalog_entries)
+
+    aggregator = ArchiveStatsAggregator(catalog_dao, CatalogStatsDao(mongodb_client))
+    stats = aggregator.refresh()
+
+    assert stats.catalog_count == 10
+    assert stats.recording_count == 100
+    assert stats.file_count == 2000
+    assert stats.formats["mp3"].file_count == 2000
+    assert stats.audio_hours == 1.0
+    assert aggregator.is_fresh(timedelta(minutes=1))
+
+    catalog_dao.delete(dummy_catalog_entries[1].id)
+    dummy_catalog_entries[0].recordings = dummy_catalog_entries[0].recordings[:5]
+    catalog_dao.create_or_update(dummy_catalog_entries[0])
+
+    stats = aggregator.refresh()
+
+    assert stats.catalog_count == 9
+    assert stats.recording_count == 85
+    assert stats.audio_hours == 0.5
+
+
+def test_fetch_catalog_entries_in_batch(catalog_dao: CatalogDao, dummy_catalog_entries: list):
+    catalog_dao.bulk_create_or_update(dummy_catalog_entries)
+
+    entries = catalog_dao.get_entities(
+        ids=[entry.id for entry in dummy_catalog_entries[:3]] + [uuid.uuid4()],
+        names=[dummy_catalog_entries[5].name],
+    )
+
+    assert sorted(entry.name for entry in entries) == sorted(
+        entry.name for entry in dummy_catalog_entries[:3] + [dummy_catalog_entries[5]]
+    )
+
+
+def test_fetch_catalog_entry_summaries(catalog_dao: CatalogDao, dummy_catalog_entries: list):
+    catalog_dao.bulk_create_or_update(dummy_catalog_entries)
+
+    summaries = catalog_dao.get_entity_summaries(["name", "recording_count"], ids=[dummy_catalog_entries[0].id])
+
+    assert summaries == [
+        {
+            "id": dummy_catalog_entries[0].id,
+            "name": dummy_catalog_entries[0].name,
+            "recording_count": len(dummy_catalog_entries[0].recordings),
+        }
+    ]
+
+
+def test_update_attachment_retries_on_concurrent_change(mongodb_client, catalog_dao: CatalogDao, dummy_catalog_entries: list):
+    entry = dummy_catalog_entries[0]
+    catalog_dao.create_or_update(entry)
+    attachment_id = entry.recordings[0].audio_files[0].id
+    other_dao = CatalogDao(mongodb_client)
+    seen_formats = []
+
+    def set_format(attachment):
+        seen_formats.append(attachment.format)
+        if len(seen_formats) == 1:
+            # Other writers change the same field and another one meanwhile
+            other_dao.update_attachment(entry.id, attachment_id, lambda other: setattr(other, "format", "flac"))
+            other_dao.update_attachment(entry.id, attachment_id, lambda other: setattr(other, "duration_seconds", 60.0))
+        attachment.format = f"{attachment.format}+checked"
+
+    catalog_dao.update_attachment(entry.id, attachment_id, set_format)
+
+    assert seen_formats == ["mp3", "flac"]
+    stored = find_attachment(catalog_dao.get_entity(entry.id), attachment_id)
+    assert stored.format == "flac+checked"
+    assert stored.duration_seconds == 60.0
+
+
+def test_update_attachment_keeps_other_fields(mongodb_client, catalog_dao: CatalogDao, dummy_catalog_entries: list):
+    entry = dummy_catalog_entries[0]
+    catalog_dao.create_or_update(entry)
+    attachment_id = entry.recordings[0].audio_files[0].id
+    other_dao = CatalogDao(mongodb_client)
+    calls = []
+
+    def set_duration(attachment):
+        calls.append(attachment)
+        other_dao.update_attachment(entry.id, attachment_id, lambda other: setattr(other, "format", "flac"))
+        attachment.duration_seconds = 60.0
+
+    catalog_dao.update_attachment(entry.id, attachment_id, set_duration)
+
+    assert len(calls) == 1
+    stored = find_attachment(catalog_dao.get_entity(entry.id), attachment_id)
+    assert (stored.format, stored.duration_seconds) == ("flac", 60.0)
+
+
+def test_update_recording_keeps_concurrent_analyses(mongodb_client, catalog_dao: CatalogDao, dummy_catalog_entries: list):
+    entry = dummy_catalog_entries[0]
+    catalog_dao.create_or_update(entry)
+    recording_id = entry.recordings[0].id
+    other_dao = CatalogDao(mongodb_client)
+    tracks = [TrackSegment(start_seconds=0.0, end_seconds=180.0)]
+    key_track = [KeyTrackPoint(start_seconds=0.0, end_seconds=30.0, key="A minor", confidence=0.8)]
+
+    def set_key_track(recording):
+        other_dao.update_recording(entry.id, recording_id, lambda other: setattr(other, "tracks", tracks))
+        recording.key_track = key_track
+
+    catalog_dao.update_recording(entry.id, recording_id, set_key_track)
+
+    stored = next(r for r in catalog_dao.get_entity(entry.id).recordings if r.id == recording_id)
+    assert stored.tracks == tracks
+    assert stored.key_track == key_track
+
+
+def test_update_entry_retries_on_concurrent_change(mongodb_client, catalog_dao: CatalogDao, dummy_catalog_entries: list):
+    entry = dummy_catalog_entries[0]
+    catalog_dao.create_or_update(entry)
+    other_dao = CatalogDao(mongodb_client)
+    cover = Attachment(id=uuid.uuid4(), name="cover", type=AttachmentType.COVER, path="cover.jpg", meta={})
+    audiogram = Attachment(id=uuid.uuid4(), name="audiogram", type=AttachmentType.AUDIOGRAM, path="audiogram", meta={})
+    calls = []
+
+    def add_audiogram(changed_entry):
+        calls.append(changed_entry)
+        if len(calls) == 1:
+            other_dao.update_entry(entry.id, lambda other: setattr(other, "attachments", other.attachments + [cover]))
+        changed_entry.attachments = changed_entry.attachments + [audiogram]
+
+    catalog_dao.update_entry(entry.id, add_audiogram)
+
+    assert len(calls) == 2
+    assert [attachment.id for attachment in catalog_dao.get_entity(entry.id).attachments] == [cover.id, audiogram.id]
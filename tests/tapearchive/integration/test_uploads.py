@@ -0,0 +1,76 @@
+import io
+import os
+
+import gridfs
+import pytest
+
+from tapearchive.models.uploads import UploadConflict, UploadDao, chain_checksum
+
+CHUNK_SIZE = 1024
+
+
+@pytest.fixture(scope="function")
+def upload_dao(mongodb_client):
+    yield UploadDao(mongodb_client, chunks_per_write=2)
+
+
+def expected_checksum(data: bytes) -> str:
+    state = bytes(32)
+    for start in range(0, len(data), CHUNK_SIZE):
+        state = chain_checksum(state, data[start : start + CHUNK_SIZE])
+    return state.hex()
+
+
+def test_resumable_upload(mongodb_client, upload_dao: UploadDao):
+    data = os.urandom(10 * CHUNK_SIZE + 123)
+    session = upload_dao.create_session("side_a.wav", len(data), chunk_size=CHUNK_SIZE)
+
+    offset = 0
+    for piece_size in (1500, 3000, 77, len(data)):
+        piece = data[offset : offset + piece_size]
+        offset = upload_dao.append(session.id, offset, io.BytesIO(piece))
+        assert upload_dao.get_session(session.id).offset == offset
+
+    session = upload_dao.finalize(session.id)
+
+    assert session.is_finalized
+    assert session.checksum_state == expected_checksum(data)
+
+    bucket = gridfs.GridFSBucket(mongodb_client.get_default_database())
+    with bucket.open_download_stream(gridfs.ObjectId(session.file_id)) as grid_out:
+        assert grid_out.read() == data
+
+
+def test_upload_rejects_wrong_offset(upload_dao: UploadDao):
+    session = upload_dao.create_session("side_a.wav", 4 * CHUNK_SIZE, chunk_size=CHUNK_SIZE)
+    upload_dao.append(session.id, 0, io.BytesIO(bytes(CHUNK_SIZE)))
+
+    with pytest.raises(UploadConflict):
+        upload_dao.append(session.id, 0, io.BytesIO(bytes(CHUNK_SIZE)))
+
+    with pytest.raises(UploadConflict):
+        upload_dao.finalize(session.id)
+
+
+def test_upload_is_written_by_one_request_at_a_time(mongodb_client, upload_dao: UploadDao):
+    data = os.urandom(4 * CHUNK_SIZE)
+    session = upload_dao.create_session("side_a.wav", len(data), chunk_size=CHUNK_SIZE)
+    conflicts = []
+
+    class InterleavedStream(io.BytesIO):
+        def read(self, size=-1):
+            # Another request at the same offset while this one is in progress
+            if self.tell() == CHUNK_SIZE and not conflicts:
+                with pytest.raises(UploadConflict) as e:
+                    upload_dao.append(session.id, 0, io.BytesIO(os.urandom(len(data))))
+                conflicts.append(e.value)
+            return super().read(size)
+
+    assert upload_dao.append(session.id, 0, InterleavedStream(data)) == len(data)
+    session = upload_dao.finalize(session.id)
+
+    assert len(conflicts) == 1
+    assert session.checksum_state == expected_checksum(data)
+    bucket = gridfs.GridFSBucket(mongodb_client.get_default_database())
+    with bucket.open_download_stream(gridfs.ObjectId(session.file_id)) as grid_out:
+        assert grid_out.read() == data
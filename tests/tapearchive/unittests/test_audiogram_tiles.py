@@ -0,0 +1,51 @@
+import io
+import uuid
+
+import gridfs.errors
+import numpy as np
+
+from tapearchive.analysis.spectrogram import SpectrogramGeometry, pool_frames
+from tapearchive.models.audiogram import AudiogramTileDao
+from tapearchive.models.catalog import Attachment, AttachmentType
+
+AUDIOGRAM_FILE_ID = "audiogram-file"
+
+
+class RacingBucket:
+    """Serves the audiogram file only, stored tiles are never found, as by requests which missed them concurrently"""
+
+    def __init__(self, audiogram: bytes):
+        self.audiogram = audiogram
+        self.tiles = {}
+
+    def open_download_stream(self, file_id):
+        if file_id != AUDIOGRAM_FILE_ID:
+            raise gridfs.errors.NoFile(file_id)
+        return io.BytesIO(self.audiogram)
+
+    def upload_from_stream_with_id(self, file_id, filename, source, metadata=None):
+        if file_id in self.tiles:
+            raise gridfs.errors.FileExists(file_id)
+        self.tiles[file_id] = source
+
+
+def test_tile_stored_concurrently_is_served():
+    geometry = SpectrogramGeometry(22050, bin_count=8, tile_width=4, frame_count=64)
+    frames = np.random.default_rng(0).integers(0, 256, geometry.frame_count * geometry.bin_count, dtype=np.uint8)
+    audiogram = Attachment(
+        id=uuid.uuid4(),
+        name="audiogram",
+        type=AttachmentType.AUDIOGRAM,
+        path="audiogram",
+        meta=geometry.to_meta(),
+        file_id=AUDIOGRAM_FILE_ID,
+    )
+    dao = AudiogramTileDao.__new__(AudiogramTileDao)
+    dao._bucket = RacingBucket(frames.tobytes())
+
+    first = dao.get_tile(audiogram, 1, 1)
+    second = dao.get_tile(audiogram, 1, 1)
+
+    expected = pool_frames(frames[32 * 8 :].tobytes(), geometry, 1)
+    assert first == second == expected
+    assert list(dao._bucket.tiles.values()) == [expected]
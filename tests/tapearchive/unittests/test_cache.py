@@ -0,0 +1,52 @@
+from tapearchive.models.cache import LRUCache, VersionedCache
+
+
+def test_lru_cache_evicts_least_recently_used():
+    cache = LRUCache(max_size=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1
+
+    cache.put("c", 3)
+
+    assert "b" not in cache
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    assert len(cache) == 2
+
+
+def test_versioned_cache_misses_on_version_change():
+    cache = VersionedCache(max_size=4)
+    cache.put_version("a", 1, "first")
+
+    assert cache.get_version("a", 1) == "first"
+    assert cache.get_version("a", 2) is None
+
+
+def test_versioned_cache_drops_value_invalidated_while_loading():
+    cache = VersionedCache(max_size=4)
+
+    reservation = cache.reserve("a")
+    cache.pop("a")  # changed after the loader has read it
+    assert not cache.put_reserved("a", reservation, 1, "stale")
+    cache.release("a", reservation)
+    assert "a" not in cache
+
+    reservation = cache.reserve("a")
+    assert cache.put_reserved("a", reservation, 2, "fresh")
+    cache.release("a", reservation)
+    assert cache.get_version("a", 2) == "fresh"
+
+
+def test_versioned_cache_clear_invalidates_loads_in_progress():
+    cache = VersionedCache(max_size=4)
+
+    first = cache.reserve("a")
+    cache.clear()
+    second = cache.reserve("a")
+
+    assert not cache.put_reserved("a", first, 1, "stale")
+    assert cache.put_reserved("a", second, 2, "fresh")
+    cache.release("a", first)
+    cache.release("a", second)
+    assert cache.get_version("a", 2) == "fresh"
@@ -0,0 +1,93 @@
+import pathlib
+import uuid
+
+import marshmallow
+import pytest
+
+from tapearchive.models.catalog import AttachmentType, AudioAttachment, CatalogEntry, ChannelMode, RecordingEntry
+from tapearchive.models.codec import get_codec
+
+
+@pytest.fixture(scope="function")
+def catalog_entry():
+    return CatalogEntry(
+        id=uuid.uuid4(),
+        name="A1",
+        recordings=[
+            RecordingEntry(
+                id=uuid.uuid4(),
+                name="A1_side_1_channel_stereo",
+                source_channel_mode=ChannelMode.STEREO,
+                audio_sources=[
+                    AudioAttachment(
+                        id=uuid.uuid4(),
+                        name="211009_0001.wav",
+                        type=AttachmentType.AUDIO_FILE,
+                        path=pathlib.Path("A1/211009_0001.wav"),
+                        meta={},
+                        format="wav",
+                    )
+                ],
+                audio_files=[],
+                meta={"comment": ""},
+            )
+        ],
+        groups=[],
+        attachments=[],
+        description="Tape A1",
+        meta={},
+    )
+
+
+def test_codec_round_trip(catalog_entry: CatalogEntry):
+    codec = get_codec(CatalogEntry)
+
+    data = codec.encode(catalog_entry)
+    assert data["recordings"][0]["source_channel_mode"] == "STEREO"
+    assert data["recordings"][0]["audio_sources"][0]["path"] == "A1/211009_0001.wav"
+
+    assert codec.decode(data) == catalog_entry
+
+
+def test_codec_matches_marshmallow_schema(catalog_entry: CatalogEntry):
+    codec = get_codec(CatalogEntry)
+
+    # Catalog manifests on disk were written by schema().dump(), enums by name
+    dumped = CatalogEntry.schema().dump(catalog_entry)
+    assert codec.decode(dumped) == catalog_entry
+    assert codec.encode(catalog_entry) == dumped
+    assert CatalogEntry.schema().load(codec.encode(catalog_entry)) == catalog_entry
+
+
+def test_codec_decodes_enum_values(catalog_entry: CatalogEntry):
+    # Documents in Mongo were written by to_dict(), enums by value
+    assert get_codec(CatalogEntry).decode(catalog_entry.to_dict(encode_json=True)) == catalog_entry
+
+
+def test_codec_reports_invalid_enums(catalog_entry: CatalogEntry):
+    data = get_codec(CatalogEntry).encode(catalog_entry)
+    data["recordings"][0]["source_channel_mode"] = "QUADRO"
+    with pytest.raises(marshmallow.ValidationError) as e:
+        get_codec(CatalogEntry).decode(data)
+    assert e.value.messages == {"recordings": {"source_channel_mode": ["'QUADRO' is not a valid ChannelMode"]}}
+
+
+def test_codec_unknown_fields(catalog_entry: CatalogEntry):
+    data = get_codec(CatalogEntry).encode(catalog_entry)
+    data["recordings"][0]["rating"] = 5
+
+    with pytest.raises(marshmallow.ValidationError) as e:
+        get_codec(CatalogEntry).decode(data)
+    assert e.value.messages == {"recordings": {"rating": ["Unknown field."]}}
+
+    assert get_codec(CatalogEntry, unknown=marshmallow.EXCLUDE).decode(data) == catalog_entry
+
+
+def test_codec_is_built_once():
+    assert get_codec(CatalogEntry) is get_codec(CatalogEntry)
+
+
+def test_codec_reports_missing_fields():
+    with pytest.raises(marshmallow.ValidationError) as e:
+        get_codec(CatalogEntry).decode({"id": str(uuid.uuid4())})
+    assert set(e.value.messages.keys()) == {"name", "recordings"}
@@ -0,0 +1,60 @@
+import os
+
+import numpy as np
+import pytest
+
+from tapearchive.analysis.executor import SHARED_MEMORY_THRESHOLD, AnalysisExecutor, AnalysisPoolError
+from tapearchive.analysis.spectrogram import SpectrogramBuilder, SpectrogramGeometry, compute_spectrogram
+
+
+def shared_memory_blocks():
+    # Blocks of multiprocessing.shared_memory, besides the semaphores of the pool
+    return {name for name in os.listdir("/dev/shm") if name.startswith("psm_")} if os.path.isdir("/dev/shm") else set()
+
+
+@pytest.fixture(scope="module")
+def executor():
+    with AnalysisExecutor(2) as executor:
+        yield executor
+
+
+def test_large_arrays_come_back_through_shared_memory(executor):
+    before = shared_memory_blocks()
+
+    result = executor.run(np.full, (1000, 1000), 7, dtype=np.float32)
+
+    assert result.shape == (1000, 1000) and result.dtype == np.float32 and np.all(result == 7)
+    assert result.nbytes >= SHARED_MEMORY_THRESHOLD
+    assert shared_memory_blocks() == before
+
+
+def test_small_results_are_pickled(executor):
+    assert executor.run(divmod, 7, 2) == (3, 1)
+    assert executor.run(np.arange, 3).tolist() == [0, 1, 2]
+
+
+def test_errors_are_raised_in_the_caller(executor):
+    with pytest.raises(ValueError):
+        executor.run(np.zeros, -1)
+
+
+def test_pool_is_restarted_after_a_process_died():
+    with AnalysisExecutor(1) as executor:
+        with pytest.raises(AnalysisPoolError):
+            executor.run(os._exit, 1)
+
+        assert executor.run(divmod, 7, 2) == (3, 1)
+
+
+def test_spectrogram_of_a_cache_file(executor, tmp_path):
+    samples = np.random.default_rng(0).uniform(-1, 1, (22050 * 10, 2)).astype(np.float32)
+    path = tmp_path / "pcm.npy"
+    np.save(path, samples)
+
+    geometry, rows = executor.run(compute_spectrogram, str(path), SpectrogramGeometry(22050, tile_width=16))
+
+    builder = SpectrogramBuilder(SpectrogramGeometry(22050, tile_width=16))
+    expected = b"".join(builder.push(samples) + builder.finish())
+    assert geometry.frame_count == builder.geometry.frame_count
+    assert rows.shape == (geometry.tile_count * 16, geometry.bin_count)
+    assert rows.tobytes() == expected
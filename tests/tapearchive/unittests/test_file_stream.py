@@ -0,0 +1,80 @@
+from datetime import datetime
+import io
+
+from flask import Flask
+from flask_restful import Api
+import gridfs.errors
+import pytest
+
+from tapearchive.api.files import FileStreamView
+
+DATA = bytes(range(256)) * 64
+
+
+class FakeGridOut(io.BytesIO):
+    filename = "side_a.mp3"
+    chunk_size = 1000
+    upload_date = datetime(2022, 6, 19)
+
+    @property
+    def length(self) -> int:
+        return len(self.getbuffer())
+
+
+class FakeFileController:
+    def open_file(self, file_id: str):
+        if file_id != "side_a":
+            raise gridfs.errors.NoFile()
+        return FakeGridOut(DATA)
+
+
+@pytest.fixture(scope="function")
+def client():
+    app = Flask(__name__)
+    api = Api(app)
+    api.add_resource(FileStreamView, "/files/<string:file_id>", resource_class_args=[FakeFileController()])
+    return app.test_client()
+
+
+def test_stream_whole_file(client):
+    response = client.get("/files/side_a")
+
+    assert response.status_code == 200
+    assert response.headers["Accept-Ranges"] == "bytes"
+    assert response.headers["Content-Length"] == str(len(DATA))
+    assert response.mimetype == "audio/mpeg"
+    assert response.data == DATA
+
+
+def test_stream_range(client):
+    response = client.get("/files/side_a", headers={"Range": "bytes=1500-2499"})
+
+    assert response.status_code == 206
+    assert response.headers["Content-Range"] == f"bytes 1500-2499/{len(DATA)}"
+    assert response.headers["Content-Length"] == "1000"
+    assert response.data == DATA[1500:2500]
+
+
+def test_stream_suffix_range(client):
+    response = client.get("/files/side_a", headers={"Range": "bytes=-100"})
+
+    assert response.status_code == 206
+    assert response.data == DATA[-100:]
+
+
+def test_unsatisfiable_range(client):
+    response = client.get("/files/side_a", headers={"Range": f"bytes={len(DATA) + 10}-"})
+
+    assert response.status_code == 416
+    assert response.headers["Content-Range"] == f"bytes */{len(DATA)}"
+
+
+def test_stale_if_range_sends_whole_file(client):
+    response = client.get("/files/side_a", headers={"Range": "bytes=0-9", "If-Range": '"other"'})
+
+    assert response.status_code == 200
+    assert response.data == DATA
+
+
+def test_missing_file(client):
+    assert client.get("/files/nope").status_code == 404
@@ -0,0 +1,69 @@
+import json
+
+import pytest
+
+from tapearchive.find_keys import KeyReport, TuneKey, tune_key_id
+
+
+def make_tune_key(file_name: str, checksum: str = None) -> TuneKey:
+    return TuneKey(
+        id=tune_key_id(checksum) if checksum else tune_key_id(file_name),
+        file_name=file_name,
+        chroma_map={"C": 1.0},
+        most_likely_key="C",
+        most_likely_key_confidence=0.9,
+        second_most_likely_key="a",
+        second_most_likely_key_confidence=0.5,
+        checksum=checksum,
+    )
+
+
+def read_lines(report: KeyReport) -> list:
+    with open(report.path) as f:
+        return [json.loads(line) for line in f]
+
+
+@pytest.fixture
+def report(tmp_path):
+    return KeyReport(tmp_path / "keys.jsonl")
+
+
+@pytest.mark.parametrize("key_first", [False, True])
+def test_line_per_input_file(report: KeyReport, key_first: bool):
+    # The key of a content is found once, under the path of whichever file was hashed first
+    tune_key = make_tune_key("a.wav", checksum="same")
+    if key_first:
+        report.add_key(tune_key)
+    report.add_file("a.wav", "same")
+    report.add_file("copy/a.wav", "same")
+    if not key_first:
+        report.add_key(tune_key)
+    report.add_file("b.wav", "other")
+    report.add_key(make_tune_key("known.wav", checksum="other"))
+
+    lines = read_lines(report)
+
+    assert sorted(line["file_name"] for line in lines) == ["a.wav", "b.wav", "copy/a.wav"]
+    assert {line["file_name"]: line["checksum"] for line in lines}["copy/a.wav"] == "same"
+
+
+def test_key_without_checksum_is_written_as_it_is(report: KeyReport):
+    report.add_key(make_tune_key("unreadable.wav"))
+
+    assert [line["file_name"] for line in read_lines(report)] == ["unreadable.wav"]
+
+
+def test_compact_keeps_an_entry_per_file(report: KeyReport, tmp_path):
+    report.add_file("a.wav", "same")
+    report.add_key(make_tune_key("a.wav", checksum="same"))
+    # A task posted again after a stale timeout reports the same file twice
+    report.add_key(make_tune_key("a.wav", checksum="same"))
+    report.add_file("b.wav", "same")
+
+    target_file = tmp_path / "keys.json"
+    report.compact(target_file)
+
+    with open(target_file) as f:
+        items = json.load(f)
+    assert len(read_lines(report)) == 3
+    assert sorted(item["file_name"] for item in items) == ["a.wav", "b.wav"]
@@ -0,0 +1,100 @@
+import uuid
+
+import numpy as np
+import pytest
+
+from tapearchive.analysis.fingerprint import HOP_LENGTH, PeakFinder, fingerprint, landmarks, vote
+from tapearchive.models.fingerprint import decode_postings, group_postings
+
+SAMPLE_RATE = 22050
+
+
+def melody(seed: int, seconds: float) -> np.ndarray:
+    """Chords of three random notes, four per second"""
+    rng = np.random.default_rng(seed)
+    t = np.arange(SAMPLE_RATE // 4) / SAMPLE_RATE
+    chords = []
+    for _ in range(int(seconds * 4)):
+        notes = 440 * 2 ** ((rng.integers(40, 80, 3) - 69) / 12)
+        chords.append(np.sin(2 * np.pi * notes[:, np.newaxis] * t).sum(axis=0) * np.exp(-3 * t))
+    return (0.1 * np.concatenate(chords)).astype(np.float32)
+
+
+def find_landmarks(samples: np.ndarray, block_size: int = 65536):
+    peak_finder = PeakFinder()
+    for start in range(0, len(samples), block_size):
+        peak_finder.push(samples[start : start + block_size])
+    return landmarks(peak_finder.finish())
+
+
+@pytest.fixture(scope="module")
+def archive():
+    """Landmarks of two recordings, as they are returned from the index"""
+    recordings = [find_landmarks(melody(seed, 60)) for seed in (0, 1)]
+    return (
+        np.concatenate([hashes for hashes, _ in recordings]),
+        np.concatenate([frames for _, frames in recordings]),
+        np.concatenate([np.full(len(hashes), index) for index, (hashes, _) in enumerate(recordings)]),
+    )
+
+
+def test_peaks_are_independent_of_blocks():
+    samples = melody(0, 10)
+    peaks = PeakFinder()
+    peaks.push(samples)
+
+    whole = peaks.finish()
+    for block_size in (1000, 8192):
+        peak_finder = PeakFinder()
+        for start in range(0, len(samples), block_size):
+            peak_finder.push(samples[start : start + block_size])
+        np.testing.assert_array_equal(peak_finder.finish(), whole)
+    assert len(whole) > 0 and np.all(np.diff(whole[:, 0]) >= 0)
+
+
+def test_excerpt_is_found_at_its_offset(archive):
+    start = int(23.3 * SAMPLE_RATE)
+    excerpt = melody(0, 60)[start : start + 15 * SAMPLE_RATE]
+    excerpt += np.random.default_rng(2).normal(0, 0.01, len(excerpt)).astype(np.float32)
+
+    (best,) = vote(*find_landmarks(excerpt), *archive)
+
+    assert best.candidate == 0
+    assert best.offset_frames == pytest.approx(23.3 * SAMPLE_RATE / HOP_LENGTH, abs=1)
+    assert best.query_start_frame < 2 * SAMPLE_RATE / HOP_LENGTH
+    assert best.query_end_frame > 13 * SAMPLE_RATE / HOP_LENGTH
+
+
+def test_unrelated_music_is_not_found(archive):
+    assert vote(*find_landmarks(melody(2, 15)), *archive) == []
+
+
+def test_silence_has_no_landmarks(tmp_path):
+    path = tmp_path / "pcm.npy"
+    np.save(path, np.zeros((SAMPLE_RATE * 5, 2), dtype=np.float32))
+
+    hashes, frames = fingerprint(str(path), SAMPLE_RATE)
+
+    assert len(hashes) == len(frames) == 0
+    assert vote(hashes, frames, hashes, frames, frames) == []
+
+
+def test_postings_decode_to_the_landmarks_of_the_archive(archive):
+    hashes, frames, candidates = archive
+    recording_ids = [uuid.uuid4(), uuid.uuid4()]
+
+    # Posting documents as the index holds them, a document per hash
+    documents = {}
+    for index, recording_id in enumerate(recording_ids):
+        is_recording = candidates == index
+        for h, posting_frames in group_postings(hashes[is_recording], frames[is_recording].astype("<u4")):
+            posting = {"r": recording_id.bytes, "t": posting_frames.tobytes()}
+            documents.setdefault(h, {"_id": h, "p": []})["p"].append(posting)
+
+    found_hashes, found_frames, found_candidates, found_ids = decode_postings(documents.values())
+    found = sorted(zip(found_hashes, found_frames, [recording_ids.index(found_ids[c]) for c in found_candidates]))
+    assert found == sorted(zip(hashes, frames, candidates))
+
+    _, _, found_candidates, found_ids = decode_postings(documents.values(), exclude=recording_ids[0])
+    assert found_ids == [recording_ids[1]]
+    assert len(found_candidates) == np.count_nonzero(candidates == 1)
@@ -0,0 +1,111 @@
+import gzip
+import uuid
+
+from flask import Flask, request
+from flask_restful import Api
+import pytest
+
+from tapearchive.api import http_cache
+from tapearchive.api.catalog import CatalogEntryView
+
+BODY = b'{"name": "A1"}' * 200
+ETAG = http_cache.make_etag("a1", 3)
+
+
+@pytest.fixture(scope="function")
+def client():
+    app = Flask(__name__)
+
+    @app.route("/entry")
+    def entry():
+        if http_cache.is_not_modified(request.if_none_match, ETAG):
+            return http_cache.not_modified_response(ETAG, None)
+        encoding = http_cache.choose_encoding(request)
+        return http_cache.encoded_response(http_cache.compress(BODY, encoding), ETAG, encoding)
+
+    @app.route("/plain")
+    def plain():
+        return app.response_class(BODY, mimetype="application/json")
+
+    app.after_request(lambda response: http_cache.compress_response(request, response))
+
+    return app.test_client()
+
+
+def test_conditional_get(client):
+    response = client.get("/entry")
+    assert response.status_code == 200
+    assert response.headers["ETag"] == f'"{ETAG}"'
+
+    response = client.get("/entry", headers={"If-None-Match": response.headers["ETag"]})
+    assert response.status_code == 304
+    assert not response.data
+
+
+def test_conditional_get_matches_encoded_representation(client):
+    response = client.get("/entry", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert response.headers["ETag"] == f'"{ETAG}-gzip"'
+
+    response = client.get("/entry", headers={"If-None-Match": response.headers["ETag"]})
+    assert response.status_code == 304
+
+
+def test_compress_buffered_response(client):
+    response = client.get("/plain", headers={"Accept-Encoding": "gzip"})
+
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert "Accept-Encoding" in response.headers["Vary"]
+    assert gzip.decompress(response.data) == BODY
+
+
+def test_no_compression_without_accept_encoding(client):
+    response = client.get("/plain")
+
+    assert "Content-Encoding" not in response.headers
+    assert response.data == BODY
+
+
+ENTRY_ID = uuid.UUID(int=1)
+
+
+class EntryController:
+    """Serves the entry ENTRY_ID, other ids are missing and have version 0"""
+
+    def __init__(self, body: bytes):
+        self.body = body
+
+    def get_catalog_version(self, id):
+        return 3 if id == ENTRY_ID else 0
+
+    def get_encoded_catalog_entry(self, id, version, encoding):
+        return http_cache.compress(self.body, encoding) if id == ENTRY_ID else None
+
+
+def entry_view_client(body: bytes):
+    app = Flask(__name__)
+    Api(app).add_resource(
+        CatalogEntryView, "/catalog/<string:catalog_name>", resource_class_args=(EntryController(body),)
+    )
+    return app.test_client()
+
+
+def test_small_entry_is_revalidated_with_its_plain_etag():
+    client = entry_view_client(b'{"name": "A1"}')
+
+    response = client.get(f"/catalog/{ENTRY_ID}", headers={"Accept-Encoding": "gzip"})
+    assert "Content-Encoding" not in response.headers
+    etag = response.headers["ETag"]
+
+    response = client.get(f"/catalog/{ENTRY_ID}", headers={"Accept-Encoding": "gzip", "If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.headers["ETag"] == etag
+
+
+def test_missing_entry_is_not_revalidated():
+    client = entry_view_client(BODY)
+    missing_id = uuid.UUID(int=2)
+    etag = http_cache.make_etag(missing_id, 0)
+
+    response = client.get(f"/catalog/{missing_id}", headers={"If-None-Match": f'"{etag}"'})
+    assert response.status_code == 404
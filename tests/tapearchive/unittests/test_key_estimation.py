@@ -0,0 +1,68 @@
+import numpy as np
+import pytest
+
+from tapearchive.analysis.key_estimation import (
+    KEYS,
+    MAJOR_PROFILE,
+    MINOR_PROFILE,
+    PITCHES,
+    chroma_map,
+    correlate_keys,
+    estimate_keys,
+    rank_keys,
+)
+
+
+def reference_correlations(chroma) -> np.ndarray:
+    major = [np.corrcoef(MAJOR_PROFILE, [chroma[(i + m) % 12] for m in range(12)])[1, 0] for i in range(12)]
+    minor = [np.corrcoef(MINOR_PROFILE, [chroma[(i + m) % 12] for m in range(12)])[1, 0] for i in range(12)]
+    return np.array(major + minor)
+
+
+def test_correlations_match_reference():
+    chroma = np.random.default_rng(0).uniform(0, 10, (50, 12))
+
+    correlations = correlate_keys(chroma)
+
+    assert correlations.shape == (50, 24)
+    for vector, row in zip(chroma, correlations):
+        np.testing.assert_allclose(row, reference_correlations(vector), atol=1e-12)
+
+
+@pytest.mark.parametrize("tonic", range(12))
+def test_profiles_are_recognized(tonic):
+    chroma = np.stack((np.roll(MAJOR_PROFILE, tonic), np.roll(MINOR_PROFILE, tonic)))
+
+    major, minor = estimate_keys(chroma)
+
+    assert major.key == f"{PITCHES[tonic]} major"
+    assert minor.key == f"{PITCHES[tonic]} minor"
+    assert major.confidence == pytest.approx(1.0)
+
+
+def test_ranking_is_ordered():
+    chroma = np.random.default_rng(1).uniform(0, 10, (100, 12))
+
+    indices, correlations = rank_keys(chroma)
+
+    full = correlate_keys(chroma)
+    np.testing.assert_array_equal(indices[:, 0], full.argmax(axis=1))
+    assert np.all(correlations[:, 0] >= correlations[:, 1])
+
+
+def test_second_key_is_reported_only_when_close():
+    (estimate,) = estimate_keys(np.array(MAJOR_PROFILE), second_key_ratio=0.0)
+    assert estimate.second_key is not None and estimate.second_key != estimate.key
+
+    (estimate,) = estimate_keys(np.array(MAJOR_PROFILE), second_key_ratio=1.0)
+    assert estimate.second_key is None and estimate.second_confidence is None
+
+
+def test_silence_has_no_correlation():
+    assert np.all(correlate_keys(np.zeros(12)) == 0)
+    assert chroma_map(np.zeros(12)) == dict((pitch, 0.0) for pitch in PITCHES)
+
+
+def test_key_names():
+    assert len(KEYS) == 24
+    assert KEYS[0] == "C major" and KEYS[12] == "C minor"
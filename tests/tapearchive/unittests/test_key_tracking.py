@@ -0,0 +1,96 @@
+import numpy as np
+import pytest
+
+from tapearchive.analysis.key_estimation import MAJOR_PROFILE, MINOR_PROFILE, estimate_keys
+from tapearchive.analysis.key_tracking import FRAME_LENGTH, HOP_LENGTH, KeyTracker, stream_harmonic_chroma
+
+
+def chroma_frames(profile, count: int) -> np.ndarray:
+    return np.tile(np.array(profile)[:, np.newaxis], (1, count))
+
+
+@pytest.mark.parametrize("block_size", [1, 7, 100])
+def test_windows_are_independent_of_blocks(block_size):
+    chroma = np.random.default_rng(0).uniform(0, 1, (12, 100))
+    tracker = KeyTracker(frames_per_second=1, window_seconds=10, hop_seconds=5)
+
+    windows = []
+    for start in range(0, 100, block_size):
+        windows.extend(tracker.push(chroma[:, start : start + block_size]))
+    windows.extend(tracker.finish())
+
+    assert [(w.start_seconds, w.end_seconds) for w in windows] == [(s, s + 10) for s in range(0, 91, 5)]
+    expected = estimate_keys(np.stack([chroma[:, s : s + 10].sum(axis=1) for s in range(0, 91, 5)]))
+    assert [w.estimate.key for w in windows] == [e.key for e in expected]
+    assert [w.estimate.confidence for w in windows] == pytest.approx([e.confidence for e in expected])
+    np.testing.assert_allclose(tracker.total_chroma, chroma.sum(axis=1))
+
+
+def test_uncovered_tail_gets_a_shorter_window():
+    tracker = KeyTracker(frames_per_second=1, window_seconds=10, hop_seconds=5)
+
+    windows = tracker.push(chroma_frames(MAJOR_PROFILE, 23)) + tracker.finish()
+
+    assert [(w.start_seconds, w.end_seconds) for w in windows] == [(0, 10), (5, 15), (10, 20), (15, 23)]
+
+
+def test_short_stream_has_one_window():
+    tracker = KeyTracker(frames_per_second=1, window_seconds=10, hop_seconds=5)
+
+    windows = tracker.push(chroma_frames(MAJOR_PROFILE, 3)) + tracker.finish()
+
+    assert [(w.start_seconds, w.end_seconds) for w in windows] == [(0, 3)]
+
+
+def test_key_change_is_tracked():
+    tracker = KeyTracker(frames_per_second=1, window_seconds=10, hop_seconds=10)
+    chroma = np.concatenate((chroma_frames(MAJOR_PROFILE, 30), chroma_frames(np.roll(MINOR_PROFILE, 9), 30)), axis=1)
+
+    windows = tracker.push(chroma) + tracker.finish()
+
+    assert [w.estimate.key for w in windows] == ["C major"] * 3 + ["A minor"] * 3
+
+
+def test_buffer_is_bounded():
+    tracker = KeyTracker(frames_per_second=1, window_seconds=10, hop_seconds=5)
+
+    for _ in range(1000):
+        tracker.push(chroma_frames(MAJOR_PROFILE, 3))
+
+    assert len(tracker._frames) <= 10 + 3
+
+
+def test_total_chroma_only():
+    tracker = KeyTracker(frames_per_second=1, window_seconds=None)
+
+    assert tracker.push(chroma_frames(MAJOR_PROFILE, 30)) == []
+    assert tracker.finish() == []
+    np.testing.assert_allclose(tracker.total_chroma, np.array(MAJOR_PROFILE) * 30)
+
+
+def test_stream_of_chords():
+    sample_rate = 22050
+    t = np.arange(sample_rate * 12) / sample_rate
+    # C major chord, then A minor chord
+    c_major = sum(np.sin(2 * np.pi * f * t) for f in (261.63, 329.63, 392.0, 523.25))
+    a_minor = sum(np.sin(2 * np.pi * f * t) for f in (220.0, 261.63, 329.63, 440.0))
+    samples = (0.2 * np.concatenate((c_major, a_minor))).astype(np.float32)
+
+    tracker = KeyTracker(sample_rate / HOP_LENGTH, window_seconds=6, hop_seconds=6)
+    windows = []
+    for chroma in stream_harmonic_chroma(np.stack((samples, samples), axis=1), sample_rate):
+        windows.extend(tracker.push(chroma))
+    windows.extend(tracker.finish())
+
+    keys = [w.estimate.key for w in windows]
+    assert keys[:2] == ["C major", "C major"]
+    assert keys[-2:] == ["A minor", "A minor"]
+
+
+@pytest.mark.parametrize("block_length", [8, 256])
+def test_every_frame_has_chroma(block_length):
+    samples = np.random.default_rng(3).uniform(-1, 1, 22050 * 5).astype(np.float32)
+
+    chroma = np.concatenate(list(stream_harmonic_chroma(samples, 22050, block_length=block_length)), axis=1)
+
+    assert chroma.shape == (12, (len(samples) - FRAME_LENGTH) // HOP_LENGTH + 1)
@@ -0,0 +1,88 @@
+from dataclasses import dataclass
+
+import fakeredis
+import pytest
+import redis
+
+from tapearchive import metrics
+
+
+@dataclass
+class DummyTask:
+    value: int
+
+
+@dataclass
+class UntrackedTask:
+    value: int
+
+
+class DummyDispatcher:
+    def __init__(self):
+        self.posted = []
+
+    def post_task(self, task):
+        self.posted.append(task)
+        return len(self.posted)
+
+
+class DummyHandler:
+    @metrics.timed_task(DummyTask)
+    def handle(self, task: DummyTask, *args, **kwargs):
+        if task.value < 0:
+            raise ValueError(task.value)
+        return task.value
+
+
+@pytest.fixture
+def queue_metrics(monkeypatch):
+    connection_pool = fakeredis.FakeRedis().connection_pool
+    queue_metrics = metrics.TaskQueueMetrics(connection_pool)
+    monkeypatch.setattr(metrics, "_task_queue_metrics", queue_metrics)
+    return queue_metrics
+
+
+def queue_depth(queue_metrics):
+    return {sample.labels["task_type"]: sample.value for family in queue_metrics.collect() for sample in family.samples}
+
+
+def sample_value(name, **labels):
+    return metrics.REGISTRY.get_sample_value(name, labels) or 0
+
+
+def test_queue_depth_follows_posted_and_started_tasks(queue_metrics):
+    dispatcher = metrics.instrument_dispatcher(DummyDispatcher(), queue_metrics)
+    handler = DummyHandler()
+    wait_count = sample_value("tapearchive_task_queue_wait_seconds_count", task_type="DummyTask")
+
+    assert dispatcher.post_task(DummyTask(1)) == 1
+    dispatcher.post_task(DummyTask(2))
+    dispatcher.post_task(UntrackedTask(3))
+
+    assert len(dispatcher.posted) == 3
+    assert queue_depth(queue_metrics) == {"DummyTask": 2}
+
+    assert handler.handle(dispatcher.posted[0]) == 1
+    assert queue_depth(queue_metrics) == {"DummyTask": 1}
+    assert sample_value("tapearchive_task_queue_wait_seconds_count", task_type="DummyTask") == wait_count + 1
+
+
+def test_timed_task_counts_failures(queue_metrics):
+    handler = DummyHandler()
+    executions = sample_value("tapearchive_task_execution_seconds_count", task_type="DummyTask")
+    failures = sample_value("tapearchive_task_failures_total", task_type="DummyTask")
+
+    with pytest.raises(ValueError):
+        handler.handle(DummyTask(-1))
+    handler.handle(DummyTask(1))
+
+    assert sample_value("tapearchive_task_execution_seconds_count", task_type="DummyTask") == executions + 2
+    assert sample_value("tapearchive_task_failures_total", task_type="DummyTask") == failures + 1
+
+
+def test_queue_metrics_survive_redis_errors():
+    queue_metrics = metrics.TaskQueueMetrics(redis.ConnectionPool(host="localhost", port=1))
+
+    queue_metrics.task_posted("DummyTask")
+    assert queue_metrics.task_started("DummyTask") is None
+    assert list(queue_metrics.collect()) == []
@@ -0,0 +1,102 @@
+import io
+import os
+
+import numpy as np
+import pytest
+import soundfile
+
+from tapearchive.analysis.pcm_cache import PcmCache, iterate_blocks, to_mono
+
+
+def wav(samples: np.ndarray, sample_rate: int) -> io.BytesIO:
+    data = io.BytesIO()
+    soundfile.write(data, samples, sample_rate, format="WAV", subtype="FLOAT")
+    data.seek(0)
+    return data
+
+
+@pytest.fixture
+def stereo() -> np.ndarray:
+    rng = np.random.default_rng(0)
+    return rng.uniform(-0.5, 0.5, (100000, 2)).astype(np.float32)
+
+
+def test_decoded_audio_is_mapped_read_only(tmp_path, stereo):
+    cache = PcmCache(tmp_path, max_bytes=10**9, sample_rate=22050)
+
+    assert cache.get("file") is None
+    stored = cache.put("file", wav(stereo, 22050))
+    pcm = cache.get("file")
+
+    assert isinstance(pcm, np.memmap) and not pcm.flags.writeable
+    assert pcm.dtype == np.float32 and pcm.shape == stereo.shape
+    np.testing.assert_array_equal(pcm, stereo)
+    np.testing.assert_array_equal(stored, stereo)
+    assert [path.name for path in tmp_path.iterdir()] == ["file-22050.npy"]
+
+
+def test_audio_is_resampled_without_seams(tmp_path):
+    t = np.arange(88200) / 44100
+    sine = (0.5 * np.sin(2 * np.pi * 440 * t)).astype(np.float32)
+    cache = PcmCache(tmp_path, max_bytes=10**9, sample_rate=22050)
+
+    pcm = cache.put("file", wav(sine, 44100))
+
+    assert pcm.shape == (44100, 1)
+    expected = 0.5 * np.sin(2 * np.pi * 440 * np.arange(44100) / 22050)
+    # Block boundaries of the decoder fall at every 65536 source frames, away from the edges of the stream
+    np.testing.assert_allclose(pcm[1000:-1000, 0], expected[1000:-1000], atol=1e-3)
+
+
+def test_least_recently_used_files_are_evicted(tmp_path, stereo):
+    file_size = stereo.nbytes + 128
+    cache = PcmCache(tmp_path, max_bytes=2 * file_size)
+
+    for index, file_id in enumerate(["a", "b"]):
+        cache.put(file_id, wav(stereo, 22050))
+        os.utime(cache.path(file_id), (index, index))
+    cache.get("a")  # now the most recent
+    cache.put("c", wav(stereo, 22050))
+
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["a-22050.npy", "c-22050.npy"]
+
+
+def test_failed_decode_leaves_nothing_behind(tmp_path):
+    cache = PcmCache(tmp_path, max_bytes=10**9)
+
+    with pytest.raises(RuntimeError):
+        cache.put("file", io.BytesIO(b"not audio at all"))
+
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_blocks_are_views(stereo):
+    blocks = list(iterate_blocks(stereo, 30000))
+
+    assert [len(block) for block in blocks] == [30000, 30000, 30000, 10000]
+    assert all(np.shares_memory(block, stereo) for block in blocks)
+    np.testing.assert_allclose(to_mono(stereo), stereo.mean(axis=1), atol=1e-7)
+
+
+def test_pinned_files_are_not_evicted(tmp_path, stereo):
+    file_size = stereo.nbytes + 128
+    cache = PcmCache(tmp_path, max_bytes=file_size)
+
+    with cache.pinned("a") as path:
+        cache.put("a", wav(stereo, 22050))
+        cache.put("b", wav(stereo, 22050))
+        assert path.exists()
+    cache.put("c", wav(stereo, 22050))
+
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["c-22050.npy"]
+
+
+def test_pins_of_exited_processes_are_ignored(tmp_path, stereo):
+    cache = PcmCache(tmp_path, max_bytes=stereo.nbytes + 128)
+    cache.put("a", wav(stereo, 22050))
+    # Process ids are at most 2**22 on Linux
+    (tmp_path / "a-22050.npy.99999999.0.pin").touch()
+
+    cache.put("b", wav(stereo, 22050))
+
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["b-22050.npy"]
@@ -0,0 +1,128 @@
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+import threading
+
+import fakeredis
+import pytest
+import redis
+
+from tapearchive.utils.producer import TaskProducer
+
+LEDGER_KEY = "pending_tasks.test"
+
+
+@dataclass
+class DummyTask:
+    value: int
+
+
+class WorkerDispatcher:
+    """Finishes the posted tasks on worker threads, possibly before post_task() returns"""
+
+    def __init__(self, workers: int = 8):
+        self.producer = None
+        self.max_in_flight = 0
+        self._next_id = 0
+        self._workers = ThreadPoolExecutor(workers)
+
+    def post_task(self, task):
+        self._next_id += 1
+        self.max_in_flight = max(self.max_in_flight, self.producer.in_flight + 1)
+        self._workers.submit(self.producer.finish, self._next_id)
+        return self._next_id
+
+
+@pytest.fixture
+def connection_pool() -> redis.ConnectionPool:
+    return fakeredis.FakeRedis().connection_pool
+
+
+def test_in_flight_tasks_are_bounded(connection_pool):
+    dispatcher = WorkerDispatcher()
+    producer = TaskProducer(dispatcher, connection_pool, LEDGER_KEY, max_in_flight=4, batch_size=3)
+    dispatcher.producer = producer
+
+    for value in range(200):
+        producer.post(DummyTask(value), {"value": value})
+    producer.wait()
+
+    assert dispatcher.max_in_flight <= 4
+    assert producer.in_flight == 0
+    assert redis.Redis(connection_pool=connection_pool).hlen(LEDGER_KEY) == 0
+
+
+def test_unfinished_tasks_are_left_in_the_ledger(connection_pool):
+    class QueueDispatcher:
+        def __init__(self):
+            self.posted = []
+
+        def post_task(self, task):
+            self.posted.append(task)
+            return len(self.posted)
+
+    producer = TaskProducer(QueueDispatcher(), connection_pool, LEDGER_KEY, batch_size=2)
+    for value in range(5):
+        producer.post(DummyTask(value), {"value": value})
+    assert producer.finish(1) == {"value": 0}
+    assert producer.finish(1) is None
+
+    next_run = TaskProducer(QueueDispatcher(), connection_pool, LEDGER_KEY)
+    assert sorted(record["value"] for record in next_run.adopt_stale()) == [1, 2, 3, 4]
+
+
+def test_stale_tasks_are_adopted(connection_pool):
+    class QueueDispatcher:
+        def post_task(self, task):
+            return task.value
+
+    interrupted = TaskProducer(QueueDispatcher(), connection_pool, LEDGER_KEY, batch_size=1)
+    for value in range(1, 5):
+        interrupted.post(DummyTask(value), {"value": value})
+
+    producer = TaskProducer(QueueDispatcher(), connection_pool, LEDGER_KEY, max_in_flight=1)
+    adopted = producer.adopt_stale(is_finished=lambda record: record["value"] == 4)
+    assert sorted(record["value"] for record in adopted) == [1, 2, 3]
+
+    # Results of the interrupted run are finished, they do not take places of the window
+    assert producer.finish(1) == {"value": 1}
+    producer.post(DummyTask(10), {"value": 10})
+    assert producer.finish(2) == {"value": 2}
+    assert producer.finish(10) == {"value": 10}
+
+    # The result of 3 never arrives
+    assert producer.wait(stale_timeout=0.1) == [{"value": 3}]
+    assert producer.in_flight == 0
+    assert not redis.Redis(connection_pool=connection_pool).exists(LEDGER_KEY)
+
+
+def test_records_finished_before_sending_are_not_written(connection_pool):
+    class QueueDispatcher:
+        def post_task(self, task):
+            return task.value
+
+    producer = TaskProducer(QueueDispatcher(), connection_pool, LEDGER_KEY, batch_size=10)
+    for value in range(5):
+        producer.post(DummyTask(value), {"value": value})
+        producer.finish(value)
+    producer.wait()
+
+    assert not redis.Redis(connection_pool=connection_pool).exists(LEDGER_KEY)
+
+
+def test_post_waits_for_a_free_place(connection_pool):
+    class QueueDispatcher:
+        def post_task(self, task):
+            return task.value
+
+    producer = TaskProducer(QueueDispatcher(), connection_pool, LEDGER_KEY, max_in_flight=2)
+    producer.post(DummyTask(1), None)
+    producer.post(DummyTask(2), None)
+
+    third = threading.Thread(target=producer.post, args=(DummyTask(3), None))
+    third.start()
+    third.join(timeout=0.2)
+    assert third.is_alive()
+
+    producer.finish(1)
+    third.join(timeout=5)
+    assert not third.is_alive() and producer.in_flight == 2
@@ -0,0 +1,13 @@
+import hashlib
+import os
+
+from tapearchive.models.raw_data import file_checksum
+
+
+def test_checksum_is_sha256_of_the_content(tmp_path):
+    data = os.urandom(3 * 1024 * 1024 + 17)
+    path = tmp_path / "song.flac"
+    path.write_bytes(data)
+
+    assert file_checksum(path) == hashlib.sha256(data).hexdigest()
+    assert file_checksum(path, block_size=1000) == file_checksum(path)
@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+
+from tapearchive.analysis.key_tracking import HOP_LENGTH
+from tapearchive.analysis.rhythm import OnsetTracker, analyze_key_and_rhythm, track_beats
+
+SAMPLE_RATE = 22050
+
+
+def clicks(bpm: float, seconds: float) -> np.ndarray:
+    samples = np.zeros(int(SAMPLE_RATE * seconds), dtype=np.float32)
+    burst = np.random.default_rng(0).uniform(-1, 1, 200) * np.linspace(1, 0, 200)
+    for beat in np.arange(0, seconds, 60 / bpm):
+        start = int(beat * SAMPLE_RATE)
+        samples[start : start + 200] += burst[: len(samples) - start]
+    return samples
+
+
+def test_onsets_are_independent_of_blocks():
+    rng = np.random.default_rng(1)
+    spectrogram = rng.uniform(0, 1, (1025, 300))
+
+    whole = OnsetTracker(SAMPLE_RATE)
+    whole.push(spectrogram)
+    blocks = OnsetTracker(SAMPLE_RATE)
+    for start in range(0, 300, 70):
+        blocks.push(spectrogram[:, start : start + 70])
+
+    assert whole.envelope.shape == (300,) and whole.envelope[0] == 0
+    np.testing.assert_allclose(blocks.envelope, whole.envelope, rtol=1e-5)
+
+
+def test_silence_has_no_tempo():
+    bpm, beats = track_beats(np.zeros(1000, dtype=np.float32), SAMPLE_RATE)
+
+    assert bpm == 0 and len(beats) == 0
+
+
+def test_key_and_beats_in_one_pass(tmp_path):
+    t = np.arange(SAMPLE_RATE * 30) / SAMPLE_RATE
+    a_minor = sum(np.sin(2 * np.pi * f * t) for f in (220.0, 261.63, 329.63, 440.0))
+    path = tmp_path / "pcm.npy"
+    np.save(path, (0.1 * a_minor + clicks(120, 30)).astype(np.float32)[:, np.newaxis])
+
+    total_chroma, windows, bpm, beats, envelope = analyze_key_and_rhythm(str(path), SAMPLE_RATE, 10, 5)
+
+    assert [window.estimate.key for window in windows] == ["A minor"] * len(windows)
+    assert total_chroma.shape == (12,)
+    assert bpm == pytest.approx(120, rel=0.05)
+    assert np.median(np.diff(beats)) == pytest.approx(0.5, abs=0.02)
+    # Beats fall on the clicks
+    assert np.all(np.abs(beats - np.round(beats * 2) / 2) < 0.05)
+    assert len(envelope) == (len(t) - 2048) // HOP_LENGTH + 1
@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+
+from tapearchive.analysis.silence import FRAME_LENGTH, SilenceDetector, cut_points, find_tracks
+
+SAMPLE_RATE = 22050
+SECONDS_PER_FRAME = FRAME_LENGTH / SAMPLE_RATE
+
+
+def tape_side(sections) -> np.ndarray:
+    """Tone for (seconds, True), hiss at -60 dBFS for (seconds, False)"""
+    rng = np.random.default_rng(0)
+    parts = []
+    for seconds, is_sound in sections:
+        t = np.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+        part = rng.normal(0, 0.001, len(t))
+        if is_sound:
+            part += 0.3 * np.sin(2 * np.pi * 440 * t)
+        parts.append(part)
+    return np.concatenate(parts).astype(np.float32)
+
+
+def detect(samples: np.ndarray, block_size: int):
+    detector = SilenceDetector(SAMPLE_RATE)
+    tracks = []
+    for start in range(0, len(samples), block_size):
+        tracks.extend(detector.push(samples[start : start + block_size, np.newaxis]))
+    return tracks + detector.finish()
+
+
+SIDE = [(2, False), (20, True), (3, False), (15, True), (0.5, False), (10, True), (4, False), (30, True), (1, False)]
+
+
+@pytest.mark.parametrize("block_size", [1000, 65536, 10**7])
+def test_tracks_are_separated_by_long_gaps(block_size):
+    tracks = detect(tape_side(SIDE), block_size)
+
+    expected = [(2, 22), (25, 50.5), (54.5, 84.5)]
+    assert len(tracks) == len(expected)
+    for (start, end), (expected_start, expected_end) in zip(tracks, expected):
+        assert start == pytest.approx(expected_start, abs=SECONDS_PER_FRAME)
+        assert end == pytest.approx(expected_end, abs=SECONDS_PER_FRAME)
+
+
+def test_hysteresis_keeps_fading_sound_together():
+    # Level between the two thresholds, the track does not end until the level drops under the silence threshold
+    samples = tape_side([(10, True), (5, False), (10, True)])
+    samples[10 * SAMPLE_RATE : 15 * SAMPLE_RATE] += np.float32(10 ** (-45 / 20) * np.sqrt(2)) * np.sin(
+        2 * np.pi * 440 * np.arange(5 * SAMPLE_RATE, dtype=np.float32) / SAMPLE_RATE
+    )
+    samples[12 * SAMPLE_RATE : 13 * SAMPLE_RATE] *= 0.01
+
+    tracks = detect(samples, 65536)
+
+    assert len(tracks) == 2
+    assert tracks[0][1] == pytest.approx(12, abs=SECONDS_PER_FRAME)
+
+
+def test_silence_has_no_tracks():
+    assert detect(tape_side([(10, False)]), 65536) == []
+
+
+def test_cut_points_are_in_the_gaps(tmp_path):
+    path = tmp_path / "pcm.npy"
+    np.save(path, np.repeat(tape_side(SIDE)[:, np.newaxis], 2, axis=1))
+
+    tracks = find_tracks(str(path), SAMPLE_RATE)
+
+    assert cut_points(tracks) == pytest.approx([23.5, 52.5], abs=SECONDS_PER_FRAME)
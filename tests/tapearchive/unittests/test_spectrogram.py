@@ -0,0 +1,112 @@
+from typing import List, Tuple
+
+import numpy as np
+import pytest
+
+from tapearchive.analysis.spectrogram import (
+    SpectrogramBuilder,
+    SpectrogramGeometry,
+    dequantize_db,
+    log_frequency_matrix,
+    pool_frames,
+    quantize_db,
+)
+
+SAMPLE_RATE = 22050
+
+
+def sine(frequency: float, seconds: float, amplitude: float = 0.5) -> np.ndarray:
+    t = np.arange(int(SAMPLE_RATE * seconds)) / SAMPLE_RATE
+    return (amplitude * np.sin(2 * np.pi * frequency * t)).astype(np.float32)
+
+
+def build(samples: np.ndarray, block_size: int, **kwargs) -> Tuple[SpectrogramGeometry, List[bytes]]:
+    builder = SpectrogramBuilder(SpectrogramGeometry(SAMPLE_RATE, **kwargs))
+    tiles = []
+    for start in range(0, len(samples), block_size):
+        tiles.extend(builder.push(samples[start : start + block_size]))
+    tiles.extend(builder.finish())
+    return builder.geometry, tiles
+
+
+@pytest.mark.parametrize("block_size", [1000, 4096, 65536])
+def test_tiles_are_independent_of_blocks(block_size):
+    samples = np.random.default_rng(0).uniform(-1, 1, SAMPLE_RATE * 3).astype(np.float32)
+
+    reference_geometry, reference_tiles = build(samples, len(samples), tile_width=16)
+    geometry, tiles = build(samples, block_size, tile_width=16)
+
+    assert geometry.frame_count == reference_geometry.frame_count == (len(samples) - 2048) // 2048 + 1
+    assert len(tiles) == geometry.tile_count
+    assert all(len(tile) == geometry.tile_size for tile in tiles)
+    assert tiles == reference_tiles
+
+
+def test_sine_is_found_at_its_frequency_and_level():
+    geometry, tiles = build(sine(1000, 2), 4096)
+
+    rows = np.frombuffer(b"".join(tiles), dtype=np.uint8).reshape(-1, geometry.bin_count)
+    row = rows[10]
+    peak = row.argmax()
+
+    assert geometry.bin_frequencies()[peak] == pytest.approx(1000, rel=0.03)
+    assert dequantize_db(row[peak], geometry.min_db) == pytest.approx(-6, abs=1.5)
+    # Padding after the last frame is silence
+    assert np.all(rows[geometry.frame_count :] == 0)
+
+
+def test_every_row_has_weights():
+    weights = log_frequency_matrix(SpectrogramGeometry(SAMPLE_RATE, bin_count=512))
+
+    assert weights.shape == (512, 1025)
+    assert np.all(weights.sum(axis=1) > 0)
+
+
+def test_quantization_covers_the_range():
+    db = np.array([-120.0, -90.0, -45.0, 0.0, 3.0])
+
+    data = quantize_db(db, -90.0)
+
+    assert data.tolist() == [0, 0, 128, 255, 255]
+    np.testing.assert_allclose(dequantize_db(data, -90.0), [-90, -90, -44.8, 0, 0], atol=0.2)
+
+
+def test_geometry_survives_attachment_meta():
+    geometry = SpectrogramGeometry(44100, bin_count=128, min_db=-80.0, frame_count=1234)
+
+    meta = geometry.to_meta()
+
+    assert all(isinstance(value, str) for value in meta.values())
+    assert SpectrogramGeometry.from_meta(meta) == geometry
+    assert geometry.tile_count == 5
+
+
+@pytest.mark.parametrize("tile_count, deepest_level", [(1, 0), (2, 1), (3, 2), (4, 2), (5, 3), (227, 8)])
+def test_pyramid_depth(tile_count, deepest_level):
+    geometry = SpectrogramGeometry(SAMPLE_RATE, tile_width=4, frame_count=tile_count * 4 - 1)
+
+    assert geometry.deepest_level == deepest_level
+    assert geometry.frames_per_tile(0) >= geometry.frame_count
+    assert geometry.frames_per_tile(deepest_level) == geometry.tile_width
+
+
+def test_tiles_past_the_end_are_not_served():
+    geometry = SpectrogramGeometry(SAMPLE_RATE, tile_width=4, frame_count=20)  # 5 tiles, 3 levels below the top
+
+    assert geometry.has_tile(0, 0)
+    assert [x for x in range(8) if geometry.has_tile(3, x)] == [0, 1, 2, 3, 4]
+    assert [x for x in range(4) if geometry.has_tile(2, x)] == [0, 1, 2]
+    assert not geometry.has_tile(4, 0)
+    assert not geometry.has_tile(1, 2)
+
+
+def test_upper_levels_average_the_frames():
+    geometry = SpectrogramGeometry(SAMPLE_RATE, tile_width=4, bin_count=3, frame_count=14)  # 4 tiles
+    frames = np.random.default_rng(2).integers(0, 256, (16, 3), dtype=np.uint8)
+    frames[14:] = 0
+
+    deepest = pool_frames(frames[4:8].tobytes(), geometry, 2)
+    top = np.frombuffer(pool_frames(frames[: geometry.frame_count].tobytes(), geometry, 0), dtype=np.uint8)
+
+    assert deepest == frames[4:8].tobytes()
+    assert top.tolist() == np.round(frames.reshape(4, 4, 3).mean(axis=1)).astype(np.uint8).reshape(-1).tolist()
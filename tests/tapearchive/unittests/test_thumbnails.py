@@ -0,0 +1,53 @@
+import io
+import pathlib
+import uuid
+
+import pytest
+
+Image = pytest.importorskip("PIL.Image")
+
+from tapearchive.utils.images import render_thumbnails  # noqa: E402
+
+
+def make_image(width: int, height: int, format: str = "JPEG") -> io.BytesIO:
+    data = io.BytesIO()
+    Image.new("RGB", (width, height), color=(200, 120, 40)).save(data, format=format)
+    data.seek(0)
+    return data
+
+
+def test_thumbnails_fit_into_boxes():
+    thumbnails = render_thumbnails(make_image(2400, 1600), [128, 512, 256])
+
+    assert sorted(thumbnails) == [128, 256, 512]
+    for size, data in thumbnails.items():
+        with Image.open(io.BytesIO(data)) as thumbnail:
+            assert thumbnail.format == "JPEG"
+            assert thumbnail.width == size
+            assert abs(thumbnail.height - size * 2 / 3) <= 1
+
+
+def test_small_images_are_not_upscaled():
+    thumbnails = render_thumbnails(make_image(100, 50, format="PNG"), [256])
+
+    with Image.open(io.BytesIO(thumbnails[256])) as thumbnail:
+        assert thumbnail.size == (100, 50)
+
+
+def test_not_an_image():
+    with pytest.raises(OSError):
+        render_thumbnails(io.BytesIO(b"not an image"), [128])
+
+
+def test_source_id_follows_a_replaced_archive_file(tmp_path):
+    from tapearchive.models.catalog import Attachment, AttachmentType
+    from tapearchive.models.thumbnails import thumbnail_source_id
+
+    attachment = Attachment(id=uuid.uuid4(), name="cover.jpg", type=AttachmentType.COVER, path=pathlib.Path("CAT1/cover.jpg"), meta={})
+    (tmp_path / "CAT1").mkdir()
+    (tmp_path / "CAT1" / "cover.jpg").write_bytes(make_image(64, 64).getvalue())
+    source_id = thumbnail_source_id(attachment, tmp_path)
+
+    (tmp_path / "CAT1" / "cover.jpg").write_bytes(make_image(128, 64).getvalue())
+
+    assert thumbnail_source_id(attachment, tmp_path) != source_id
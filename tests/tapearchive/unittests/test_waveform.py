@@ -0,0 +1,90 @@
+import io
+
+import numpy as np
+import pytest
+import soundfile
+
+from tapearchive.analysis.waveform import PeakBuilder, dequantize, peak_byte_range, pixel_range
+
+
+def reference_peaks(samples: np.ndarray, samples_per_pixel: int) -> np.ndarray:
+    peaks = []
+    for start in range(0, len(samples), samples_per_pixel):
+        pixel = samples[start : start + samples_per_pixel].astype(np.float64)
+        peaks.append((pixel.min(), pixel.max(), np.sqrt(np.mean(pixel**2))))
+    return np.array(peaks)
+
+
+@pytest.fixture
+def samples() -> np.ndarray:
+    rng = np.random.default_rng(1)
+    return (rng.uniform(-1, 1, 100000) * np.linspace(0, 1, 100000)).astype(np.float32)
+
+
+@pytest.mark.parametrize("block_size", [100000, 4096, 1000, 333])
+def test_peaks_match_reference(samples, block_size):
+    builder = PeakBuilder([256, 2048, 16384])
+    for start in range(0, len(samples), block_size):
+        builder.push(samples[start : start + block_size])
+
+    levels = builder.finish()
+
+    assert builder.sample_count == len(samples)
+    assert [level.samples_per_pixel for level in levels] == [256, 2048, 16384]
+    for level in levels:
+        np.testing.assert_allclose(level.peaks, reference_peaks(samples, level.samples_per_pixel), rtol=1e-5, atol=1e-6)
+
+
+def test_channels_are_mixed_down(samples):
+    builder = PeakBuilder([256])
+    builder.push(np.stack((samples, -samples), axis=1))
+
+    (level,) = builder.finish()
+
+    assert np.allclose(level.peaks, 0)
+
+
+def test_levels_have_to_be_multiples():
+    with pytest.raises(ValueError):
+        PeakBuilder([256, 1000])
+
+
+def test_empty_stream():
+    levels = PeakBuilder([256, 512]).finish()
+
+    assert [level.pixel_count for level in levels] == [0, 0]
+
+
+@pytest.mark.parametrize("bits", [8, 16])
+def test_quantized_blob(samples, bits):
+    builder = PeakBuilder([256])
+    builder.push(samples)
+    (level,) = builder.finish()
+
+    blob = level.to_bytes(bits)
+
+    assert len(blob) == peak_byte_range(0, level.pixel_count, bits)[1]
+    np.testing.assert_allclose(dequantize(blob, bits), level.peaks, atol=1.0 / (2 ** (bits - 1) - 1))
+
+    start, stop = peak_byte_range(10, 20, bits)
+    np.testing.assert_array_equal(dequantize(blob[start:stop], bits), dequantize(blob, bits)[10:20])
+
+
+def test_pixel_range():
+    assert pixel_range(1.0, 2.0, 44100, 256, 10000) == (172, 345)
+    assert pixel_range(-1.0, 1000.0, 44100, 256, 10000) == (0, 10000)
+    assert pixel_range(2.0, 1.0, 44100, 256, 10000) == (344, 344)
+
+
+def test_peaks_of_decoded_stream(samples):
+    data = io.BytesIO()
+    soundfile.write(data, np.stack((samples, samples), axis=1), 44100, format="WAV", subtype="FLOAT")
+    data.seek(0)
+
+    builder = PeakBuilder([256])
+    with soundfile.SoundFile(data) as sound_file:
+        for block in sound_file.blocks(blocksize=4096, dtype="float32", always_2d=True):
+            builder.push(block)
+
+    (level,) = builder.finish()
+    np.testing.assert_allclose(level.peaks, reference_peaks(samples, 256), rtol=1e-5, atol=1e-6)